@@ -0,0 +1,147 @@
+'''
+Accuracy of alternative numerical paths against the reference code.
+
+Usage
+-----
+    python benchmarks/accuracy.py [--arrays] [--tol 0.5] [-n 48]
+        [-a archive_dir] [-o report.json]
+
+Parcels of every type are lifted, and the profile interpolated at standard
+levels, with the reference implementation (list-based profiles and the
+default satlift tolerance) and with a candidate:
+
+    --arrays    profiles built with Profile.fromArrays (requires NumPy)
+    --tol X     satlift convergence tolerance X
+
+over a corpus of synthetic soundings (plus any archived SPC-format files).
+The maximum and mean absolute difference of every field is reported; the
+exit status is 1 if any field exceeds its declared tolerance (see
+sharppy.testing.PARCEL_TOLERANCES).
+'''
+import sys
+import json
+import optparse
+import common
+from sharppy import testing
+from sharppy.sharptab import profile, thermo, interp
+
+
+# Parcels compared: (name, DefineParcel flag, keyword arguments)
+PARCELS = [
+    ('sfc', 1, {}),
+    ('fcst', 2, {'pres': 100}),
+    ('mu', 3, {'pres': 400}),
+    ('ml', 4, {'pres': 100}),
+    ('user', 5, {'pres': 850}),
+]
+
+LEVELS = [925., 850., 700., 500., 300., 250.]
+
+
+def interp_fields(prof):
+    ''' Interpolated variables at standard levels, keyed e.g. temp850 '''
+    vals = {}
+    for p in LEVELS:
+        if p > prof.gSndg[prof.sfc][prof.pind]: continue
+        vals['hght%d' % p] = interp.hght(p, prof)
+        vals['temp%d' % p] = interp.temp(p, prof)
+        vals['dwpt%d' % p] = interp.dwpt(p, prof)
+        vals['vtmp%d' % p] = interp.vtmp(p, prof)
+    return vals
+
+
+def _arrays(func):
+    import numpy as np
+    def run(prof):
+        arrs = profile.Profile.fromArrays(np.array(prof.gSndg, np.float64),
+            uv=True, stn=prof.gStation, date=prof.gDate)
+        return func(arrs)
+    return run
+
+
+def _tolerance(func, tol):
+    def run(prof):
+        saved = thermo.SATLIFT_TOL
+        thermo.SATLIFT_TOL = tol
+        try:
+            return func(prof)
+        finally:
+            thermo.SATLIFT_TOL = saved
+    return run
+
+
+def run(candidate, profs, verbose=False):
+    '''
+    Compare the reference implementation with a candidate
+
+    Inputs
+    ------
+        candidate   (function)              Wraps a function taking a
+                                            profile so that it uses the
+                                            candidate implementation
+        profs       (list)                  (name, profile) pairs
+
+    Returns
+    -------
+        Dictionary of comparison name to AccuracyReport
+    '''
+    funcs = [('parcel.%s' % name, testing.parcel_fields(flag, **kwargs))
+        for name, flag, kwargs in PARCELS]
+    funcs.append(('interp', interp_fields))
+    reports = {}
+    for name, func in funcs:
+        report = testing.compare(func, candidate(func), profs)
+        reports[name] = report
+        if verbose:
+            status = 'ok'
+            if not report.ok(): status = 'FAIL'
+            sys.stderr.write('%s: %s\n%s\n\n' % (name, status,
+                report.report()))
+    return reports
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--arrays', action='store_true', default=False,
+        help='compare profiles built from NumPy arrays')
+    parser.add_option('--tol', type='float', default=None,
+        help='compare with this satlift tolerance')
+    parser.add_option('-n', '--count', type='int', default=48,
+        help='number of synthetic soundings [default: %default]')
+    parser.add_option('-a', '--archive', default=None,
+        help='directory of SPC-format soundings to include')
+    parser.add_option('-o', '--output', default=None,
+        help='file to write the JSON report to')
+    parser.add_option('-q', '--quiet', action='store_true', default=False)
+    opts, args = parser.parse_args(argv)
+    if not opts.arrays and opts.tol is None:
+        parser.error('nothing to compare: give --arrays and/or --tol')
+
+    def candidate(func):
+        if opts.tol is not None: func = _tolerance(func, opts.tol)
+        if opts.arrays: func = _arrays(func)
+        return func
+
+    profs = testing.corpus(opts.count, opts.archive)
+    reports = run(candidate, profs, not opts.quiet)
+    if opts.output:
+        doc = {'meta': common.metadata(), 'soundings': len(profs),
+            'reports': dict([(name, report.dump())
+                for name, report in reports.items()])}
+        f = open(opts.output, 'w')
+        try:
+            json.dump(doc, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+    failed = sorted([name for name, report in reports.items()
+        if not report.ok()])
+    if failed:
+        sys.stdout.write('exceeded tolerances: %s\n' % ', '.join(failed))
+        return 1
+    sys.stdout.write('all fields within tolerances (%d soundings)\n' %
+        len(profs))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
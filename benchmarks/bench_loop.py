@@ -0,0 +1,142 @@
+'''
+Frame rate of stepping through a loop of soundings.
+
+Usage
+-----
+    python benchmarks/bench_loop.py [-o results.json] [-l 100,1000]
+        [-f 48] [-r 3] [-t 0.5]
+
+A loop of hourly soundings (a SkewT with barbs and a parcel trace, and a
+hodograph) is drawn on headless canvases frame by frame, either
+
+    full        clearing the canvases and drawing every frame from scratch
+    layered     drawing the backgrounds once and replacing only the profile,
+                barb and parcel layers (SkewT.drawFrame, Hodo.drawFrame)
+
+and either only recording the drawing (draw) or also rasterizing every
+frame to PNG (png). Results, in frames per second, are written as JSON (to
+standard output by default).
+'''
+import sys
+import math
+import optparse
+import common
+import sharppy as sp
+from sharppy import headless
+from sharppy.sharptab import params
+from sharppy.testing import synthetic
+
+
+LEVELS = [100, 1000]
+FRAMES = 48
+
+
+def frames(levels, count=FRAMES):
+    ''' Hourly soundings with a diurnal cycle, and their surface parcels '''
+    loop = []
+    for i in range(count):
+        diurnal = math.sin(2 * math.pi * (i - 9) / 24.)
+        prof = synthetic(levels, sfct=25. + 6. * diurnal,
+            sfctd=16. + 2. * diurnal, capped=i % 12 < 4, seed=i,
+            date='%02d' % (i % 24))
+        loop.append((prof, params.DefineParcel(prof, 1)))
+    return loop
+
+
+def _full(loop, png):
+    skcanvas = headless.HeadlessCanvas()
+    hocanvas = headless.HeadlessCanvas()
+    for prof, lplvals in loop:
+        skcanvas.delete('all')
+        hocanvas.delete('all')
+        skewt = sp.SkewT(skcanvas)
+        skewt.drawSkewT()
+        skewt.drawProfile(prof)
+        skewt.drawBarbs(prof)
+        skewt.drawVirtualParcelTrace(lplvals)
+        skewt.drawParcelTrace(lplvals)
+        hodo = sp.Hodo(hocanvas, prof=loop[0][0])
+        hodo.drawHodo()
+        hodo.drawProfile(prof)
+        if png:
+            skcanvas.png()
+            hocanvas.png()
+
+
+def _layered(loop, png):
+    skcanvas = headless.HeadlessCanvas()
+    hocanvas = headless.HeadlessCanvas()
+    skewt = sp.SkewT(skcanvas)
+    hodo = sp.Hodo(hocanvas, prof=loop[0][0])
+    for prof, lplvals in loop:
+        skewt.drawFrame(prof, lplvals)
+        hodo.drawFrame(prof)
+        if png:
+            skcanvas.png()
+            hocanvas.png()
+
+
+MODES = [('full', _full), ('layered', _layered)]
+
+
+def run(levels=None, count=FRAMES, repeat=3, mintime=0.5, verbose=False):
+    '''
+    Run the loop benchmarks
+
+    Inputs
+    ------
+        levels      (list; optional)        Level counts of the soundings
+        count       (int; optional)         Number of frames in the loop
+        repeat      (int; optional)         Number of timed repeats
+        mintime     (float; optional)       Minimum duration of a repeat (s)
+
+    Returns
+    -------
+        List of result dictionaries; times are per frame
+    '''
+    if levels is None: levels = LEVELS
+    results = []
+    if verbose:
+        sys.stderr.write('%-24s %-14s %12s %12s\n' % ('benchmark', 'case',
+            'median (ms)', 'frames/s'))
+    for n in levels:
+        loop = frames(n, count)
+        for stage in ('draw', 'png'):
+            for mode, func in MODES:
+                res = common.measure(lambda: func(loop, stage == 'png'),
+                    repeat, mintime)
+                for key in ('min', 'median', 'mean'): res[key] /= count
+                res['samples'] = [x / count for x in res['samples']]
+                res['throughput'] *= count
+                res.update({'name': 'loop.%s.%s' % (mode, stage),
+                    'case': '%d-%d' % (count, n), 'levels': n,
+                    'frames': count})
+                results.append(res)
+                if verbose: common.report([res], header=False)
+    return results
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-o', '--output', default='-',
+        help='file to write JSON results to [default: stdout]')
+    parser.add_option('-l', '--levels', default='',
+        help='comma-separated level counts [default: %s]' %
+        ','.join([str(n) for n in LEVELS]))
+    parser.add_option('-f', '--frames', type='int', default=FRAMES,
+        help='frames in the loop [default: %default]')
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    parser.add_option('-t', '--mintime', type='float', default=0.5,
+        help='minimum duration of each repeat (s)')
+    parser.add_option('-q', '--quiet', action='store_true', default=False)
+    opts, args = parser.parse_args(argv)
+
+    levels = [int(n) for n in opts.levels.split(',') if n] or None
+    results = run(levels, opts.frames, opts.repeat, opts.mintime,
+        not opts.quiet)
+    common.write(results, opts.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+'''
+Memory use of profiles, parcels and gridded outputs.
+
+Usage
+-----
+    python benchmarks/bench_memory.py [-o results.json] [-s profiles]
+        [-l 100,1000,5000] [-n 200]
+
+Every measurement runs in a fresh interpreter, so that memory left behind
+by one does not hide the cost of the next. Two numbers are reported for
+each, relative to the interpreter with sharppy imported:
+
+    steady      resident memory still in use once the work is done and its
+                results are kept (e.g. the profiles built)
+    peak        growth of the maximum resident memory while working
+
+along with the steady memory per sounding and per level, for sizing
+workers and catching memory regressions. Results are written as JSON (to
+standard output by default).
+
+Scenarios
+---------
+    profiles    build soundings with the keyword constructor
+    arrays      build soundings with Profile.fromArrays (requires NumPy)
+    parcels     lift four parcels (surface, most unstable, mixed layer
+                and effective) for every sounding and keep them as Parcel
+    compact     ... and keep them as CompactParcel
+    parcelarray ... and keep them in a ParcelArray
+    grid        compute the parameter sheet for a grid of soundings and
+                keep each scalar field as a grid of doubles
+'''
+import os
+import gc
+import sys
+import json
+import array
+import resource
+import optparse
+import subprocess
+import common
+from sharppy.testing import synthetic
+from sharppy.sharptab import profile, params, sheet
+
+
+ORDER = ['profiles', 'arrays', 'parcels', 'compact', 'parcelarray', 'grid']
+LEVELS = [100, 1000, 5000]
+COUNT = 200
+
+
+def rss():
+    ''' Current resident set size (bytes), or None if not available '''
+    try:
+        f = open('/proc/self/statm')
+    except IOError:
+        return None
+    try:
+        return int(f.read().split()[1]) * resource.getpagesize()
+    finally:
+        f.close()
+
+
+def maxrss():
+    ''' Maximum resident set size so far (bytes) '''
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': return usage
+    return usage * 1024
+
+
+def _template(levels):
+    prof = synthetic(levels, missing=0.05)
+    cols = [[row[i] for row in prof.gSndg] for i in range(6)]
+    return prof, cols
+
+
+def _profiles(prof, cols, count):
+    pres, hght, temp, dwpt, u, v = cols
+    return [profile.Profile(pres=pres, hght=hght, temp=temp, dwpt=dwpt,
+        ucomp=u, vcomp=v) for i in range(count)]
+
+
+def _arrays(prof, cols, count):
+    import numpy as np
+    data = np.array(zip(*cols), np.float64)
+    return [profile.Profile.fromArrays(data.copy(), uv=True)
+        for i in range(count)]
+
+
+def _lift(prof, compact):
+    pcls = []
+    for flag, kwargs in ((1, {}), (3, {'pres': 400}), (4, {'pres': 100}),
+        (6, {})):
+        lplvals = params.DefineParcel(prof, flag, **kwargs)
+        pcls.append(params.parcelx(-1, -1, lplvals.pres, lplvals.temp,
+            lplvals.dwpt, prof, lplvals=lplvals, compact=compact))
+    return pcls
+
+
+def _parcels(prof, cols, count):
+    kept = []
+    for i in range(count): kept.extend(_lift(prof, False))
+    return kept
+
+
+def _compact(prof, cols, count):
+    kept = []
+    for i in range(count): kept.extend(_lift(prof, True))
+    return kept
+
+
+def _parcelarray(prof, cols, count):
+    kept = params.ParcelArray(count * 4)
+    for i in range(count):
+        for j, pcl in enumerate(_lift(prof, True)): kept[i*4+j] = pcl
+    return kept
+
+
+def _grid(prof, cols, count):
+    levels = prof.gNumLevels
+    grids = dict([(name, array.array('d')) for name in sheet.SCALARS])
+    for i in range(count):
+        results = sheet.compute(synthetic(levels, capped=i % 3 == 0, seed=i))
+        for name, value in sheet.scalars(results):
+            grids[name].append(value)
+    return grids
+
+
+# name -> (function, largest number of levels, fraction of the soundings).
+# Lifting parcels takes far longer than building profiles, so those
+# scenarios use fewer and smaller soundings.
+SCENARIOS = {
+    'profiles': (_profiles, None, 1),
+    'arrays': (_arrays, None, 1),
+    'parcels': (_parcels, 1000, 10),
+    'compact': (_compact, 1000, 10),
+    'parcelarray': (_parcelarray, 1000, 10),
+    'grid': (_grid, 1000, 10),
+}
+
+
+def child(scenario, levels, count):
+    ''' Run one measurement in this process; returns a result dictionary '''
+    func = SCENARIOS[scenario][0]
+    prof, cols = _template(levels)
+    gc.collect()
+    base, basemax = rss(), maxrss()
+    kept = func(prof, cols, count)
+    gc.collect()
+    now, peak = rss(), maxrss()
+    res = {'name': 'memory.%s' % scenario, 'case': '%d-%d' % (levels, count),
+        'levels': levels, 'count': count, 'peak': peak - basemax}
+    if base is not None:
+        steady = now - base
+        res.update({'steady': steady, 'per_sounding': steady / float(count),
+            'per_level': steady / float(count * levels)})
+    del kept
+    return res
+
+
+def run(scenarios=None, levels=None, count=COUNT, verbose=False):
+    '''
+    Run the memory benchmarks, each in a new interpreter
+
+    Inputs
+    ------
+        scenarios   (list; optional)        Names of scenarios to run
+        levels      (list; optional)        Level counts of the soundings
+        count       (int; optional)         Number of soundings
+
+    Returns
+    -------
+        List of result dictionaries
+    '''
+    if scenarios is None: scenarios = ORDER
+    if levels is None: levels = LEVELS
+    results = []
+    if verbose:
+        sys.stderr.write('%-20s %-12s %12s %12s %14s %12s\n' % ('benchmark',
+            'case', 'steady (kB)', 'peak (kB)', 'per sounding', 'per level'))
+    for scenario in scenarios:
+        func, maxlevels, fraction = SCENARIOS[scenario]
+        for n in levels:
+            if maxlevels and n > maxlevels: continue
+            num = max(count // fraction, 1)
+            cmd = [sys.executable, os.path.abspath(__file__), '--child',
+                scenario, str(n), str(num)]
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+            out = proc.communicate()[0]
+            if proc.returncode:
+                sys.stderr.write('%s with %d levels failed\n' % (scenario, n))
+                continue
+            res = json.loads(out)
+            results.append(res)
+            if verbose and 'steady' in res:
+                sys.stderr.write('%-20s %-12s %12.0f %12.0f %14.0f %12.1f\n' %
+                    (res['name'], res['case'], res['steady'] / 1024.,
+                    res['peak'] / 1024., res['per_sounding'],
+                    res['per_level']))
+    return results
+
+
+def main(argv=None):
+    if argv is None: argv = sys.argv[1:]
+    if argv and argv[0] == '--child':
+        res = child(argv[1], int(argv[2]), int(argv[3]))
+        sys.stdout.write(json.dumps(res))
+        return 0
+
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-o', '--output', default='-',
+        help='file to write JSON results to [default: stdout]')
+    parser.add_option('-s', '--scenarios', default='',
+        help='comma-separated scenarios [default: %s]' % ','.join(ORDER))
+    parser.add_option('-l', '--levels', default='',
+        help='comma-separated level counts [default: %s]' %
+        ','.join([str(n) for n in LEVELS]))
+    parser.add_option('-n', '--count', type='int', default=COUNT,
+        help='number of soundings [default: %default]')
+    parser.add_option('-q', '--quiet', action='store_true', default=False)
+    opts, args = parser.parse_args(argv)
+
+    scenarios = [name for name in opts.scenarios.split(',') if name] or None
+    levels = [int(n) for n in opts.levels.split(',') if n] or None
+    results = run(scenarios, levels, opts.count, not opts.quiet)
+    common.write(results, opts.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
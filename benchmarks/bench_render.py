@@ -0,0 +1,125 @@
+'''
+Throughput of headless chart rendering, in charts per second.
+
+Usage
+-----
+    python benchmarks/bench_render.py [-o results.json] [-l 100,1000]
+        [-p 1,4] [-n 32] [-r 3] [-t 0.5]
+
+For each sounding size, a SkewT and a Hodograph are drawn on a headless
+canvas and timed at each stage:
+
+    draw        record the drawing commands only
+    svg         ... and write them out as SVG
+    png         ... and rasterize them to PNG
+
+and a batch of charts is then rendered to PNG files with render_many in
+pools of different numbers of worker processes. Results are written as
+JSON (to standard output by default).
+'''
+import os
+import sys
+import time
+import shutil
+import optparse
+import tempfile
+import common
+from sharppy import headless
+from sharppy.testing import synthetic
+
+
+LEVELS = [100, 1000]
+PROCESSES = [1, 2, 4]
+STAGES = ['draw', 'svg', 'png']
+
+
+def _chart(prof, kind, stage):
+    def run():
+        canvas = headless.chart(prof, kind=kind)
+        if stage != 'draw': canvas.encode(stage)
+    return run
+
+
+def run(levels=None, processes=None, count=32, repeat=3, mintime=0.5,
+    verbose=False):
+    '''
+    Run the rendering benchmarks
+
+    Inputs
+    ------
+        levels      (list; optional)        Level counts of the soundings
+        processes   (list; optional)        Pool sizes for render_many
+        count       (int; optional)         Charts rendered by render_many
+        repeat      (int; optional)         Number of timed repeats
+        mintime     (float; optional)       Minimum duration of a repeat (s)
+
+    Returns
+    -------
+        List of result dictionaries
+    '''
+    if levels is None: levels = LEVELS
+    if processes is None: processes = PROCESSES
+    results = []
+    if verbose:
+        sys.stderr.write('%-24s %-14s %12s %12s\n' % ('benchmark', 'case',
+            'median (ms)', 'charts/s'))
+    for n in levels:
+        prof = synthetic(n)
+        for kind in ('skewt', 'hodo'):
+            for stage in STAGES:
+                res = common.measure(_chart(prof, kind, stage), repeat,
+                    mintime)
+                res.update({'name': 'render.%s.%s' % (kind, stage),
+                    'case': 'moist-%d' % n, 'levels': n})
+                results.append(res)
+                if verbose: common.report([res], header=False)
+
+        profs = [synthetic(n, capped=i % 3 == 0, seed=i) for i in range(count)]
+        tmpdir = tempfile.mkdtemp(prefix='sharppy-render-')
+        try:
+            jobs = [(p, os.path.join(tmpdir, '%d.png' % i))
+                for i, p in enumerate(profs)]
+            for procs in processes:
+                start = time.time()
+                headless.render_many(jobs, procs)
+                elapsed = time.time() - start
+                res = {'name': 'render_many.png', 'levels': n,
+                    'case': 'p%d-%d' % (procs, n), 'processes': procs,
+                    'number': count, 'repeat': 1, 'samples': [elapsed / count],
+                    'min': elapsed / count, 'median': elapsed / count,
+                    'mean': elapsed / count, 'throughput': count / elapsed}
+                results.append(res)
+                if verbose: common.report([res], header=False)
+        finally:
+            shutil.rmtree(tmpdir, True)
+    return results
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-o', '--output', default='-',
+        help='file to write JSON results to [default: stdout]')
+    parser.add_option('-l', '--levels', default='',
+        help='comma-separated level counts [default: %s]' %
+        ','.join([str(n) for n in LEVELS]))
+    parser.add_option('-p', '--processes', default='',
+        help='comma-separated pool sizes [default: %s]' %
+        ','.join([str(n) for n in PROCESSES]))
+    parser.add_option('-n', '--count', type='int', default=32,
+        help='charts rendered by each pool [default: %default]')
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    parser.add_option('-t', '--mintime', type='float', default=0.5,
+        help='minimum duration of each repeat (s)')
+    parser.add_option('-q', '--quiet', action='store_true', default=False)
+    opts, args = parser.parse_args(argv)
+
+    levels = [int(n) for n in opts.levels.split(',') if n] or None
+    processes = [int(n) for n in opts.processes.split(',') if n] or None
+    results = run(levels, processes, opts.count, opts.repeat, opts.mintime,
+        not opts.quiet)
+    common.write(results, opts.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+'''
+Speed and accuracy of satlift at different convergence tolerances.
+
+Usage
+-----
+    python benchmarks/bench_satlift.py [-o results.json] [-r 5] [-t 0.2]
+
+For each tolerance, thermo.wetlift is timed over a grid of parcels and its
+error measured against a tightly converged reference (tolerance 1e-6), along
+with the mean number of satlift iterations. The most unstable parcel of a
+set of synthetic soundings is lifted as well, to show the effect on CAPE.
+Results are written as JSON (to standard output by default).
+'''
+import sys
+import optparse
+import common
+from sharppy.sharptab import thermo, params, instrument
+
+
+TOLERANCES = [0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0]
+REFERENCE = 1e-6
+
+# Parcels (p, t, p2) lifted by wetlift: moist adiabats from the surface to
+# the upper troposphere, including very cold and very warm ones
+GRID = [(float(p), float(t), float(p2)) for p in (1000, 850, 700)
+    for t in range(-40, 36, 5) for p2 in range(p - 50, 99, -50)]
+
+
+def _lift(tol):
+    return [thermo.wetlift(p, t, p2, tol) for p, t, p2 in GRID]
+
+
+def _mucape(prof):
+    lplvals = params.DefineParcel(prof, 3, pres=400)
+    return params.parcelx(-1, -1, lplvals.pres, lplvals.temp, lplvals.dwpt,
+        prof, lplvals=lplvals).bplus
+
+
+def run(tolerances=None, repeat=5, mintime=0.2, verbose=False):
+    '''
+    Run the tolerance benchmark
+
+    Inputs
+    ------
+        tolerances  (list; optional)        satlift tolerances (C)
+        repeat      (int; optional)         Number of timed repeats
+        mintime     (float; optional)       Minimum duration of a repeat (s)
+
+    Returns
+    -------
+        List of result dictionaries
+    '''
+    if tolerances is None: tolerances = TOLERANCES
+    reference = _lift(REFERENCE)
+    cases = common.cases([100], ['moist', 'capped'])
+    saved = thermo.SATLIFT_TOL
+    thermo.SATLIFT_TOL = REFERENCE
+    try:
+        refcape = [_mucape(prof) for case, n, prof in cases]
+    finally:
+        thermo.SATLIFT_TOL = saved
+
+    results = []
+    if verbose:
+        sys.stderr.write('%10s %12s %10s %12s %12s %12s\n' % ('tolerance',
+            'per lift (us)', 'iter/lift', 'max err (C)', 'mean err (C)',
+            'max dCAPE'))
+    for tol in tolerances:
+        res = common.measure(lambda: _lift(tol), repeat, mintime)
+        with instrument.record() as rec:
+            temps = _lift(tol)
+        errors = [abs(a - b) for a, b in zip(temps, reference)]
+
+        thermo.SATLIFT_TOL = tol
+        try:
+            capes = [_mucape(prof) for case, n, prof in cases]
+        finally:
+            thermo.SATLIFT_TOL = saved
+        dcape = max([abs(a - b) for a, b in zip(capes, refcape)])
+
+        for key in ('samples', 'min', 'median', 'mean'):
+            if key == 'samples': res[key] = [x / len(GRID) for x in res[key]]
+            else: res[key] /= len(GRID)
+        res['throughput'] *= len(GRID)
+        res.update({'name': 'thermo.wetlift', 'case': 'tol=%g' % tol,
+            'levels': 0, 'tolerance': tol,
+            'iterations': rec.iterations['thermo.satlift'] /
+                float(rec.calls['thermo.satlift']),
+            'max_error': max(errors), 'mean_error': sum(errors) / len(errors),
+            'max_cape_error': dcape})
+        results.append(res)
+        if verbose:
+            sys.stderr.write('%10g %12.2f %10.2f %12.5f %12.5f %12.3f\n' % (
+                tol, res['median'] * 1e6, res['iterations'],
+                res['max_error'], res['mean_error'], dcape))
+    return results
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-o', '--output', default='-',
+        help='file to write JSON results to [default: stdout]')
+    parser.add_option('-r', '--repeat', type='int', default=5)
+    parser.add_option('-t', '--mintime', type='float', default=0.2,
+        help='minimum duration of each repeat (s)')
+    parser.add_option('-q', '--quiet', action='store_true', default=False)
+    opts, args = parser.parse_args(argv)
+    results = run(None, opts.repeat, opts.mintime, not opts.quiet)
+    common.write(results, opts.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
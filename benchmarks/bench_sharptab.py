@@ -0,0 +1,154 @@
+'''
+Benchmarks of the sharptab hot paths on synthetic soundings.
+
+Usage
+-----
+    python benchmarks/bench_sharptab.py [-o results.json] [-l 20,100]
+        [-k moist,dry] [-b parcelx] [-r 5] [-t 0.2]
+
+Results are written as JSON (to standard output by default) with the
+per-call latency and throughput of every benchmark for every sounding.
+'''
+import sys
+import optparse
+import common
+from sharppy.sharptab import interp, thermo, params, winds, indices
+
+
+def _interp(prof):
+    p = interp.pres(interp.msl(3000., prof), prof)
+    def run():
+        interp.pres(interp.msl(3000., prof), prof)
+        interp.temp(p, prof)
+        interp.components(p, prof)
+    return run
+
+
+def _wetlift(prof):
+    return lambda: thermo.wetlift(850., 16., 200.)
+
+
+def _parcelx(flag, **kwargs):
+    def setup(prof):
+        lplvals = params.DefineParcel(prof, flag, **kwargs)
+        return lambda: params.parcelx(-1, -1, lplvals.pres, lplvals.temp,
+            lplvals.dwpt, prof, lplvals=lplvals)
+    return setup
+
+
+def _mupcl(prof):
+    lplvals = params.DefineParcel(prof, 3, pres=400)
+    return params.parcelx(-1, -1, lplvals.pres, lplvals.temp, lplvals.dwpt,
+        prof, lplvals=lplvals)
+
+
+def _effective_inflow_layer(prof):
+    mupcl = _mupcl(prof)
+    return lambda: params.effective_inflow_layer(100, -250, prof,
+        mupcl=mupcl)
+
+
+def _helicity(prof):
+    return lambda: winds.helicity(0, 3000., prof, 10., 10.)
+
+
+def _bunkers(prof):
+    mupcl = _mupcl(prof)
+    pbot = params.effective_inflow_layer(100, -250, prof, mupcl=mupcl)[0]
+    return lambda: params.bunkers_storm_motion(prof, pbot=pbot, mupcl=mupcl)
+
+
+def _scp(prof):
+    mupcl = _mupcl(prof)
+    lplvals = params.DefineParcel(prof, 6, mupcl=mupcl)
+    epcl = params.parcelx(-1, -1, lplvals.pres, lplvals.temp, lplvals.dwpt,
+        prof, lplvals=lplvals)
+    pbot = lplvals.pbot
+    stu, stv = params.bunkers_storm_motion(prof, pbot=pbot, mupcl=mupcl)[:2]
+    return lambda: indices.scp(prof, mupcl=mupcl, epcl=epcl, stu=stu,
+        stv=stv)
+
+
+# name -> (setup, depends upon the sounding). A setup function is given a
+# profile and returns the function to time; work that is timed by another
+# benchmark (e.g. lifting the most unstable parcel) is done in the setup.
+BENCHMARKS = [
+    ('interp', _interp, True),
+    ('thermo.wetlift', _wetlift, False),
+    ('parcelx.sfc', _parcelx(1), True),
+    ('parcelx.fcst', _parcelx(2, pres=100), True),
+    ('parcelx.mu', _parcelx(3, pres=400), True),
+    ('parcelx.ml', _parcelx(4, pres=100), True),
+    ('parcelx.user', _parcelx(5, pres=850), True),
+    ('parcelx.effective', _parcelx(6), True),
+    ('effective_inflow_layer', _effective_inflow_layer, True),
+    ('winds.helicity', _helicity, True),
+    ('bunkers_storm_motion', _bunkers, True),
+    ('indices.scp', _scp, True),
+]
+
+
+def run(names=None, levels=None, kinds=None, repeat=5, mintime=0.2,
+    verbose=False):
+    '''
+    Run the benchmarks
+
+    Inputs
+    ------
+        names       (list; optional)        Substrings of benchmark names
+                                            to run [default: all]
+        levels      (list; optional)        Level counts of the soundings
+        kinds       (list; optional)        Kinds of soundings (see
+                                            common.KINDS)
+        repeat      (int; optional)         Number of timed repeats
+        mintime     (float; optional)       Minimum duration of a repeat (s)
+
+    Returns
+    -------
+        List of result dictionaries
+    '''
+    benches = [bench for bench in BENCHMARKS if not names or
+        [name for name in names if name in bench[0]]]
+    cases = common.cases(levels, kinds)
+    results = []
+    if verbose: common.report([])
+    for name, setup, perprofile in benches:
+        if perprofile: todo = cases
+        else: todo = [('none', 0, cases[0][2])]
+        for case, nlevels, prof in todo:
+            res = common.measure(setup(prof), repeat, mintime)
+            res.update({'name': name, 'case': case, 'levels': nlevels})
+            results.append(res)
+            if verbose: common.report([res], header=False)
+    return results
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-o', '--output', default='-',
+        help='file to write JSON results to [default: stdout]')
+    parser.add_option('-b', '--bench', default='',
+        help='comma-separated substrings of benchmark names to run')
+    parser.add_option('-l', '--levels', default='',
+        help='comma-separated level counts [default: %s]' %
+        ','.join([str(n) for n in common.LEVELS]))
+    parser.add_option('-k', '--kinds', default='',
+        help='comma-separated sounding kinds [default: %s]' %
+        ','.join(sorted(common.KINDS)))
+    parser.add_option('-r', '--repeat', type='int', default=5)
+    parser.add_option('-t', '--mintime', type='float', default=0.2,
+        help='minimum duration of each repeat (s)')
+    parser.add_option('-q', '--quiet', action='store_true', default=False)
+    opts, args = parser.parse_args(argv)
+
+    names = [name for name in opts.bench.split(',') if name]
+    levels = [int(n) for n in opts.levels.split(',') if n] or None
+    kinds = [kind for kind in opts.kinds.split(',') if kind] or None
+    results = run(names, levels, kinds, opts.repeat, opts.mintime,
+        not opts.quiet)
+    common.write(results, opts.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
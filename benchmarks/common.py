@@ -0,0 +1,114 @@
+''' Shared Benchmark Utilities '''
+import os
+import sys
+import time
+import json
+import platform
+
+# Run against the checkout containing this directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir))
+
+import sharppy
+from sharppy.testing import synthetic
+
+
+# Level counts and sounding types the benchmarks are run over
+LEVELS = [20, 100, 500, 1000, 5000]
+KINDS = {
+    'moist': {'moist': True},
+    'dry': {'moist': False},
+    'capped': {'moist': True, 'capped': True},
+    'missing': {'moist': True, 'missing': 0.1},
+}
+
+
+def cases(levels=None, kinds=None):
+    '''
+    Returns the synthetic soundings to benchmark, as a list of
+    (case name, number of levels, profile) tuples
+    '''
+    if levels is None: levels = LEVELS
+    if kinds is None: kinds = sorted(KINDS)
+    return [('%s-%d' % (kind, n), n, synthetic(n, **KINDS[kind]))
+        for n in levels for kind in kinds]
+
+
+def measure(func, repeat=5, mintime=0.2):
+    '''
+    Time a function. The number of calls per repeat is chosen so that each
+    repeat lasts at least mintime seconds.
+
+    Inputs
+    ------
+        func        (callable)              Function taking no arguments
+        repeat      (int; optional)         Number of timed repeats
+        mintime     (float; optional)       Minimum duration of a repeat (s)
+
+    Returns
+    -------
+        Dictionary of statistics; times are per call (s)
+    '''
+    number = 1
+    while True:
+        start = time.time()
+        for i in xrange(number): func()
+        elapsed = time.time() - start
+        if elapsed >= mintime or number >= 1000000: break
+        if elapsed <= 0: number *= 10
+        else: number = max(number + 1, int(number * mintime / elapsed * 1.2))
+
+    samples = [elapsed / number]
+    for i in xrange(repeat - 1):
+        start = time.time()
+        for j in xrange(number): func()
+        samples.append((time.time() - start) / number)
+
+    ordered = sorted(samples)
+    mid = len(ordered) // 2
+    if len(ordered) % 2: median = ordered[mid]
+    else: median = (ordered[mid-1] + ordered[mid]) / 2.
+    return {'number': number, 'repeat': repeat, 'samples': samples,
+        'min': ordered[0], 'median': median,
+        'mean': sum(samples) / len(samples), 'throughput': 1. / median}
+
+
+def metadata():
+    ''' Description of the machine and code that produced a set of results '''
+    return {'sharppy': sharppy.__version__, 'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(), 'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def write(results, fname=None):
+    ''' Write results as JSON to a file (or standard output) '''
+    doc = {'meta': metadata(), 'results': results}
+    if fname is None or fname == '-':
+        json.dump(doc, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        f = open(fname, 'w')
+        try:
+            json.dump(doc, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+
+
+def read(fname):
+    ''' Read results written by write() '''
+    f = open(fname)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def report(results, stream=sys.stderr, header=True):
+    ''' Print a human readable summary of results '''
+    if header:
+        stream.write('%-24s %-14s %12s %12s\n' % ('benchmark', 'case',
+            'median (ms)', 'calls/s'))
+    for res in results:
+        stream.write('%-24s %-14s %12.4f %12.1f\n' % (res['name'], res['case'],
+            res['median'] * 1000., res['throughput']))
@@ -0,0 +1,177 @@
+'''
+Performance regression gate for the sharptab benchmarks.
+
+Usage
+-----
+    python benchmarks/regress.py save baseline.json
+    python benchmarks/regress.py check baseline.json [-x 0.10]
+    python benchmarks/regress.py compare baseline.json results.json
+
+save runs the regression benchmarks and stores the timings as a baseline.
+check runs them again and compares with the baseline; compare compares two
+stored result files. The exit status is 1 if any benchmark slowed down by
+more than the threshold (10% by default).
+
+A benchmark only counts as slower (or faster) when the difference between
+the medians exceeds the threshold *and* the confidence intervals of the
+two medians do not overlap, so that noisy timings do not fail the gate.
+'''
+import sys
+import optparse
+import common
+import bench_sharptab
+
+
+# Benchmarks and soundings guarded by the gate
+NAMES = ['parcelx', 'effective_inflow_layer', 'winds.helicity',
+    'thermo.wetlift']
+LEVELS = [20, 100, 500]
+KINDS = ['moist', 'capped', 'missing']
+
+
+def median(samples):
+    ordered = sorted(samples)
+    mid = len(ordered) // 2
+    if len(ordered) % 2: return ordered[mid]
+    return (ordered[mid-1] + ordered[mid]) / 2.
+
+
+def median_ci(samples, level=0.95):
+    '''
+    Distribution-free confidence interval of the median of samples, from
+    the order statistics. With fewer than 6 samples the interval is the
+    full range of the samples.
+
+    Inputs
+    ------
+        samples     (list)                  Timings
+        level       (float; optional)       Confidence level
+
+    Returns
+    -------
+        lower       (float)                 Lower bound
+        upper       (float)                 Upper bound
+    '''
+    ordered = sorted(samples)
+    n = len(ordered)
+    # Largest k such that P(X < k) <= (1 - level) / 2 for X ~ B(n, 1/2)
+    alpha = (1. - level) / 2.
+    k = 0
+    cdf = 0.
+    term = 0.5**n
+    while k < n // 2:
+        if cdf + term > alpha: break
+        cdf += term
+        term *= (n - k) / (k + 1.)
+        k += 1
+    k = max(k - 1, 0)
+    return ordered[k], ordered[n-k-1]
+
+
+def compare(baseline, current, threshold=0.1, level=0.95):
+    '''
+    Compare two sets of benchmark results
+
+    Inputs
+    ------
+        baseline    (list)                  Baseline results
+        current     (list)                  Current results
+        threshold   (float; optional)       Relative change in the median
+                                            treated as significant
+        level       (float; optional)       Confidence level of intervals
+
+    Returns
+    -------
+        List of rows (name, case, baseline median, current median, ratio,
+        status) where status is 'slower', 'faster', 'same' or 'missing'
+    '''
+    current = dict([((res['name'], res['case']), res) for res in current])
+    rows = []
+    for base in baseline:
+        key = (base['name'], base['case'])
+        res = current.get(key)
+        if res is None:
+            rows.append(key + (median(base['samples']), None, None,
+                'missing'))
+            continue
+        bmed, cmed = median(base['samples']), median(res['samples'])
+        blo, bhi = median_ci(base['samples'], level)
+        clo, chi = median_ci(res['samples'], level)
+        ratio = cmed / bmed
+        if ratio > 1. + threshold and clo > bhi: status = 'slower'
+        elif ratio < 1. / (1. + threshold) and chi < blo: status = 'faster'
+        else: status = 'same'
+        rows.append(key + (bmed, cmed, ratio, status))
+    return rows
+
+
+def table(rows, stream=sys.stdout):
+    ''' Print the rows of compare() as a table '''
+    stream.write('%-24s %-14s %12s %12s %8s  %s\n' % ('benchmark', 'case',
+        'base (ms)', 'now (ms)', 'change', 'status'))
+    for name, case, bmed, cmed, ratio, status in rows:
+        if cmed is None:
+            stream.write('%-24s %-14s %12.4f %12s %8s  %s\n' % (name, case,
+                bmed * 1000., '-', '-', status))
+            continue
+        if status == 'slower': status = 'SLOWER'
+        stream.write('%-24s %-14s %12.4f %12.4f %+7.1f%%  %s\n' % (name, case,
+            bmed * 1000., cmed * 1000., (ratio - 1.) * 100., status))
+
+
+def rerun(baseline, repeat, mintime):
+    ''' Run the benchmarks and soundings found in a baseline again '''
+    names = sorted(set([res['name'] for res in baseline]))
+    levels = sorted(set([res['levels'] for res in baseline if res['levels']]))
+    kinds = sorted(set([res['case'].rsplit('-', 1)[0] for res in baseline
+        if res['levels']]))
+    results = bench_sharptab.run(names, levels, kinds, repeat, mintime)
+    names = set(names)
+    return [res for res in results if res['name'] in names]
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog save|check|compare baseline.json [results.json]')
+    parser.add_option('-x', '--threshold', type='float', default=0.1,
+        help='relative slowdown that fails the gate [default: %default]')
+    parser.add_option('-c', '--confidence', type='float', default=0.95,
+        help='confidence level of the median intervals [default: %default]')
+    parser.add_option('-r', '--repeat', type='int', default=9,
+        help='timed repeats per benchmark [default: %default]')
+    parser.add_option('-t', '--mintime', type='float', default=0.1,
+        help='minimum duration of each repeat (s) [default: %default]')
+    parser.add_option('-o', '--output', default=None,
+        help='also write the results of check to this file')
+    opts, args = parser.parse_args(argv)
+    if len(args) < 2 or args[0] not in ('save', 'check', 'compare') or \
+       (args[0] == 'compare' and len(args) < 3):
+        parser.error('expected save, check or compare and file names')
+    command = args[0]
+
+    if command == 'save':
+        results = bench_sharptab.run(NAMES, LEVELS, KINDS, opts.repeat,
+            opts.mintime)
+        common.write(results, args[1])
+        common.report(results)
+        return 0
+
+    baseline = common.read(args[1])['results']
+    if command == 'check':
+        current = rerun(baseline, opts.repeat, opts.mintime)
+        if opts.output: common.write(current, opts.output)
+    else:
+        current = common.read(args[2])['results']
+
+    rows = compare(baseline, current, opts.threshold, opts.confidence)
+    table(rows)
+    slower = [row for row in rows if row[-1] == 'slower']
+    if slower:
+        sys.stdout.write('\n%d of %d benchmarks slowed down by more than '
+            '%.0f%%\n' % (len(slower), len(rows), opts.threshold * 100.))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
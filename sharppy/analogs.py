@@ -0,0 +1,317 @@
+''' Analog Sounding Search '''
+import os
+import sys
+import math
+import json
+import array
+import heapq
+import struct
+from sharppy import store
+from sharppy.sharptab import sheet
+from sharppy.sharptab.constants import *
+
+
+__all__ = ['AnalogIndex', 'FEATURES']
+
+
+# Sheet fields compared by default
+FEATURES = ['mucape', 'mllcl', 'shr1km', 'shr6km', 'srh1km', 'srh3km',
+    'lr03km', 'lr700_500', 'pwat']
+
+# File layout: header (magic, version, length of the JSON description),
+# the description, then the normalized points and the tree node arrays,
+# and the field values of the soundings
+MAGIC = 'SHANALG\0'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+_ARRAYS = [('points', 'd'), ('dims', 'i'), ('splits', 'd'), ('lefts', 'i'),
+    ('rights', 'i'), ('starts', 'i'), ('ends', 'i')]
+
+
+class AnalogIndex(object):
+    '''
+    Finds the historical soundings most similar to a given one.
+
+    Each sounding is a vector of sheet fields (FEATURES by default),
+    normalized by the mean and standard deviation of each field over the
+    archive. The vectors are kept in a k-d tree: a balanced binary tree
+    splitting the soundings at the median of the field with the largest
+    spread, down to buckets of leafsize soundings. A query descends to the
+    bucket of the target and visits other buckets only while they may hold
+    a sounding closer than the k nearest found so far, so it examines a
+    small fraction of the archive.
+
+    Distances are weighted Euclidean distances between the normalized
+    vectors, sqrt(sum(w * (x - y) ** 2)); the weights can be given for the
+    index and overridden per query. Soundings with a missing field are not
+    indexed.
+
+    features : list
+        Sheet fields to compare [default: FEATURES]
+    weights : dict
+        Field name to weight (default 1)
+    leafsize : int
+        Largest number of soundings in a bucket of the tree
+
+    Usage
+    -----
+        index = AnalogIndex()
+        for prof in archive: index.add_profile(prof)
+        index.save('analogs.idx')
+        for analog in AnalogIndex.load('analogs.idx').query(prof, k=5):
+            print analog['station'], analog['date'], analog['distance']
+    '''
+    def __init__(self, features=None, weights=None, leafsize=16):
+        self.features = list(features or FEATURES)
+        self.weights = self.__weights(weights or {})
+        self.leafsize = leafsize
+        self.meta = []
+        self.values = array.array('d')
+        self.skipped = 0
+        self.mean = None
+        self.scale = None
+        self.tree = None
+
+
+    def __len__(self):
+        return len(self.meta)
+
+
+    def __weights(self, weights):
+        return [float(weights.get(field, 1.)) for field in self.features]
+
+
+    def add(self, values, **meta):
+        '''
+        Add a sounding to the archive
+
+        Inputs
+        ------
+            values      (dict)              Field name to value, e.g. the
+                                            output of sheet.compute()
+
+        Other keywords (e.g. station, date) are returned with the sounding
+        when it is found as an analog
+
+        Returns
+        -------
+            False if the sounding has missing fields and was skipped
+        '''
+        row = [values.get(field, RMISSD) for field in self.features]
+        for value in row:
+            if not QC(value):
+                self.skipped += 1
+                return False
+        self.values.extend(row)
+        self.meta.append(meta)
+        self.tree = None
+        return True
+
+
+    def add_profile(self, prof, results=None, **meta):
+        '''
+        Add a profile, computing its parameter sheet unless it is given.
+        The station and date are kept with the sounding, together with any
+        other keywords.
+        '''
+        if results is None: results = sheet.compute(prof, self.features)
+        info = {'station': prof.gStation.strip(), 'date': prof.gDate.strip()}
+        info.update(meta)
+        return self.add(results, **info)
+
+
+    def add_store(self, db, **kwargs):
+        '''
+        Add the soundings of a store.ParameterStore; keywords (e.g. start,
+        end, stations) select the soundings as for ParameterStore.select()
+        '''
+        metacols = [name for name, type in store.META]
+        for row in db.select(columns=metacols + self.features, **kwargs):
+            values = dict([(field, row[field]) for field in self.features
+                if row[field] is not None])
+            self.add(values, **dict([(name, row[name]) for name in metacols
+                if row[name] is not None]))
+
+
+    def build(self):
+        ''' Normalize the vectors and build the tree '''
+        dim = len(self.features)
+        n = len(self.meta)
+        self.mean = []
+        self.scale = []
+        for j in range(dim):
+            col = self.values[j::dim]
+            mean = math.fsum(col) / max(n, 1)
+            var = math.fsum([(x - mean) ** 2 for x in col]) / max(n, 1)
+            self.mean.append(mean)
+            self.scale.append(math.sqrt(var) or 1.)
+        points = array.array('d', [(x - self.mean[i % dim]) /
+            self.scale[i % dim] for i, x in enumerate(self.values)])
+
+        tree = dict([(name, array.array(code)) for name, code in _ARRAYS])
+        order = range(n)
+
+        def split(lo, hi):
+            node = len(tree['dims'])
+            for name, code in _ARRAYS[1:]: tree[name].append(0)
+            tree['starts'][node] = lo
+            tree['ends'][node] = hi
+            if hi - lo <= self.leafsize:
+                tree['dims'][node] = -1
+                return node
+            spreads = []
+            for j in range(dim):
+                col = [points[i*dim+j] for i in order[lo:hi]]
+                spreads.append(max(col) - min(col))
+            d = spreads.index(max(spreads))
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i*dim+d])
+            mid = (lo + hi) // 2
+            tree['dims'][node] = d
+            tree['splits'][node] = points[order[mid]*dim+d]
+            tree['lefts'][node] = split(lo, mid)
+            tree['rights'][node] = split(mid, hi)
+            return node
+
+        if n: split(0, n)
+        # Store the soundings in tree order, so buckets are contiguous
+        values = self.values
+        self.values = array.array('d')
+        for i in order:
+            tree['points'].extend(points[i*dim:(i+1)*dim])
+            self.values.extend(values[i*dim:(i+1)*dim])
+        self.meta = [self.meta[i] for i in order]
+        self.tree = tree
+
+
+    def __arrays(self):
+        return [(code, self.tree[name]) for name, code in _ARRAYS] + \
+            [('d', self.values)]
+
+
+    def query(self, target, k=10, weights=None):
+        '''
+        Returns the k soundings nearest to a target sounding
+
+        Inputs
+        ------
+            target      (dict or profile)   Field name to value, or a
+                                            Profile Object
+            k           (int; optional)     Number of analogs
+            weights     (dict; optional)    Field name to weight, replacing
+                                            the weights of the index
+
+        Fields missing in the target are ignored.
+
+        Returns
+        -------
+            List of dictionaries of the keywords the soundings were added
+            with, their field values and their 'distance' from the target,
+            nearest first
+        '''
+        if k <= 0: return []
+        if self.tree is None: self.build()
+        if not isinstance(target, dict):
+            target = sheet.compute(target, self.features)
+        dim = len(self.features)
+        w = self.weights if weights is None else self.__weights(weights)
+        q = []
+        for j, field in enumerate(self.features):
+            value = target.get(field, RMISSD)
+            if QC(value):
+                q.append((value - self.mean[j]) / self.scale[j])
+            else:
+                q.append(0.)
+                w = w[:j] + [0.] + w[j+1:]
+
+        tree = self.tree
+        points = tree['points']
+        dims = tree['dims']
+        splits = tree['splits']
+        best = []           # max-heap of (-distance squared, index)
+        # Nodes to visit, with a lower bound of the distance to any of
+        # their soundings and the offsets along each field making it up
+        stack = [(0, 0., (0.,) * dim)] if len(self.meta) else []
+        while stack:
+            node, bound, offsets = stack.pop()
+            if len(best) == k and bound >= -best[0][0]: continue
+            d = dims[node]
+            if d < 0:
+                for i in xrange(tree['starts'][node], tree['ends'][node]):
+                    base = i * dim
+                    dist = 0.
+                    for j in xrange(dim):
+                        diff = points[base+j] - q[j]
+                        dist += w[j] * diff * diff
+                    if len(best) < k: heapq.heappush(best, (-dist, i))
+                    elif dist < -best[0][0]:
+                        heapq.heapreplace(best, (-dist, i))
+                continue
+            diff = q[d] - splits[node]
+            far = bound + w[d] * (diff * diff - offsets[d] * offsets[d])
+            faroffsets = offsets[:d] + (diff,) + offsets[d+1:]
+            if diff < 0:
+                stack.append((tree['rights'][node], far, faroffsets))
+                stack.append((tree['lefts'][node], bound, offsets))
+            else:
+                stack.append((tree['lefts'][node], far, faroffsets))
+                stack.append((tree['rights'][node], bound, offsets))
+
+        analogs = []
+        for dist, i in sorted(best, reverse=True):
+            analog = dict(self.meta[i])
+            analog.update(zip(self.features, self.values[i*dim:(i+1)*dim]))
+            analog['distance'] = math.sqrt(-dist)
+            analogs.append(analog)
+        return analogs
+
+
+    def save(self, fname):
+        ''' Write the index (building it if needed) to a file '''
+        if self.tree is None: self.build()
+        meta = json.dumps({'features': self.features,
+            'weights': self.weights, 'leafsize': self.leafsize,
+            'mean': self.mean, 'scale': self.scale, 'skipped': self.skipped,
+            'meta': self.meta, 'sizes': [len(values)
+            for code, values in self.__arrays()]})
+        tmpname = fname + '.tmp'
+        f = open(tmpname, 'wb')
+        try:
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta)))
+            f.write(meta)
+            for code, values in self.__arrays():
+                if sys.byteorder != 'little':
+                    values = array.array(code, values)
+                    values.byteswap()
+                values.tofile(f)
+        finally:
+            f.close()
+        os.rename(tmpname, fname)
+
+
+    @classmethod
+    def load(cls, fname):
+        ''' Read an index written by save() '''
+        f = open(fname, 'rb')
+        try:
+            magic, version, length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('%s is not an analog index' % fname)
+            meta = json.loads(f.read(length))
+            arrays = []
+            for (name, code), size in zip(_ARRAYS + [('values', 'd')],
+                meta['sizes']):
+                values = array.array(code)
+                values.fromfile(f, size)
+                if sys.byteorder != 'little': values.byteswap()
+                arrays.append((name, values))
+        finally:
+            f.close()
+        index = cls(meta['features'], None, meta['leafsize'])
+        index.weights = meta['weights']
+        index.mean = meta['mean']
+        index.scale = meta['scale']
+        index.skipped = meta['skipped']
+        index.meta = meta['meta']
+        index.tree = dict(arrays[:-1])
+        index.values = arrays[-1][1]
+        return index
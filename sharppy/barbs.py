@@ -2,7 +2,16 @@
 import sharppy.sharptab as tab
 
 
-__all__ = ['Barb']
+__all__ = ['Barb', 'draw_barbs', 'DIR_RESOLUTION']
+
+
+# Barb directions are rounded to this many degrees, so that barbs of
+# nearly the same direction share a glyph
+DIR_RESOLUTION = 1.
+
+# Barb geometry relative to the barb position: glyph key -> geometry
+_GLYPHS = {}
+_MAXGLYPHS = 8192
 
 
 class Barb(object):
@@ -19,63 +28,145 @@ class Barb(object):
         self.rotate = kwargs.get('rotate', 0)           # Rotation from north
         self.spacing = 9        # Num of elements that will fit on a backbone
 
-        # unit vector
-        self.iuu, self.ivv = tab.vector.vec2comp(self.dir + self.rotate, self.size)
-
-        # Start with station circle
-        self.gCanvas.create_oval(x-self.size/3, y-self.size/3, x+self.size/3, y+self.size/3,
-            outline=self.color, width=self.width)
-
-        # Backbone line
-        x1 = self.centerx - (self.iuu)
-        y1 = self.centery + (self.ivv)
-        x2 = self.centerx - (self.iuu * 10)
-        y2 = self.centery + (self.ivv * 10)
-        self.gCanvas.create_line(x1, y1, x2, y2, fill=self.color, width=self.width)
-
-        # Variable setup
-        sped = spd
-        dx = self.iuu * self.size
-        dy = self.ivv * self.size
-        spcx = -(x2-x1) / self.spacing
-        spcy = (y2-y1) / self.spacing
-        x1 = x2
-        y1 = y2
-
-        # Draw wind flags (increments of 50)
-        flag=0
-        fullbarb=0
-        while (sped > 47):
-            flag=1
-            x2 = x1 - dy - 2
-            y2 = y1 - dx - 2
-            x3 = x1 + spcx
-            y3 = y1 - spcy
-            points = [x1, y1, x2, y2, x3, y3]
-            self.gCanvas.create_polygon(points, fill=self.color)
-            sped = sped - 50
-            x1 = x3
-            y1 = y3
-
-        # Single barbs (increments of 10)
-        while (sped > 7):
-            fullbarb=1
-            if flag == 0:
-                x1 = x1 - spcx
-                y1 = y1 + spcy
-                flag = 1
-            x2 = x1 - dy
-            y2 = y1 - dx
-            x1 = x1 + spcx
-            y1 = y1 - spcy
-            self.gCanvas.create_line(x1, y1, x2, y2, fill=self.color, width=self.width)
-            sped = sped - 10
-
-        # Half barb (if needed)
-        if (sped > 2):
-            if fullbarb == 1:
-                x1 += spcx
-                y1 -= spcy
-            x2 = x1 - ((dy)/2) - (spcx/2)
-            y2 = y1 - ((dx)/2) + (spcy/2)
-            self.gCanvas.create_line(x1, y1, x2, y2, fill=self.color, width=self.width)
+        _draw(self.gCanvas, x, y, glyph(self.dir + self.rotate, spd,
+            self.size, self.spacing), self.color, self.width)
+
+
+def draw_barbs(canvas, xs, ys, dirs, spds, **kwargs):
+    '''
+    Draws many wind barbs at once, e.g. a column of barbs or a plan view
+
+    Inputs
+    ------
+        canvas      (canvas object)         Canvas to draw on
+        xs          (list)                  X pixel coordinates of the barbs
+        ys          (list)                  Y pixel coordinates of the barbs
+        dirs        (list)                  Wind directions (deg)
+        spds        (list)                  Wind speeds
+
+    Other keywords (size, color, width, rotate) are as for Barb. The lists
+    may also be NumPy arrays. Barbs with missing winds are skipped.
+    '''
+    size = kwargs.get('size', 4)
+    color = kwargs.get('color', "#FFFFFF")
+    width = kwargs.get('width', 1)
+    rotate = kwargs.get('rotate', 0)
+    for x, y, dir, spd in zip(xs, ys, dirs, spds):
+        if not tab.constants.QC(dir) or not tab.constants.QC(spd): continue
+        _draw(canvas, x, y, glyph(dir + rotate, spd, size), color, width)
+
+
+def glyph(dir, spd, size=4, spacing=9):
+    '''
+    Returns the geometry of a wind barb relative to its position, computing
+    it only once for each rounded direction, number of flags, full and
+    half barbs, and size
+
+    Inputs
+    ------
+        dir         (float)                 Direction of the barb (deg)
+        spd         (float)                 Wind speed
+        size        (float; optional)       Scale factor of the barb
+        spacing     (int; optional)         Elements fitting on a backbone
+
+    Returns
+    -------
+        (station circle, backbone, flags, barbs) tuple: the circle and
+        backbone coordinates, and lists of flag polygon and barb line
+        coordinates
+    '''
+    # Flags (increments of 50), full (10) and half barbs (5)
+    flags = 0
+    barbs = 0
+    sped = spd
+    while (sped > 47):
+        flags += 1
+        sped = sped - 50
+    while (sped > 7):
+        barbs += 1
+        sped = sped - 10
+    key = (int(round(dir / DIR_RESOLUTION)), flags, barbs, sped > 2, size,
+        spacing)
+    geom = _GLYPHS.get(key)
+    if geom is None:
+        if len(_GLYPHS) >= _MAXGLYPHS: _GLYPHS.clear()
+        geom = _build(key[0] * DIR_RESOLUTION, flags, barbs, key[3], size,
+            spacing)
+        _GLYPHS[key] = geom
+    return geom
+
+
+def _build(dir, flags, barbs, half, size, spacing):
+    ''' Geometry of a wind barb drawn at (0, 0) '''
+    # unit vector
+    iuu, ivv = tab.vector.vec2comp(dir, size)
+
+    # Start with station circle
+    circle = (-(size/3), -(size/3), size/3, size/3)
+
+    # Backbone line
+    x1 = -iuu
+    y1 = ivv
+    x2 = -(iuu * 10)
+    y2 = ivv * 10
+    backbone = (x1, y1, x2, y2)
+    polys = []
+    lines = []
+
+    # Variable setup
+    dx = iuu * size
+    dy = ivv * size
+    spcx = -(x2-x1) / spacing
+    spcy = (y2-y1) / spacing
+    x1 = x2
+    y1 = y2
+
+    # Draw wind flags (increments of 50)
+    flag=0
+    fullbarb=0
+    for i in range(flags):
+        flag=1
+        x2 = x1 - dy - 2
+        y2 = y1 - dx - 2
+        x3 = x1 + spcx
+        y3 = y1 - spcy
+        polys.append((x1, y1, x2, y2, x3, y3))
+        x1 = x3
+        y1 = y3
+
+    # Single barbs (increments of 10)
+    for i in range(barbs):
+        fullbarb=1
+        if flag == 0:
+            x1 = x1 - spcx
+            y1 = y1 + spcy
+            flag = 1
+        x2 = x1 - dy
+        y2 = y1 - dx
+        x1 = x1 + spcx
+        y1 = y1 - spcy
+        lines.append((x1, y1, x2, y2))
+
+    # Half barb (if needed)
+    if half:
+        if fullbarb == 1:
+            x1 += spcx
+            y1 -= spcy
+        x2 = x1 - ((dy)/2) - (spcx/2)
+        y2 = y1 - ((dx)/2) + (spcy/2)
+        lines.append((x1, y1, x2, y2))
+    return circle, backbone, polys, lines
+
+
+def _draw(canvas, x, y, glyph, color, width):
+    ''' Draw a barb glyph at (x, y) '''
+    circle, backbone, polys, lines = glyph
+    x1, y1, x2, y2 = circle
+    canvas.create_oval(x+x1, y+y1, x+x2, y+y2, outline=color, width=width)
+    x1, y1, x2, y2 = backbone
+    canvas.create_line(x+x1, y+y1, x+x2, y+y2, fill=color, width=width)
+    for x1, y1, x2, y2, x3, y3 in polys:
+        canvas.create_polygon([x+x1, y+y1, x+x2, y+y2, x+x3, y+y3],
+            fill=color)
+    for x1, y1, x2, y2 in lines:
+        canvas.create_line(x+x1, y+y1, x+x2, y+y2, fill=color, width=width)
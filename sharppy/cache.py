@@ -0,0 +1,190 @@
+''' Persistent Cache of Computed Parameters '''
+import os
+import errno
+import struct
+import hashlib
+import tempfile
+import cPickle
+import sharppy
+from sharppy.sharptab import sheet
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+__all__ = ['ResultCache', 'profile_key']
+
+
+def profile_key(prof, fields=None, version=None):
+    '''
+    Computes a content hash identifying the results of a parameter sheet
+    for a profile. The hash covers the numeric sounding data, the column
+    layout of the profile, the definition of the sheet and the version of
+    SHARPpy, so any change to one of them produces a new key.
+
+    Inputs
+    ------
+        prof        (profile object)        Profile Object
+        fields      (list; optional)        Names of sheet fields
+        version     (string; optional)      SHARPpy version string
+
+    Returns
+    -------
+        Hexadecimal key (string)
+    '''
+    if version is None: version = sharppy.__version__
+    digest = hashlib.sha1()
+    digest.update(version)
+    digest.update(repr(sheet.definition(fields)))
+    digest.update(repr((prof.pind, prof.zind, prof.tind, prof.tdind,
+        prof.uind, prof.vind)))
+    if np is not None and isinstance(prof.gSndg, np.ndarray):
+        # Same bytes as packing the rows one at a time
+        digest.update(np.ascontiguousarray(prof.gSndg, '<f8').tostring())
+    else:
+        for row in prof.gSndg:
+            digest.update(struct.pack('<%dd' % len(row), *row))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    '''
+    A content-addressed on-disk cache of computed parameter sheets.
+
+    Results are pickled into one file per profile under path, named by
+    profile_key(). Reading an entry refreshes its modification time, and
+    when the total size of the cache exceeds maxsize the least recently
+    used entries are removed.
+
+    path : string
+        Cache directory (created if needed)
+    maxsize : int
+        Maximum size of the cache in bytes
+
+    Usage
+    -----
+        cache = ResultCache('/tmp/sharppy-cache')
+        results = cache.compute(prof)
+    '''
+    def __init__(self, path, maxsize=256*1024*1024, fields=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.fields = fields
+        self.version = sharppy.__version__
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(path)
+        except OSError, e:
+            if e.errno != errno.EEXIST: raise
+        self.size = sum([size for fname, size, mtime in self.__entries()])
+
+
+    def key(self, prof):
+        return profile_key(prof, self.fields, self.version)
+
+
+    def get(self, key, default=None):
+        ''' Returns the cached results for key, or default '''
+        fname = self.__fname(key)
+        try:
+            f = open(fname, 'rb')
+        except IOError:
+            return default
+        try:
+            value = cPickle.load(f)
+        except Exception:
+            return default
+        finally:
+            f.close()
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+        return value
+
+
+    def put(self, key, value):
+        ''' Store results under key, evicting old entries if necessary '''
+        fname = self.__fname(key)
+        dirname = os.path.dirname(fname)
+        try:
+            os.mkdir(dirname)
+        except OSError, e:
+            if e.errno != errno.EEXIST: raise
+        fd, tmpname = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        f = os.fdopen(fd, 'wb')
+        try:
+            cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        try:
+            old = os.path.getsize(fname)
+        except OSError:
+            old = 0
+        os.rename(tmpname, fname)
+        self.size += os.path.getsize(fname) - old
+        if self.size > self.maxsize: self.evict()
+
+
+    def compute(self, prof):
+        '''
+        Returns the parameter sheet for a profile, computing and storing it
+        only if it is not already cached.
+
+        Inputs
+        ------
+            prof        (profile object)        Profile Object
+
+        Returns
+        -------
+            Dictionary of field name to value (see sheet.compute)
+        '''
+        key = self.key(prof)
+        results = self.get(key)
+        if results is None:
+            self.misses += 1
+            results = sheet.compute(prof, self.fields)
+            self.put(key, results)
+        else:
+            self.hits += 1
+        return results
+
+
+    def evict(self, maxsize=None):
+        '''
+        Remove least recently used entries until the cache is no larger
+        than maxsize (default: 90% of the configured maximum)
+        '''
+        if maxsize is None: maxsize = int(self.maxsize * 0.9)
+        entries = sorted(self.__entries(), key=lambda entry: entry[2])
+        self.size = sum([size for fname, size, mtime in entries])
+        for fname, size, mtime in entries:
+            if self.size <= maxsize: break
+            try:
+                os.remove(fname)
+            except OSError:
+                continue
+            self.size -= size
+
+
+    def clear(self):
+        self.evict(0)
+
+
+    def __fname(self, key):
+        return os.path.join(self.path, key[:2], key[2:] + '.pkl')
+
+
+    def __entries(self):
+        for dirpath, dirnames, fnames in os.walk(self.path):
+            for fname in fnames:
+                if not fname.endswith('.pkl'): continue
+                fname = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(fname)
+                except OSError:
+                    continue
+                yield fname, st.st_size, st.st_mtime
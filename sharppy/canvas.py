@@ -0,0 +1,113 @@
+''' Canvas Drawing Helpers '''
+
+
+__all__ = ['chain', 'draw_lines', 'Layer']
+
+
+def chain(segments):
+    '''
+    Join line segments that continue one another (each starting where the
+    previous one ended) into polylines
+
+    Inputs
+    ------
+        segments    (list)                  (x1, y1, x2, y2) tuples
+
+    Returns
+    -------
+        List of polylines, each a flat list of coordinates [x1, y1, x2, ...]
+    '''
+    lines = []
+    line = None
+    for x1, y1, x2, y2 in segments:
+        if line is not None and line[-2] == x1 and line[-1] == y1:
+            line.extend((x2, y2))
+        else:
+            line = [x1, y1, x2, y2]
+            lines.append(line)
+    return lines
+
+
+def draw_lines(canvas, segments, polylines=False, **kwargs):
+    '''
+    Draw line segments that share a style on a canvas, either one canvas
+    line per segment or (if polylines) one multi-point line per run of
+    connected segments
+
+    Inputs
+    ------
+        canvas      (canvas object)         Canvas to draw on
+        segments    (list)                  (x1, y1, x2, y2) tuples
+        polylines   (bool; optional)        Join connected segments
+
+    Other keywords are passed to canvas.create_line (fill, width, dash...)
+
+    Returns
+    -------
+        List of the canvas item ids created
+    '''
+    if polylines:
+        return [canvas.create_line(line, **kwargs)
+            for line in chain(segments)]
+    return [canvas.create_line(x1, y1, x2, y2, **kwargs)
+        for x1, y1, x2, y2 in segments]
+
+
+class Layer(object):
+    '''
+    A view of a canvas that tags every item created through it, so that
+    the items of a layer (e.g. the traces of one frame of a loop) can be
+    deleted and drawn anew without touching the rest of the canvas. All
+    other canvas methods are passed through.
+
+    canvas : canvas object
+        Canvas to draw on
+    tag : string
+        Tag given to the items of the layer
+
+    Usage
+    -----
+        layer = Layer(canvas, 'skewt.profile')
+        skewt.gCanvas = layer
+        skewt.drawProfile(prof)
+        layer.clear()
+    '''
+    def __init__(self, canvas, tag):
+        self.canvas = canvas
+        self.tag = tag
+
+
+    def __getattr__(self, name):
+        return getattr(self.canvas, name)
+
+
+    def __tagged(self, kwargs):
+        tags = kwargs.get('tags', ())
+        if isinstance(tags, basestring): tags = tuple(tags.split())
+        kwargs['tags'] = tuple(tags) + (self.tag,)
+        return kwargs
+
+
+    def create_line(self, *args, **kwargs):
+        return self.canvas.create_line(*args, **self.__tagged(kwargs))
+
+
+    def create_text(self, *args, **kwargs):
+        return self.canvas.create_text(*args, **self.__tagged(kwargs))
+
+
+    def create_oval(self, *args, **kwargs):
+        return self.canvas.create_oval(*args, **self.__tagged(kwargs))
+
+
+    def create_polygon(self, *args, **kwargs):
+        return self.canvas.create_polygon(*args, **self.__tagged(kwargs))
+
+
+    def create_rectangle(self, *args, **kwargs):
+        return self.canvas.create_rectangle(*args, **self.__tagged(kwargs))
+
+
+    def clear(self):
+        ''' Delete the items of the layer '''
+        self.canvas.delete(self.tag)
@@ -0,0 +1,341 @@
+''' Climatological Ranking of Computed Parameters '''
+import os
+import sys
+import glob
+import mmap
+import json
+import array
+import bisect
+import struct
+import optparse
+from sharppy import store
+from sharppy.sharptab import profile, sheet
+from sharppy.sharptab.constants import *
+
+
+__all__ = ['Builder', 'Climatology', 'build', 'ALLMONTHS']
+
+
+# Month of the climatology covering the whole year
+ALLMONTHS = 0
+
+# File layout: header (magic, version, length of the JSON index), the
+# index, then the sorted values of every (station, month, field) as
+# little-endian doubles, each array starting on an 8 byte boundary
+MAGIC = 'SHCLIMO\0'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+
+
+class Builder(object):
+    '''
+    Gathers parameter values from an archive of soundings into per-station,
+    per-month climatologies, and writes them (sorted) to a file that can be
+    opened as a Climatology. Every value also enters the climatology of
+    the station for the whole year (month ALLMONTHS). Missing values are
+    skipped.
+
+    fields : list
+        Scalar sheet fields to gather [default: sheet.SCALARS]
+
+    Usage
+    -----
+        builder = Builder()
+        for prof in archive: builder.add_profile(prof)
+        builder.save('soundings.climo')
+    '''
+    def __init__(self, fields=None):
+        self.fields = list(fields or sheet.SCALARS)
+        self.values = {}
+        self.skipped = 0
+
+
+    def add(self, station, month, values):
+        '''
+        Add the parameters of one sounding
+
+        Inputs
+        ------
+            station     (string)            Station identifier
+            month       (int)               Month of the sounding (1-12)
+            values      (dict)              Field name to value
+        '''
+        station = station.strip()
+        for m in (month, ALLMONTHS):
+            columns = self.values.setdefault((station, m), {})
+            for field in self.fields:
+                value = values.get(field, RMISSD)
+                if not QC(value): continue
+                if field not in columns: columns[field] = array.array('d')
+                columns[field].append(value)
+
+
+    def add_profile(self, prof, results=None):
+        '''
+        Add a profile, computing its parameter sheet unless it is given.
+        Profiles without a valid date are skipped.
+
+        Inputs
+        ------
+            prof        (profile object)    Profile Object
+            results     (dict; optional)    Output of sheet.compute()
+        '''
+        valid = store.valid_time(prof.gDate)
+        if valid is None:
+            self.skipped += 1
+            return
+        if results is None: results = sheet.compute(prof, self.fields)
+        self.add(prof.gStation, valid.month, results)
+
+
+    def add_store(self, db, **kwargs):
+        '''
+        Add the soundings of a store.ParameterStore; keywords (e.g. start,
+        end, stations) select the soundings as for ParameterStore.select()
+        '''
+        columns = ['station', 'valid'] + [field for field in self.fields
+            if field in db.columns]
+        for row in db.select(columns=columns, order=None, **kwargs):
+            if row['valid'] is None or row['station'] is None:
+                self.skipped += 1
+                continue
+            month = int(row['valid'][5:7])
+            self.add(row['station'], month, dict([(name, value)
+                for name, value in row.items() if value is not None]))
+
+
+    def save(self, fname):
+        ''' Write the sorted climatologies to a file '''
+        index = {}
+        blocks = []
+        offset = 0
+        for (station, month), columns in sorted(self.values.items()):
+            for field, values in sorted(columns.items()):
+                values = array.array('d', sorted(values))
+                if sys.byteorder != 'little': values.byteswap()
+                index.setdefault(station, {}).setdefault(str(month),
+                    {})[field] = [offset, len(values)]
+                blocks.append(values)
+                offset += len(values) * 8
+        meta = json.dumps({'fields': self.fields, 'index': index})
+        meta += ' ' * (-(HEADER.size + len(meta)) % 8)
+        tmpname = fname + '.tmp'
+        f = open(tmpname, 'wb')
+        try:
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta)))
+            f.write(meta)
+            for values in blocks: values.tofile(f)
+        finally:
+            f.close()
+        os.rename(tmpname, fname)
+
+
+class _Column(object):
+    # Read-only sequence of the doubles of one climatology in the mapping,
+    # so that bisect can search it without copying
+    __slots__ = ('buf', 'offset', 'count')
+
+    def __init__(self, buf, offset, count):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0: i += self.count
+        if not 0 <= i < self.count: raise IndexError(i)
+        return struct.unpack_from('<d', self.buf, self.offset + 8 * i)[0]
+
+
+class Climatology(object):
+    '''
+    A climatology file written by Builder, memory mapped so that opening it
+    is cheap and only the pages touched by lookups are read. Values are
+    ranked by binary search in the sorted values of the station, month and
+    field, in O(log n).
+
+    fname : string
+        Climatology file
+
+    Usage
+    -----
+        climo = Climatology('soundings.climo')
+        climo.rank('OUN', 5, 'pwat', 1.6)        # e.g. 99.1 (percentile)
+    '''
+    def __init__(self, fname):
+        self.fname = fname
+        f = open(fname, 'rb')
+        try:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        magic, version, length = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError('%s is not a climatology file' % fname)
+        meta = json.loads(self.map[HEADER.size:HEADER.size+length])
+        self.fields = meta['fields']
+        self.index = meta['index']
+        self.base = HEADER.size + length
+
+
+    def close(self):
+        self.map.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def stations(self):
+        return sorted(self.index)
+
+
+    def values(self, station, month, field):
+        '''
+        Returns the sorted values of a climatology as a sequence backed by
+        the file, or None if there is no such climatology
+        '''
+        entry = self.index.get(station.strip(), {}).get(str(month), {}).get(
+            field)
+        if entry is None: return None
+        return _Column(self.map, self.base + entry[0], entry[1])
+
+
+    def count(self, station, month, field):
+        ''' Number of soundings in a climatology '''
+        values = self.values(station, month, field)
+        if values is None: return 0
+        return len(values)
+
+
+    def rank(self, station, month, field, value):
+        '''
+        Ranks a value against a climatology
+
+        Inputs
+        ------
+            station     (string)            Station identifier
+            month       (int)               Month (1-12), or ALLMONTHS
+            field       (string)            Sheet field
+            value       (float)             Value to rank
+
+        Returns
+        -------
+            Percentile (0-100) of the value: the percentage of the
+            climatology below it, counting equal values half; None if the
+            value is missing or there is no climatology
+        '''
+        values = self.values(station, month, field)
+        if values is None or not len(values) or not QC(value): return None
+        lo = bisect.bisect_left(values, value)
+        hi = bisect.bisect_right(values, value, lo)
+        return 100. * (lo + hi) / (2. * len(values))
+
+
+    def ranks(self, station, month, results):
+        '''
+        Ranks the scalar fields of a computed sheet
+
+        Inputs
+        ------
+            station     (string)            Station identifier
+            month       (int)               Month (1-12), or ALLMONTHS
+            results     (dict)              Field name to value, e.g. the
+                                            output of sheet.compute()
+
+        Returns
+        -------
+            Dictionary of field name to percentile, for the fields with a
+            climatology
+        '''
+        ranks = {}
+        for field in self.fields:
+            if field not in results: continue
+            rank = self.rank(station, month, field, results[field])
+            if rank is not None: ranks[field] = rank
+        return ranks
+
+
+    def value(self, station, month, field, q):
+        '''
+        Returns the value at the q-th percentile (0-100) of a climatology,
+        or None if there is no climatology
+        '''
+        values = self.values(station, month, field)
+        if values is None or not len(values): return None
+        return values[min(int(q / 100. * len(values)), len(values) - 1)]
+
+
+def build(sources, fname, fields=None):
+    '''
+    Builds a climatology file from an archive
+
+    Inputs
+    ------
+        sources     (list)                  Directories of SPC-format
+                                            soundings, SPC-format files,
+                                            ParameterStore databases (.db
+                                            or .sqlite) or profile objects
+        fname       (string)                Climatology file to write
+        fields      (list; optional)        Scalar sheet fields
+
+    Returns
+    -------
+        Builder used to write the file (soundings that could not be read
+        or analyzed are counted in its skipped attribute)
+    '''
+    builder = Builder(fields)
+    for source in sources:
+        if not isinstance(source, basestring):
+            builder.add_profile(source)
+        elif os.path.splitext(source)[1] in ('.db', '.sqlite'):
+            db = store.ParameterStore(source)
+            try:
+                builder.add_store(db)
+            finally:
+                db.close()
+        else:
+            if os.path.isdir(source):
+                fnames = sorted(glob.glob(os.path.join(source, '*')))
+            else:
+                fnames = [source]
+            for name in fnames:
+                if os.path.isdir(name): continue
+                f = open(name)
+                try:
+                    text = f.read().decode('utf-8', 'replace')
+                finally:
+                    f.close()
+                try:
+                    builder.add_profile(profile.Profile(text=text))
+                except Exception:
+                    builder.skipped += 1
+    builder.save(fname)
+    return builder
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] output.climo archive [archive ...]')
+    parser.add_option('-f', '--fields', default='',
+        help='comma-separated sheet fields [default: all scalars]')
+    opts, args = parser.parse_args(argv)
+    if len(args) < 2: parser.error('expected an output file and an archive')
+
+    fields = [name for name in opts.fields.split(',') if name] or None
+    builder = build(args[1:], args[0], fields)
+    sys.stderr.write('%d station-months written, %d soundings skipped\n' %
+        (len([key for key in builder.values if key[1] != ALLMONTHS]),
+        builder.skipped))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+''' Concurrent Sounding Retrieval '''
+import time
+import codecs
+import socket
+import httplib
+import urlparse
+import threading
+import Queue
+from sharppy.sharptab import profile
+
+
+__all__ = ['Fetcher', 'FetchResult', 'ConnectionPool', 'fetch']
+
+
+class FetchResult(object):
+    ''' Outcome of retrieving a single sounding '''
+    def __init__(self, url):
+        self.url = url
+        self.status = None          # 'ok', 'not-modified' or 'error'
+        self.prof = None            # Profile object (if available)
+        self.error = None           # Last exception raised (if any)
+        self.etag = None
+        self.modified = None
+        self.attempts = 0
+        self.elapsed = 0.
+        return
+
+
+class ConnectionPool(object):
+    '''
+    A bounded pool of persistent (keep-alive) HTTP connections. At most
+    maxsize connections are checked out at once; idle connections are kept
+    per host so that consecutive requests to the same server reuse the
+    socket instead of paying for a new TCP handshake.
+    '''
+    def __init__(self, maxsize=8, timeout=10.):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.__slots = threading.BoundedSemaphore(maxsize)
+        self.__lock = threading.Lock()
+        self.__idle = {}
+
+
+    def acquire(self, scheme, netloc):
+        ''' Check out a connection to the given host '''
+        self.__slots.acquire()
+        key = (scheme, netloc)
+        with self.__lock:
+            conns = self.__idle.get(key)
+            if conns: return key, conns.pop()
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            conn = httplib.HTTPConnection(netloc, timeout=self.timeout)
+        return key, conn
+
+
+    def release(self, key, conn, reuse=True):
+        ''' Return a connection to the pool; broken ones are discarded '''
+        if reuse:
+            with self.__lock:
+                self.__idle.setdefault(key, []).append(conn)
+        else:
+            conn.close()
+        self.__slots.release()
+
+
+    def close(self):
+        ''' Close all idle connections '''
+        with self.__lock:
+            for conns in self.__idle.values():
+                for conn in conns: conn.close()
+            self.__idle = {}
+
+
+class Fetcher(object):
+    '''
+    Retrieve many SPC-format soundings concurrently.
+
+    Requests are spread over a fixed number of worker threads sharing a
+    bounded connection pool. Failed requests (network errors and 5xx
+    responses) are retried with exponential backoff. The ETag and
+    Last-Modified validators of each successful response are remembered so
+    that refetching an unchanged sounding is a cheap conditional request
+    which reuses the previously parsed profile. Response bodies are parsed
+    as they arrive.
+
+    workers : int
+        Number of concurrent requests
+    timeout : float
+        Socket timeout (s) for connecting and reading
+    retries : int
+        Number of additional attempts after a failure
+    backoff : float
+        Delay (s) before the first retry; doubled on each retry
+    '''
+    def __init__(self, workers=8, timeout=10., retries=2, backoff=0.5,
+        **kwargs):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.chunksize = kwargs.get('chunksize', 8192)
+        self.pool = kwargs.get('pool', ConnectionPool(workers, timeout))
+        self.validators = {}
+        self.__lock = threading.Lock()
+
+
+    def fetch(self, urls):
+        '''
+        Retrieve a list of urls; returns a list of FetchResult objects in
+        the same order as the urls.
+        '''
+        urls = list(urls)
+        results = [FetchResult(url) for url in urls]
+        jobs = Queue.Queue()
+        for job in enumerate(urls): jobs.put(job)
+
+        def worker():
+            while True:
+                try:
+                    i, url = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                self.__fetch(url, results[i])
+
+        threads = [threading.Thread(target=worker)
+            for i in range(min(self.workers, len(urls)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads: thread.join()
+        return results
+
+
+    def close(self):
+        self.pool.close()
+
+
+    def __fetch(self, url, result):
+        start = time.time()
+        delay = self.backoff
+        while result.attempts <= self.retries:
+            result.attempts += 1
+            try:
+                self.__request(url, result)
+                # Errors left by __request (e.g. HTTP 404) are permanent
+                if result.status in ('ok', 'not-modified'): result.error = None
+                break
+            except (socket.error, httplib.HTTPException, IOError), e:
+                result.status = 'error'
+                result.error = e
+            except Exception, e:
+                # A malformed sounding fails the same way on every attempt
+                result.status = 'error'
+                result.error = e
+                break
+            if result.attempts <= self.retries:
+                time.sleep(delay)
+                delay *= 2
+        result.elapsed = time.time() - start
+        return result
+
+
+    def __request(self, url, result):
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query: path += '?' + parts.query
+        headers = {'Accept-Encoding': 'identity'}
+        with self.__lock:
+            cached = self.validators.get(url)
+        if cached:
+            etag, modified, prof = cached
+            if etag: headers['If-None-Match'] = etag
+            if modified: headers['If-Modified-Since'] = modified
+
+        key, conn = self.pool.acquire(parts.scheme, parts.netloc)
+        reuse = False
+        try:
+            conn.request('GET', path, headers=headers)
+            resp = conn.getresponse()
+            if resp.status == 304 and cached:
+                resp.read()
+                result.status = 'not-modified'
+                result.etag, result.modified, result.prof = cached
+            elif resp.status == 200:
+                parser = profile.SPCParser()
+                decoder = codecs.getincrementaldecoder('utf-8')('replace')
+                while True:
+                    chunk = resp.read(self.chunksize)
+                    if not chunk: break
+                    parser.feed(decoder.decode(chunk))
+                parser.feed(decoder.decode('', True))
+                parser.close()
+                result.status = 'ok'
+                result.prof = profile.Profile(parser=parser)
+                result.etag = resp.getheader('etag')
+                result.modified = resp.getheader('last-modified')
+                if result.etag or result.modified:
+                    with self.__lock:
+                        self.validators[url] = (result.etag, result.modified,
+                            result.prof)
+            else:
+                resp.read()
+                reuse = not resp.will_close
+                if resp.status >= 500:
+                    raise IOError('HTTP %d from %s' % (resp.status, url))
+                result.status = 'error'
+                result.error = IOError('HTTP %d from %s' % (resp.status, url))
+                return
+            reuse = not resp.will_close
+        finally:
+            self.pool.release(key, conn, reuse)
+
+
+def fetch(urls, **kwargs):
+    '''
+    Convenience wrapper to retrieve a list of SPC-format sounding urls
+    concurrently. Keyword arguments are passed to Fetcher.
+
+    Inputs
+    ------
+        urls        (list)                  Sounding urls
+
+    Returns
+    -------
+        List of profile objects (None where retrieval failed)
+    '''
+    fetcher = Fetcher(**kwargs)
+    try:
+        return [result.prof for result in fetcher.fetch(urls)]
+    finally:
+        fetcher.close()
@@ -0,0 +1,700 @@
+''' Headless Canvas for Rendering Charts without a Display '''
+import math
+import zlib
+import struct
+import multiprocessing
+from xml.sax.saxutils import escape
+import sharppy as sp
+from sharppy.sharptab import profile, params
+
+
+__all__ = ['HeadlessCanvas', 'Raster', 'chart', 'render', 'render_many']
+
+
+# Named colors understood besides '#RGB' and '#RRGGBB'
+COLORS = {
+    'black': (0, 0, 0), 'white': (255, 255, 255), 'red': (255, 0, 0),
+    'green': (0, 255, 0), 'blue': (0, 0, 255), 'yellow': (255, 255, 0),
+    'cyan': (0, 255, 255), 'magenta': (255, 0, 255),
+    'gray': (190, 190, 190), 'grey': (190, 190, 190),
+}
+
+# 5x7 bitmap font: character -> seven rows of five bits (MSB on the left).
+# Lower case letters are drawn in upper case; characters missing from the
+# table are drawn as '?'.
+GLYPHS = {
+    '0': '0E11131519110E', '1': '040C040404040E', '2': '0E11010204081F',
+    '3': '1F02040201110E', '4': '02060A121F0202', '5': '1F101E0101110E',
+    '6': '0608101E11110E', '7': '1F010204080808', '8': '0E11110E11110E',
+    '9': '0E11110F01020C', 'A': '0E1111111F1111', 'B': '1E11111E11111E',
+    'C': '0E11101010110E', 'D': '1C12111111121C', 'E': '1F10101E10101F',
+    'F': '1F10101E101010', 'G': '0E10101711110F', 'H': '1111111F111111',
+    'I': '0E04040404040E', 'J': '0702020202120C', 'K': '11121418141211',
+    'L': '1010101010101F', 'M': '111B1515111111', 'N': '11111915131111',
+    'O': '0E11111111110E', 'P': '1E11111E101010', 'Q': '0E11111115120D',
+    'R': '1E11111E141211', 'S': '0F10100E01011E', 'T': '1F040404040404',
+    'U': '1111111111110E', 'V': '11111111110A04', 'W': '1111111515150A',
+    'X': '11110A040A1111', 'Y': '1111110A040404', 'Z': '1F01020408101F',
+    ' ': '00000000000000', '.': '00000000000C0C', ',': '000000000C0408',
+    '-': '0000001F000000', '+': '0004041F040400', '/': '00010204081000',
+    ':': '000C0C000C0C00', '(': '02040808080402', ')': '08040202020408',
+    '%': '18190204081303', '_': '0000000000001F', '=': '00001F001F0000',
+    "'": '0C040800000000', '"': '0A0A0A00000000', '<': '02040810080402',
+    '>': '08040201020408', '?': '0E110102040004', '!': '04040404040004',
+    '*': '0004150E150400', '#': '0A0A1F0A1F0A0A',
+}
+
+
+def _runs(glyph):
+    ''' Horizontal runs (row, first column, last column + 1) of a glyph '''
+    runs = []
+    for row in range(7):
+        bits = int(glyph[row*2:row*2+2], 16)
+        col = 0
+        while col < 5:
+            if bits & (0x10 >> col):
+                end = col
+                while end < 5 and bits & (0x10 >> end): end += 1
+                runs.append((row, col, end))
+                col = end
+            else:
+                col += 1
+    return runs
+
+_GLYPHRUNS = dict([(c, _runs(g)) for c, g in GLYPHS.items()])
+
+
+def color(value):
+    '''
+    Converts a Tk color to an (r, g, b) tuple
+
+    Inputs
+    ------
+        value       (string)                '#RGB', '#RRGGBB' or a name
+
+    Returns
+    -------
+        (r, g, b) tuple of integers, or None for an empty color
+    '''
+    if not value: return None
+    if value[0] == '#':
+        digits = value[1:]
+        if len(digits) == 3:
+            return tuple([int(c, 16) * 17 for c in digits])
+        if len(digits) == 6:
+            return tuple([int(digits[i:i+2], 16) for i in (0, 2, 4)])
+    elif value.lower() in COLORS:
+        return COLORS[value.lower()]
+    raise ValueError('unknown color %r' % (value,))
+
+
+def fontsize(font):
+    ''' Size in points of a Tk font description ("Helvetica 9" or a tuple) '''
+    if not font: return 9
+    if isinstance(font, basestring): font = font.split()
+    if len(font) < 2: return 9
+    return abs(int(font[1]))
+
+
+def _flatten(args):
+    ''' Coordinates given Tk style (separately, flat or as pairs) '''
+    coords = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)): coords.extend(_flatten(arg))
+        else: coords.append(float(arg))
+    return coords
+
+
+def _dashes(points, pattern):
+    '''
+    Splits a polyline into the pieces drawn by a dash pattern
+
+    Inputs
+    ------
+        points      (list)                  (x, y) vertices
+        pattern     (tuple)                 Dash lengths (on, off, ...)
+
+    Returns
+    -------
+        List of polylines, each a list of (x, y) vertices
+    '''
+    pattern = [float(d) for d in pattern if d > 0]
+    if not pattern: return [points]
+    if len(pattern) % 2: pattern = pattern * 2
+    pieces = []
+    index = 0
+    left = pattern[0]
+    current = [points[0]]
+    for (x1, y1), (x2, y2) in zip(points[:-1], points[1:]):
+        length = math.hypot(x2 - x1, y2 - y1)
+        pos = 0.
+        while length - pos > left:
+            pos += left
+            frac = pos / length
+            pt = (x1 + (x2 - x1) * frac, y1 + (y2 - y1) * frac)
+            if index % 2 == 0:
+                current.append(pt)
+                pieces.append(current)
+                current = None
+            else:
+                current = [pt]
+            index = (index + 1) % len(pattern)
+            left = pattern[index]
+        left -= length - pos
+        if current is not None: current.append((x2, y2))
+    if current is not None and len(current) > 1: pieces.append(current)
+    return pieces
+
+
+def _ellipse(x1, y1, x2, y2):
+    ''' Vertices of a polygon approximating the ellipse in a bounding box '''
+    cx = (x1 + x2) / 2.
+    cy = (y1 + y2) / 2.
+    rx = abs(x2 - x1) / 2.
+    ry = abs(y2 - y1) / 2.
+    num = max(12, int(math.pi * (rx + ry) / 6.))
+    return [(cx + rx * math.cos(2 * math.pi * i / num),
+        cy + ry * math.sin(2 * math.pi * i / num)) for i in range(num)]
+
+
+class Raster(object):
+    '''
+    A 24-bit RGB image that lines, polygons, rectangles and bitmap text
+    can be drawn on, and that can be encoded as PNG. Pixel (x, y) covers
+    the square from (x, y) to (x+1, y+1); a shape covers the pixels whose
+    centers it contains.
+
+    width : int
+        Width of the image (pixels)
+    height : int
+        Height of the image (pixels)
+    background : tuple
+        (r, g, b) color the image starts as
+    '''
+    def __init__(self, width, height, background=(0, 0, 0)):
+        self.width = int(width)
+        self.height = int(height)
+        self.pixels = bytearray(str(bytearray(background)) *
+            (self.width * self.height))
+
+
+    def copy(self):
+        ''' Returns a copy of the image '''
+        raster = Raster.__new__(Raster)
+        raster.width = self.width
+        raster.height = self.height
+        raster.pixels = bytearray(self.pixels)
+        return raster
+
+
+    def span(self, x1, x2, y, rgb):
+        ''' Fill pixels x1 to x2-1 of row y '''
+        if y < 0 or y >= self.height: return
+        if x1 < 0: x1 = 0
+        if x2 > self.width: x2 = self.width
+        if x2 <= x1: return
+        start = (y * self.width + x1) * 3
+        self.pixels[start:start + (x2 - x1) * 3] = rgb * (x2 - x1)
+
+
+    def rectangle(self, x1, y1, x2, y2, rgb):
+        ''' Fill the pixels whose centers are inside a rectangle '''
+        if x2 < x1: x1, x2 = x2, x1
+        if y2 < y1: y1, y2 = y2, y1
+        rgb = str(bytearray(rgb))
+        cx1 = int(math.ceil(x1 - 0.5))
+        cx2 = int(math.ceil(x2 - 0.5))
+        for y in range(max(int(math.ceil(y1 - 0.5)), 0),
+            min(int(math.ceil(y2 - 0.5)), self.height)):
+            self.span(cx1, cx2, y, rgb)
+
+
+    def polygon(self, points, rgb):
+        ''' Fill a polygon given as (x, y) vertices (even-odd rule) '''
+        if len(points) < 3: return
+        rgb = str(bytearray(rgb))
+        edges = []
+        for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+            if y1 == y2: continue
+            if y2 < y1: x1, y1, x2, y2 = x2, y2, x1, y1
+            edges.append((y1, y2, x1, (x2 - x1) / (y2 - y1)))
+        if not edges: return
+        ymin = max(int(math.ceil(min([e[0] for e in edges]) - 0.5)), 0)
+        ymax = min(int(math.ceil(max([e[1] for e in edges]) - 0.5)),
+            self.height)
+        for y in range(ymin, ymax):
+            yc = y + 0.5
+            xs = sorted([x + (yc - y1) * k for y1, y2, x, k in edges
+                if y1 <= yc < y2])
+            for i in range(0, len(xs) - 1, 2):
+                self.span(int(math.ceil(xs[i] - 0.5)),
+                    int(math.ceil(xs[i+1] - 0.5)), y, rgb)
+
+
+    def line(self, points, rgb, width=1, dash=None):
+        '''
+        Draw a polyline given as (x, y) vertices. Segments are drawn as
+        rectangles of the line width along the segment; interior vertices
+        of wide lines are filled in with a square.
+        '''
+        width = max(float(width), 1.)
+        if dash: pieces = _dashes(points, dash)
+        else: pieces = [points]
+        half = width / 2.
+        for piece in pieces:
+            for (x1, y1), (x2, y2) in zip(piece[:-1], piece[1:]):
+                if x1 == x2 or y1 == y2:
+                    if x1 == x2 and y1 == y2: continue
+                    # Axis-aligned segment
+                    if x1 == x2: self.rectangle(x1 - half, y1, x2 + half, y2,
+                        rgb)
+                    else: self.rectangle(x1, y1 - half, x2, y2 + half, rgb)
+                else:
+                    self.segment(x1, y1, x2, y2, half, rgb)
+            if width > 2:
+                for x, y in piece[1:-1]:
+                    self.rectangle(x - half, y - half, x + half, y + half,
+                        rgb)
+
+
+    def segment(self, x1, y1, x2, y2, half, rgb):
+        '''
+        Fill the rectangle of half-width half along a (not axis-aligned)
+        line segment, row by row: in each row the pixels covered are those
+        between the ends of the segment and within half of its center line.
+        '''
+        rgb = str(bytearray(rgb))
+        length = math.hypot(x2 - x1, y2 - y1)
+        ux = (x2 - x1) / length
+        uy = (y2 - y1) / length
+        # Offsets of the x limits per unit of y, and their constant parts
+        along = -uy / ux
+        across = ux / uy
+        a1 = x1
+        a2 = x1 + length / ux
+        if a2 < a1: a1, a2 = a2, a1
+        b1 = x1 - half / uy
+        b2 = x1 + half / uy
+        if b2 < b1: b1, b2 = b2, b1
+        ext = abs(ux) * half
+        ymin = max(int(math.ceil(min(y1, y2) - ext - 0.5)), 0)
+        ymax = min(int(math.ceil(max(y1, y2) + ext - 0.5)), self.height)
+        ceil = math.ceil
+        width = self.width
+        pixels = self.pixels
+        for y in range(ymin, ymax):
+            off = y + 0.5 - y1
+            lo = a1 + off * along
+            x = b1 + off * across
+            if x > lo: lo = x
+            hi = a2 + off * along
+            x = b2 + off * across
+            if x < hi: hi = x
+            lo = int(ceil(lo - 0.5))
+            hi = int(ceil(hi - 0.5))
+            if lo < 0: lo = 0
+            if hi > width: hi = width
+            if hi > lo:
+                start = (y * width + lo) * 3
+                pixels[start:start + (hi - lo) * 3] = rgb * (hi - lo)
+
+
+    def text(self, x, y, text, rgb, size=9, anchor='center'):
+        ''' Draw text in the bitmap font, anchored Tk style at (x, y) '''
+        scale = max(int(round(size / 8.)), 1)
+        lines = unicode(text).split('\n')
+        wid = (max([len(l) for l in lines]) * 6 - 1) * scale
+        hgt = (len(lines) * 9 - 2) * scale
+        if 'w' in anchor: left = x
+        elif 'e' in anchor: left = x - wid
+        else: left = x - wid / 2.
+        if 'n' in anchor: top = y
+        elif 's' in anchor: top = y - hgt
+        else: top = y - hgt / 2.
+        left = int(round(left))
+        top = int(round(top))
+        for n, line in enumerate(lines):
+            for i, c in enumerate(line.upper()):
+                runs = _GLYPHRUNS.get(c, _GLYPHRUNS['?'])
+                cx = left + i * 6 * scale
+                cy = top + n * 9 * scale
+                for row, col1, col2 in runs:
+                    self.rectangle(cx + col1 * scale, cy + row * scale,
+                        cx + col2 * scale, cy + (row + 1) * scale, rgb)
+
+
+    def png(self, level=6):
+        ''' The image encoded as PNG (string) '''
+        stride = self.width * 3
+        rows = ''.join(['\x00' + str(self.pixels[i:i+stride])
+            for i in xrange(0, stride * self.height, stride)])
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + \
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+        return '\x89PNG\r\n\x1a\n' + \
+            chunk('IHDR', struct.pack('>IIBBBBB', self.width, self.height,
+                8, 2, 0, 0, 0)) + \
+            chunk('IDAT', zlib.compress(rows, level)) + chunk('IEND', '')
+
+
+class HeadlessCanvas(object):
+    '''
+    A stand-in for a Tkinter Canvas that needs no display. The drawing
+    commands used by SkewT, Hodo and Barb (create_line, create_text,
+    create_oval, create_polygon and create_rectangle) are recorded, and
+    can then be written out as SVG or rasterized to PNG.
+
+    Items may be tagged (with the tags option) and deleted by tag, as on a
+    Tk canvas. When a drawing is rasterized again, the leading items left
+    unchanged since the previous time (e.g. the background of a loop of
+    charts, see SkewT.drawFrame) are not drawn again; their image is kept.
+
+    width : int
+        Width of the canvas (pixels)
+    height : int
+        Height of the canvas (pixels)
+    background : string
+        Background color
+
+    Usage
+    -----
+        canvas = HeadlessCanvas(800, 800)
+        skewt = SkewT(canvas)
+        skewt.drawSkewT()
+        skewt.drawProfile(prof)
+        canvas.save('skewt.png')
+    '''
+    def __init__(self, width=800, height=800, background='#000000'):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.items = []             # (id, type, coordinates, options)
+        self.lastid = 0
+        self.drawn = []             # ids of the items last rasterized
+        self.snapshot = None        # (geometry, no. of items, last id, Raster)
+
+
+    def __create(self, kind, args, options):
+        self.lastid += 1
+        tags = options.get('tags')
+        if isinstance(tags, basestring): options['tags'] = tuple(tags.split())
+        elif tags is not None: options['tags'] = tuple(tags)
+        self.items.append((self.lastid, kind, _flatten(args), options))
+        return self.lastid
+
+
+    def create_line(self, *args, **kwargs):
+        return self.__create('line', args, kwargs)
+
+
+    def create_text(self, *args, **kwargs):
+        return self.__create('text', args, kwargs)
+
+
+    def create_oval(self, *args, **kwargs):
+        return self.__create('oval', args, kwargs)
+
+
+    def create_polygon(self, *args, **kwargs):
+        return self.__create('polygon', args, kwargs)
+
+
+    def create_rectangle(self, *args, **kwargs):
+        return self.__create('rectangle', args, kwargs)
+
+
+    def find_all(self):
+        return [item[0] for item in self.items]
+
+
+    def find_withtag(self, tag):
+        ''' Ids of the items with a tag (or id, or 'all') '''
+        return [item[0] for item in self.items if _match(item, tag)]
+
+
+    def type(self, id):
+        for item in self.items:
+            if item[0] == id: return item[1]
+
+
+    def coords(self, id):
+        for item in self.items:
+            if item[0] == id: return list(item[2])
+
+
+    def delete(self, *tags):
+        ''' Remove items by id or tag (or every item, given 'all') '''
+        if 'all' in tags:
+            self.items = []
+        else:
+            self.items = [item for item in self.items
+                if not [tag for tag in tags if _match(item, tag)]]
+
+
+    def rasterize(self):
+        ''' Returns the drawing as a Raster '''
+        items = self.items
+        geometry = (self.width, self.height, self.background)
+
+        # Leading items unchanged since the previous rasterization
+        keep = 0
+        for id, item in zip(self.drawn, items):
+            if id != item[0]: break
+            keep += 1
+        self.drawn = [item[0] for item in items]
+
+        start = 0
+        snap = self.snapshot
+        if snap and snap[0] == geometry and snap[1] <= len(items) and \
+            items[snap[1]-1][0] == snap[2]:
+            start = snap[1]
+            raster = snap[3].copy()
+        else:
+            raster = Raster(self.width, self.height, color(self.background))
+        for i in range(start, len(items)):
+            if i == keep and keep > start:
+                self.snapshot = (geometry, keep, items[keep-1][0],
+                    raster.copy())
+            _draw(raster, items[i])
+        if keep == len(items) and keep > start:
+            self.snapshot = (geometry, keep, items[keep-1][0], raster.copy())
+        return raster
+
+
+    def png(self, level=6):
+        ''' The drawing as PNG (string) '''
+        return self.rasterize().png(level)
+
+
+    def svg(self):
+        ''' The drawing as an SVG document (string) '''
+        out = ['<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+            'width="%d" height="%d" viewBox="0 0 %d %d">' % (self.width,
+            self.height, self.width, self.height),
+            '<rect width="100%%" height="100%%" fill="%s"/>' %
+            self.background]
+        for id, kind, coords, opts in self.items:
+            points = ' '.join(['%s,%s' % (_num(x), _num(y))
+                for x, y in zip(coords[0::2], coords[1::2])])
+            if kind == 'text':
+                anchor = opts.get('anchor', 'center')
+                if 'w' in anchor: halign = 'start'
+                elif 'e' in anchor: halign = 'end'
+                else: halign = 'middle'
+                if 'n' in anchor: valign = 'hanging'
+                elif 's' in anchor: valign = 'auto'
+                else: valign = 'central'
+                font = opts.get('font') or ('Helvetica', 9)
+                if isinstance(font, basestring): font = font.split()
+                out.append('<text x="%s" y="%s" fill="%s" font-family="%s" '
+                    'font-size="%dpt" text-anchor="%s" '
+                    'dominant-baseline="%s">%s</text>' % (_num(coords[0]),
+                    _num(coords[1]), opts.get('fill', 'black'), font[0],
+                    fontsize(font), halign, valign,
+                    escape(unicode(opts.get('text', ''))).encode('utf-8')))
+                continue
+            if kind == 'line':
+                fill = 'none'
+                stroke = opts.get('fill', 'black')
+            else:
+                fill = opts.get('fill', kind == 'polygon' and 'black' or '')
+                stroke = opts.get('outline',
+                    kind != 'polygon' and 'black' or '')
+            style = 'fill="%s" stroke="%s"' % (fill or 'none',
+                stroke or 'none')
+            if stroke:
+                style += ' stroke-width="%s"' % _num(opts.get('width', 1))
+                if opts.get('dash'):
+                    style += ' stroke-dasharray="%s"' % ','.join(
+                        [str(d) for d in opts['dash']])
+            if kind == 'line':
+                out.append('<polyline points="%s" %s/>' % (points, style))
+            elif kind == 'polygon':
+                out.append('<polygon points="%s" %s/>' % (points, style))
+            elif kind == 'rectangle':
+                x1, y1, x2, y2 = coords[:4]
+                out.append('<rect x="%s" y="%s" width="%s" height="%s" %s/>'
+                    % (_num(min(x1, x2)), _num(min(y1, y2)),
+                    _num(abs(x2 - x1)), _num(abs(y2 - y1)), style))
+            elif kind == 'oval':
+                x1, y1, x2, y2 = coords[:4]
+                out.append('<ellipse cx="%s" cy="%s" rx="%s" ry="%s" %s/>' %
+                    (_num((x1 + x2) / 2.), _num((y1 + y2) / 2.),
+                    _num(abs(x2 - x1) / 2.), _num(abs(y2 - y1) / 2.), style))
+        out.append('</svg>\n')
+        return '\n'.join(out)
+
+
+    def save(self, fname, format=None):
+        '''
+        Write the drawing to a file
+
+        Inputs
+        ------
+            fname       (string)                File name
+            format      (string; optional)      'png' or 'svg' (by default
+                                                from the file extension)
+        '''
+        if format is None: format = fname.rsplit('.', 1)[-1].lower()
+        data = self.encode(format)
+        f = open(fname, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+
+    def encode(self, format):
+        ''' The drawing in a format ('png' or 'svg') '''
+        if format == 'png': return self.png()
+        if format == 'svg': return self.svg()
+        raise ValueError('unknown image format %r' % (format,))
+
+
+def _draw(raster, item):
+    ''' Draw a canvas item on a raster '''
+    id, kind, coords, opts = item
+    points = zip(coords[0::2], coords[1::2])
+    if kind == 'line':
+        fill = color(opts.get('fill', 'black'))
+        if fill and len(points) > 1:
+            raster.line(points, fill, opts.get('width', 1),
+                opts.get('dash'))
+    elif kind == 'text':
+        fill = color(opts.get('fill', 'black'))
+        if fill:
+            raster.text(coords[0], coords[1], opts.get('text', ''),
+                fill, fontsize(opts.get('font')),
+                opts.get('anchor', 'center'))
+    else:
+        if kind == 'oval':
+            points = _ellipse(*coords[:4])
+        elif kind == 'rectangle':
+            x1, y1, x2, y2 = coords[:4]
+            points = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+        default = kind == 'polygon' and 'black' or ''
+        fill = color(opts.get('fill', default))
+        if fill:
+            if kind == 'rectangle':
+                raster.rectangle(x1, y1, x2, y2, fill)
+            else:
+                raster.polygon(points, fill)
+        default = kind != 'polygon' and 'black' or ''
+        outline = color(opts.get('outline', default))
+        if outline:
+            raster.line(points + points[:1], outline,
+                opts.get('width', 1), opts.get('dash'))
+
+
+def _match(item, tag):
+    if tag == 'all' or tag == item[0]: return True
+    return tag in item[3].get('tags', ())
+
+
+def _num(value):
+    return ('%.2f' % value).rstrip('0').rstrip('.')
+
+
+def chart(prof, kind='skewt', width=800, height=800, parcel=1, **kwargs):
+    '''
+    Draws a chart of a sounding on a new headless canvas
+
+    Inputs
+    ------
+        prof        (profile object)        Profile Object
+        kind        (string; optional)      'skewt' or 'hodo'
+        width       (int; optional)         Width of the chart (pixels)
+        height      (int; optional)         Height of the chart (pixels)
+        parcel      (int; optional)         DefineParcel flag of the parcel
+                                            trace on a SkewT (None for no
+                                            parcel), or a lifted parcel
+
+    Other keywords are passed to the SkewT or Hodo
+
+    Returns
+    -------
+        HeadlessCanvas
+    '''
+    canvas = HeadlessCanvas(width, height)
+    if kind == 'skewt':
+        skewt = sp.SkewT(canvas, width=width, height=height, **kwargs)
+        skewt.drawSkewT()
+        skewt.drawProfile(prof)
+        skewt.drawBarbs(prof)
+        if parcel:
+            if hasattr(parcel, 'pres'): pcl = parcel
+            else: pcl = params.DefineParcel(prof, parcel, pres=100)
+            skewt.drawVirtualParcelTrace(pcl)
+            skewt.drawParcelTrace(pcl)
+    elif kind == 'hodo':
+        hodo = sp.Hodo(canvas, width=width, height=height, prof=prof,
+            **kwargs)
+        hodo.drawHodo()
+        hodo.drawProfile(prof)
+    else:
+        raise ValueError('unknown chart %r' % (kind,))
+    return canvas
+
+
+def render(prof, fname=None, format='png', **kwargs):
+    '''
+    Renders a chart of a sounding to an image
+
+    Inputs
+    ------
+        prof        (profile object)        Profile Object (or SPC-format
+                                            sounding text)
+        fname       (string; optional)      File to write; the format is
+                                            taken from its extension
+        format      (string; optional)      'png' or 'svg', if no fname
+
+    Other keywords are passed to chart()
+
+    Returns
+    -------
+        fname, or the image data (string) if fname is not given
+    '''
+    if isinstance(prof, basestring): prof = profile.Profile(text=prof)
+    canvas = chart(prof, **kwargs)
+    if fname is None: return canvas.encode(format)
+    canvas.save(fname)
+    return fname
+
+
+def _render(args):
+    prof, fname, kwargs = args
+    return render(prof, fname, **kwargs)
+
+
+def render_many(jobs, processes=None, chunksize=4, **kwargs):
+    '''
+    Renders charts of many soundings in a pool of worker processes
+
+    Inputs
+    ------
+        jobs        (list)                  (profile or SPC-format text,
+                                            file name) pairs
+        processes   (int; optional)         Number of worker processes
+                                            (default: one per CPU; 1
+                                            renders in this process)
+        chunksize   (int; optional)         Charts handed to a worker at
+                                            a time
+
+    Other keywords are passed to chart()
+
+    Returns
+    -------
+        List of the file names written, in the order of jobs
+    '''
+    args = [(prof, fname, kwargs) for prof, fname in jobs]
+    if processes == 1: return map(_render, args)
+    pool = multiprocessing.Pool(processes)
+    try:
+        fnames = pool.map(_render, args, chunksize)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return fnames
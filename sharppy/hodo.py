@@ -1,6 +1,8 @@
 ''' Hodograph Class '''
 import math
+import bisect
 import sharppy.sharptab as tab
+from sharppy.canvas import draw_lines, Layer
 from sharppy.sharptab.constants import *
 
 
@@ -79,6 +81,13 @@ class Hodo:
         self.ringincrement = 10
         self.rings = range(self.ringincrement, 200, self.ringincrement)
 
+        # Draw the shear trace as one multi-point line per color rather
+        # than one canvas line per segment
+        self.polylines = kwargs.get('polylines', False)
+
+        # Prefix of the canvas tags of the layers drawn by drawFrame
+        self.layertag = kwargs.get('layertag', 'hodo')
+
 
     def drawHodo(self):
         """ Draw the background Hodograph """
@@ -108,6 +117,36 @@ class Hodo:
         self.drawShearX(prof, width=width, font=self.font3)
 
 
+    def drawFrame(self, prof, recenter=False, width=3):
+        '''
+        Draws one frame of a loop of soundings. The background is drawn on
+        the first frame only (or when recentering); on each frame the items
+        of the previous shear trace are deleted and drawn anew.
+
+        Inputs
+        ------
+            prof        (profile object)    Profile Object
+            recenter    (bool; optional)    Center the hodograph on the
+                                            winds of prof (redrawing the
+                                            background)
+            width       (int; optional)     Width of the shear trace
+        '''
+        canvas = self.gCanvas
+        tag = self.layertag + '.%s'
+        try:
+            if recenter:
+                self.centerHodo(prof)
+                canvas.delete(tag % 'background')
+            if not canvas.find_withtag(tag % 'background'):
+                self.gCanvas = Layer(canvas, tag % 'background')
+                self.drawHodo()
+            canvas.delete(tag % 'profile')
+            self.gCanvas = Layer(canvas, tag % 'profile')
+            self.drawProfile(prof, width)
+        finally:
+            self.gCanvas = canvas
+
+
     def drawRing(self, s):
         x2 = self.centerx
         y2 = self.centery
@@ -166,49 +205,65 @@ class Hodo:
         x2, y2 = self.hodo2Pix(dir, spd)
         lasth = prof.gSndg[prof.sfc][prof.zind]
         color = self.hcolor[1]
+        segs = []
+        marks = []
         xs = []
         ys = []
         ts = []
-        for i in range(prof.gNumLevels):
+
+        # Winds at each km AGL, and the heights (msl) at which they lie
+        markers = prof.hghtMarkers(len(self.hcolor) * 1000.)
+        mhghts = [h + lasth for h, p, u, v in markers]
+
+        for i in prof.validLevels(prof.uind):
             h = prof.gSndg[i][prof.zind]
             if lasth > self.hodotop: break
-            if QC(prof.gSndg[i][prof.uind]):
+            x1 = x2
+            y1 = y2
+            for k in range(bisect.bisect_left(mhghts, lasth),
+                bisect.bisect_right(mhghts, h)):
+                hcheck, p, u, v = markers[k]
+                zz = int(round(hcheck / 1000.))
+                dir, spd = tab.vector.comp2vec(u, -v)
+                x2, y2 = self.hodo2Pix(dir, spd)
+                segs.append((x1, y1, x2, y2))
+                marks.append((x2, y2))
+                if not self.polylines: self.__flush(segs, marks, color,
+                    width)
+                xs.append(x2+2)
+                ys.append(y2+2)
+                ts.append(zz)
+                if self.hcolor[zz] != color:
+                    self.__flush(segs, [], color, width)
+                color = self.hcolor[zz]
+
+            h = prof.gSndg[i][prof.zind]
+            if (h < self.hodotop):
                 x1 = x2
                 y1 = y2
-                for z in range(20):
-                    hcheck = (z+1) * 1000
-                    if ((lasth <= hcheck) and (h >= hcheck)):
-                        zz = z+1
-                        p = tab.interp.pres(hcheck, prof)
-                        # print p
-                        u, v = tab.interp.components(p, prof)
-                        dir, spd = tab.vector.comp2vec(u, -v)
-                        x2, y2 = self.hodo2Pix(dir, spd)
-                        self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-                            width=width)
-                        self.gCanvas.create_rectangle(x2-2,y2-2,x2+2,y2+2,
-                            fill=self.acolor)
-                        xs.append(x2+2)
-                        ys.append(y2+2)
-                        ts.append(zz)
-                        color = self.hcolor[z+1]
-
-                h = prof.gSndg[i][prof.zind]
-                if (h < self.hodotop):
-                    x1 = x2
-                    y1 = y2
-                    dir, spd = tab.vector.comp2vec(prof.gSndg[i][prof.uind],
-                        -prof.gSndg[i][prof.vind])
-                    x2, y2 = self.hodo2Pix(dir, spd)
-                    self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-                        width=width)
-                lasth = h
+                dir, spd = tab.vector.comp2vec(prof.gSndg[i][prof.uind],
+                    -prof.gSndg[i][prof.vind])
+                x2, y2 = self.hodo2Pix(dir, spd)
+                segs.append((x1, y1, x2, y2))
+                if not self.polylines: self.__flush(segs, [], color, width)
+            lasth = h
+        self.__flush(segs, marks, color, width)
 
         for x,y,z in zip(xs, ys, ts):
             self.gCanvas.create_text(x, y, fill=self.acolor,
                 text=z, anchor='nw', font=font)
 
 
+    def __flush(self, segs, marks, color, width):
+        ''' Draw (and empty) the pending trace segments and km markers '''
+        draw_lines(self.gCanvas, segs, self.polylines, fill=color,
+            width=width)
+        for x, y in marks:
+            self.gCanvas.create_rectangle(x-2,y-2,x+2,y+2, fill=self.acolor)
+        del segs[:]
+        del marks[:]
+
+
     def centerHodo(self, prof):
         minu, maxu = self.findMinMax(prof, prof.uind)
         minv, maxv = self.findMinMax(prof, prof.vind)
@@ -225,8 +280,7 @@ class Hodo:
     def findMinMax(self, prof, ind):
         maxval = 0
         minval = 0
-        for i in range(prof.gNumLevels):
-            if not QC(prof.gSndg[i][ind]): continue
+        for i in prof.validLevels(ind):
             if prof.gSndg[i][prof.zind] > self.hodotop: break
             if maxval < prof.gSndg[i][ind]: maxval = prof.gSndg[i][ind]
             if minval > prof.gSndg[i][ind]: minval = prof.gSndg[i][ind]
@@ -0,0 +1,465 @@
+''' Streaming Ingest of Sounding Files '''
+import os
+import sys
+import math
+import time
+import json
+import signal
+import fnmatch
+import optparse
+import tempfile
+import threading
+import collections
+import multiprocessing
+import Queue
+from sharppy import store
+from sharppy.sharptab import profile, sheet
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+
+
+__all__ = ['Ingester', 'Metrics', 'JSONLinesSink', 'STAGES', 'analyze']
+
+
+# Stages timed for every sounding; 'total' runs from finding the file to
+# writing its results
+STAGES = ['queue', 'read', 'parse', 'compute', 'write', 'total']
+
+_timer = time.time
+
+
+class Metrics(object):
+    '''
+    Latency statistics of the stages of a pipeline, and event counters.
+    Counts, means and maxima cover every sample; percentiles are computed
+    over the most recent window samples of each stage. Safe to update from
+    several threads.
+
+    window : int
+        Number of recent samples kept per stage
+    '''
+    def __init__(self, window=1024):
+        self.window = window
+        self.counts = {}
+        self.totals = {}
+        self.maxima = {}
+        self.samples = {}
+        self.counters = {}
+        self.started = _timer()
+        self.__lock = threading.Lock()
+
+
+    def add(self, stage, elapsed):
+        ''' Record a duration (s) for a stage '''
+        with self.__lock:
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            self.totals[stage] = self.totals.get(stage, 0.) + elapsed
+            self.maxima[stage] = max(self.maxima.get(stage, 0.), elapsed)
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = \
+                    collections.deque(maxlen=self.window)
+            samples.append(elapsed)
+
+
+    def count(self, name, n=1):
+        ''' Increment an event counter '''
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def percentile(self, stage, q):
+        ''' The q-th percentile (0-100) of the recent samples of a stage '''
+        with self.__lock:
+            samples = sorted(self.samples.get(stage, ()))
+        if not samples: return None
+        rank = int(math.ceil(q / 100. * len(samples)))
+        return samples[min(max(rank, 1), len(samples)) - 1]
+
+
+    def summary(self):
+        '''
+        Returns the statistics as a dictionary of plain types, suitable for
+        serializing as JSON. Times are in seconds.
+        '''
+        stages = {}
+        for stage in self.counts.keys():
+            stages[stage] = {'count': self.counts[stage],
+                'mean': self.totals[stage] / self.counts[stage],
+                'max': self.maxima[stage],
+                'p50': self.percentile(stage, 50),
+                'p95': self.percentile(stage, 95),
+                'p99': self.percentile(stage, 99)}
+        return {'uptime': _timer() - self.started, 'stages': stages,
+            'counters': dict(self.counters)}
+
+
+    def report(self):
+        ''' Returns a table of the stage latencies (ms) and the counters '''
+        summary = self.summary()
+        lines = ['%-10s %8s %10s %10s %10s %10s' % ('stage', 'count', 'mean',
+            'p50', 'p95', 'max')]
+        names = [stage for stage in STAGES if stage in summary['stages']]
+        names += sorted(set(summary['stages']) - set(STAGES))
+        for stage in names:
+            st = summary['stages'][stage]
+            lines.append('%-10s %8d %10.2f %10.2f %10.2f %10.2f' % (stage,
+                st['count'], st['mean'] * 1000., st['p50'] * 1000.,
+                st['p95'] * 1000., st['max'] * 1000.))
+        for name in sorted(summary['counters']):
+            lines.append('%-10s %8d' % (name, summary['counters'][name]))
+        return '\n'.join(lines)
+
+
+class JSONLinesSink(object):
+    '''
+    Appends records to a file as one JSON object per line. Lines are
+    flushed to disk whenever the pipeline runs out of pending results.
+
+    fname : string
+        File to append to ('-' for standard output)
+    '''
+    def __init__(self, fname):
+        self.fname = fname
+        if fname == '-': self.file = sys.stdout
+        else: self.file = open(fname, 'a')
+
+
+    def write(self, record):
+        self.file.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+    def flush(self):
+        self.file.flush()
+
+
+    def close(self):
+        self.flush()
+        if self.file is not sys.stdout: self.file.close()
+
+
+def analyze(text, fields=None):
+    '''
+    Parses an SPC-format sounding and computes its parameter sheet
+
+    Inputs
+    ------
+        text        (string)                SPC-format sounding text
+        fields      (list; optional)        Names of sheet fields
+
+    Returns
+    -------
+        (station, date, scalars, parse time, compute time) tuple, where
+        scalars is a list of (name, value) pairs (see sheet.scalars)
+    '''
+    start = _timer()
+    prof = profile.Profile(text=text)
+    parsed = _timer()
+    results = sheet.compute(prof, fields)
+    return (prof.gStation.strip(), prof.gDate.strip(), sheet.scalars(results),
+        parsed - start, _timer() - parsed)
+
+
+def _init_worker():
+    # Leave interrupts to the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Ingester(object):
+    '''
+    Watches a spool directory and analyzes soundings as they arrive.
+
+    Each scan of the directory queues the files that are new or have
+    changed (by modification time and size) since they were last queued,
+    once they have not been modified for settle seconds. Worker threads
+    read the queued files and hand them to a pool of worker processes,
+    which parse them and compute the parameter sheet (see analyze); a
+    writer thread appends one record per sounding to the sink. The queues
+    between the stages are bounded, so a slow sink or pool holds back the
+    scanner instead of accumulating work in memory.
+
+    The directory is rescanned every interval seconds, or as soon as a
+    file changes if the watchdog package is available. Per-stage latencies
+    and counters are kept in self.metrics.
+
+    spool : string
+        Directory to watch
+    sink : object
+        Output with a write(record) method (and optionally flush()); a
+        record is a dictionary of the file name, its modification time,
+        the station, the date and the scalar fields of the sheet
+    fields : list
+        Names of sheet fields to compute [default: sheet.FIELDS]
+    workers : int
+        Number of soundings analyzed at once (default: one per CPU; 1
+        analyzes in this process)
+    statefile : string
+        JSON file remembering the files already written across restarts
+
+    Usage
+    -----
+        sink = JSONLinesSink('results.jsonl')
+        Ingester('/data/spool', sink, interval=10.).run()
+    '''
+    def __init__(self, spool, sink, fields=None, workers=None, interval=5.,
+        **kwargs):
+        self.spool = spool
+        self.sink = sink
+        self.fields = fields
+        self.workers = workers or multiprocessing.cpu_count()
+        self.interval = interval
+        self.pattern = kwargs.get('pattern', '*')
+        self.settle = kwargs.get('settle', 1.)
+        self.statefile = kwargs.get('statefile')
+        self.events = kwargs.get('events', True)
+        self.metrics = kwargs.get('metrics', Metrics())
+        self.errors = collections.deque(maxlen=100)
+        queuesize = kwargs.get('queuesize', 4 * self.workers)
+        self.pending = Queue.Queue(queuesize)
+        self.results = Queue.Queue(queuesize)
+        self.done = self.load()
+        self.seen = dict(self.done)
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__stopping = False
+        self.__threads = []
+        self.__writer = None
+        self.__pool = None
+        self.__observer = None
+
+
+    def load(self):
+        ''' Returns the written files recorded in the state file '''
+        if not self.statefile: return {}
+        try:
+            f = open(self.statefile)
+        except IOError:
+            return {}
+        try:
+            state = json.load(f)
+        except ValueError:
+            return {}
+        finally:
+            f.close()
+        return dict([(fname, tuple(sig)) for fname, sig in state.items()])
+
+
+    def save(self):
+        ''' Write the files written so far to the state file '''
+        if not self.statefile: return
+        with self.__lock:
+            state = dict(self.done)
+        dirname = os.path.dirname(os.path.abspath(self.statefile))
+        fd, tmpname = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(state, f)
+        finally:
+            f.close()
+        os.rename(tmpname, self.statefile)
+
+
+    def scan(self):
+        '''
+        Queue the new and changed files in the spool directory. Blocks
+        while the queue is full.
+
+        Returns
+        -------
+            Number of files waiting to settle
+        '''
+        now = time.time()
+        unsettled = 0
+        names = set()
+        for name in sorted(os.listdir(self.spool)):
+            if name.startswith('.') or not fnmatch.fnmatch(name, self.pattern):
+                continue
+            fname = os.path.join(self.spool, name)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            if not os.path.isfile(fname): continue
+            names.add(fname)
+            sig = (st.st_mtime, st.st_size)
+            if self.seen.get(fname) == sig: continue
+            if now - st.st_mtime < self.settle:
+                unsettled += 1
+                continue
+            if self.__stopping: break
+            self.seen[fname] = sig
+            self.metrics.count('queued')
+            self.pending.put((fname, sig, _timer()))
+        else:
+            # Forget removed files, so that they are analyzed if they return
+            for fname in self.seen.keys():
+                if fname not in names: del self.seen[fname]
+        return unsettled
+
+
+    def start(self):
+        ''' Start the worker threads, the process pool and the watcher '''
+        if self.workers > 1:
+            self.__pool = multiprocessing.Pool(self.workers, _init_worker)
+        self.__threads = [threading.Thread(target=self.__work)
+            for i in range(self.workers)]
+        self.__writer = threading.Thread(target=self.__write)
+        for thread in self.__threads + [self.__writer]:
+            thread.daemon = True
+            thread.start()
+        if self.events and Observer is not None:
+            handler = FileSystemEventHandler()
+            handler.on_any_event = lambda event: self.__wake.set()
+            self.__observer = Observer()
+            self.__observer.schedule(handler, self.spool, recursive=False)
+            self.__observer.start()
+
+
+    def run(self, once=False):
+        '''
+        Watch the spool directory until stop() is called (or, if once is
+        set, analyze the files present and return)
+        '''
+        self.start()
+        try:
+            while not self.__stopping:
+                unsettled = self.scan()
+                if once and not unsettled: break
+                delay = self.interval
+                if unsettled: delay = min(delay, self.settle)
+                self.__wake.wait(delay)
+                self.__wake.clear()
+        finally:
+            self.__shutdown()
+
+
+    def stop(self):
+        ''' Ask run() to finish the files already queued and return '''
+        self.__stopping = True
+        self.__wake.set()
+
+
+    def __shutdown(self):
+        if self.__observer is not None:
+            self.__observer.stop()
+            self.__observer.join()
+            self.__observer = None
+        for thread in self.__threads: self.pending.put(None)
+        for thread in self.__threads: thread.join()
+        self.results.put(None)
+        self.__writer.join()
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+        self.save()
+
+
+    def __work(self):
+        while True:
+            job = self.pending.get()
+            if job is None: break
+            fname, sig, queued = job
+            start = _timer()
+            self.metrics.add('queue', start - queued)
+            try:
+                f = open(fname)
+                try:
+                    text = f.read().decode('utf-8', 'replace')
+                finally:
+                    f.close()
+                read = _timer()
+                self.metrics.add('read', read - start)
+                if self.__pool is None: out = analyze(text, self.fields)
+                else: out = self.__pool.apply(analyze, (text, self.fields))
+            except Exception, e:
+                self.__error(fname, e)
+                continue
+            station, date, scalars, parse, compute = out
+            self.metrics.add('parse', parse)
+            self.metrics.add('compute', compute)
+            record = {'file': fname, 'mtime': sig[0], 'station': station,
+                'date': date}
+            record.update(scalars)
+            self.results.put((fname, sig, queued, record))
+
+
+    def __write(self):
+        while True:
+            job = self.results.get()
+            if job is None: break
+            fname, sig, queued, record = job
+            start = _timer()
+            try:
+                self.sink.write(record)
+                if self.results.empty() and hasattr(self.sink, 'flush'):
+                    self.sink.flush()
+            except Exception, e:
+                self.__error(fname, e)
+                continue
+            end = _timer()
+            self.metrics.add('write', end - start)
+            self.metrics.add('total', end - queued)
+            self.metrics.count('written')
+            with self.__lock:
+                self.done[fname] = sig
+
+
+    def __error(self, fname, e):
+        self.metrics.count('errors')
+        self.errors.append((fname, '%s: %s' % (type(e).__name__, e)))
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] spool-directory output.(jsonl|db)')
+    parser.add_option('-f', '--fields', default='',
+        help='comma-separated sheet fields [default: all]')
+    parser.add_option('-w', '--workers', type='int', default=None,
+        help='soundings analyzed at once [default: one per CPU]')
+    parser.add_option('-i', '--interval', type='float', default=5.,
+        help='seconds between scans [default: %default]')
+    parser.add_option('-p', '--pattern', default='*',
+        help='file name pattern [default: %default]')
+    parser.add_option('-s', '--state', default=None,
+        help='JSON file remembering the files already analyzed')
+    parser.add_option('--once', action='store_true', default=False,
+        help='analyze the files present and exit')
+    parser.add_option('-q', '--quiet', action='store_true', default=False)
+    opts, args = parser.parse_args(argv)
+    if len(args) != 2: parser.error('expected a spool directory and output')
+
+    fields = [name for name in opts.fields.split(',') if name] or None
+    if os.path.splitext(args[1])[1] in ('.db', '.sqlite'):
+        columns = None
+        if fields is not None:
+            columns = [name for name in fields if name in sheet.SCALARS]
+            if not columns:
+                parser.error('no scalar fields to store (e.g. mucape)')
+        sink = store.ParameterStore(args[1], columns)
+    else:
+        sink = JSONLinesSink(args[1])
+    ingester = Ingester(args[0], sink, fields, opts.workers, opts.interval,
+        pattern=opts.pattern, statefile=opts.state)
+    try:
+        ingester.run(opts.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+    if not opts.quiet:
+        sys.stderr.write(ingester.metrics.report() + '\n')
+        for fname, error in ingester.errors:
+            sys.stderr.write('%s: %s\n' % (fname, error))
+        if getattr(sink, 'skipped', 0):
+            sys.stderr.write('%d soundings without a station or valid time '
+                'were not stored\n' % sink.skipped)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,397 @@
+''' Local HTTP/JSON Analysis Service '''
+import sys
+import time
+import json
+import signal
+import urlparse
+import optparse
+import threading
+import multiprocessing
+import Queue
+import BaseHTTPServer
+import SocketServer
+from sharppy.ingest import Metrics
+from sharppy.sharptab import profile, sheet
+
+
+__all__ = ['Service', 'analyze', 'load']
+
+
+# Columns of a sounding posted as a JSON object of arrays
+COLUMNS = ['pres', 'hght', 'temp', 'dwpt']
+WIND_COLUMNS = [('wdir', 'wspd'), ('ucomp', 'vcomp')]
+
+# Largest request body accepted (bytes)
+MAXBODY = 8 * 1024 * 1024
+
+_timer = time.time
+
+
+def load(data):
+    '''
+    Creates a profile from posted sounding data: SPC-format text, or a JSON
+    object with 'pres', 'hght', 'temp' and 'dwpt' arrays and either 'wdir'
+    and 'wspd' or 'ucomp' and 'vcomp' arrays (and optionally 'stn' and
+    'date'), or a JSON object with the SPC-format text as 'text'. Raises
+    ValueError for malformed data.
+
+    Inputs
+    ------
+        data        (string)                Request body
+
+    Returns
+    -------
+        Profile object
+    '''
+    if data.lstrip().startswith('{'):
+        obj = json.loads(data)
+        if not isinstance(obj, dict): raise ValueError('expected an object')
+        if 'text' in obj:
+            prof = profile.Profile(text=obj['text'])
+        else:
+            kwargs = {}
+            for wind in WIND_COLUMNS:
+                if wind[0] in obj: break
+            for name in COLUMNS + list(wind):
+                if not isinstance(obj.get(name), list):
+                    raise ValueError('missing array %r' % name)
+                if len(obj[name]) != len(obj['pres']):
+                    raise ValueError('arrays of different lengths')
+                kwargs[name] = obj[name]
+            for name in ('stn', 'date'):
+                if name in obj: kwargs[name] = obj[name]
+            prof = profile.Profile(**kwargs)
+    else:
+        prof = profile.Profile(text=data.decode('utf-8', 'replace'))
+    if prof.gNumLevels < 2: raise ValueError('no sounding data')
+    return prof
+
+
+def analyze(prof, fields=None):
+    '''
+    Computes the parameter sheet of a profile, in a form that can be
+    serialized as JSON
+
+    Inputs
+    ------
+        prof        (profile object)        Profile Object (or posted
+                                            sounding data, see load)
+        fields      (list; optional)        Names of sheet fields
+
+    Returns
+    -------
+        Dictionary with the station, the date, the parcels (as dictionaries
+        of their fields; None where the parcel could not be lifted) and the
+        other parameters of the sheet
+    '''
+    if isinstance(prof, basestring): prof = load(prof)
+    parcels = {}
+    parameters = {}
+    for name, value in sheet.compute(prof, fields).items():
+        if name in sheet.PARCELS:
+            if hasattr(value, 'as_dict'): parcels[name] = value.as_dict()
+            else: parcels[name] = None
+        elif isinstance(value, (int, long, float)):
+            parameters[name] = value
+    return {'station': prof.gStation.strip(), 'date': prof.gDate.strip(),
+        'parcels': parcels, 'parameters': parameters}
+
+
+def _analyze_batch(jobs):
+    # Runs in a worker: (data, fields) pairs -> (status, JSON body, elapsed)
+    out = []
+    for data, fields in jobs:
+        start = _timer()
+        try:
+            prof = load(data)
+        except Exception, e:
+            out.append((400, _error(e), _timer() - start))
+            continue
+        try:
+            body = json.dumps(analyze(prof, fields))
+            out.append((200, body, _timer() - start))
+        except Exception, e:
+            out.append((500, _error(e), _timer() - start))
+    return out
+
+
+def _error(e):
+    return json.dumps({'error': '%s: %s' % (type(e).__name__, e)})
+
+
+def _init_worker():
+    # Leave interrupts to the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class _Request(object):
+    __slots__ = ('data', 'fields', 'queued', 'done', 'status', 'body')
+
+    def __init__(self, data, fields):
+        self.data = data
+        self.fields = fields
+        self.queued = _timer()
+        self.done = threading.Event()
+        self.status = None
+        self.body = None
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        service = self.server.owner
+        path = urlparse.urlsplit(self.path).path
+        if path == '/stats':
+            return self.__reply(200, json.dumps(service.stats()))
+        if path == '/health':
+            return self.__reply(200, json.dumps({'status': 'ok'}))
+        return self.__reply(404, json.dumps({'error': 'not found'}))
+
+    def do_POST(self):
+        service = self.server.owner
+        parts = urlparse.urlsplit(self.path)
+        if parts.path != '/analyze':
+            return self.__reply(404, json.dumps({'error': 'not found'}))
+        try:
+            length = int(self.headers.getheader('content-length'))
+        except (TypeError, ValueError):
+            self.close_connection = 1
+            return self.__reply(411, json.dumps({'error': 'length required'}))
+        if length > MAXBODY:
+            self.close_connection = 1
+            return self.__reply(413, json.dumps({'error': 'too large'}))
+        data = self.rfile.read(length)
+        fields = urlparse.parse_qs(parts.query).get('fields')
+        if fields:
+            fields = [name for name in ','.join(fields).split(',') if name]
+            unknown = [name for name in fields if name not in sheet.NAMES]
+            if unknown:
+                return self.__reply(400, json.dumps({'error':
+                    'unknown fields: %s' % ', '.join(unknown)}))
+        status, body = service.submit(data, fields or None)
+        return self.__reply(status, body)
+
+    def __reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Service(object):
+    '''
+    A local HTTP server computing parameter sheets, so that tools can
+    analyze soundings without starting Python and importing SHARPpy for
+    every one.
+
+        POST /analyze[?fields=a,b]  Sounding data (see load); returns the
+                                    sheet as JSON (see analyze)
+        GET /stats                  Request counts and latency percentiles
+        GET /health                 {"status": "ok"}
+
+    Requests are handled by one thread each, and queued for a dispatcher
+    which hands them to a pool of worker processes in batches: as soon as
+    a worker is free, the requests that have queued up while the workers
+    were busy, and those arriving within batchwait seconds, are computed
+    in a single call to the pool (up to batchsize of them). A lightly
+    loaded service thus answers each request on its own, while under load
+    the cost of passing work to the pool is shared by many requests.
+
+    workers : int
+        Number of worker processes (default: one per CPU; 1 computes in
+        the dispatcher thread)
+    batchsize : int
+        Largest number of requests in a batch
+    batchwait : float
+        Time (s) to wait for further requests to join a batch
+    timeout : float
+        Time (s) after which a request is answered with a 504 error
+
+    Usage
+    -----
+        with Service(port=8642) as service:
+            ...
+    '''
+    def __init__(self, host='127.0.0.1', port=0, workers=None, batchsize=16,
+        batchwait=0.002, timeout=60.):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batchsize = batchsize
+        self.batchwait = batchwait
+        self.timeout = timeout
+        self.metrics = Metrics()
+        self.httpd = _ThreadedServer((host, port), _Handler)
+        self.httpd.owner = self
+        self.host, self.port = self.httpd.server_address[:2]
+        self.__queue = Queue.Queue()
+        self.__slots = threading.BoundedSemaphore(self.workers)
+        self.__pool = None
+        self.__threads = []
+
+
+    def url(self, path='/'):
+        return 'http://%s:%d%s' % (self.host, self.port, path)
+
+
+    def start(self):
+        ''' Start the worker pool, the dispatcher and the server threads '''
+        if self.workers > 1:
+            self.__pool = multiprocessing.Pool(self.workers, _init_worker)
+        self.__threads = [threading.Thread(target=self.__dispatch),
+            threading.Thread(target=self.httpd.serve_forever)]
+        for thread in self.__threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.__queue.put(None)
+        for thread in self.__threads: thread.join()
+        self.__threads = []
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+
+    def serve_forever(self):
+        ''' Serve until interrupted '''
+        self.start()
+        try:
+            while True: self.__threads[0].join(3600.)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def submit(self, data, fields=None):
+        '''
+        Analyze sounding data (see load) in the next batch and wait for the
+        result
+
+        Inputs
+        ------
+            data        (string)            Sounding data
+            fields      (list; optional)    Names of sheet fields
+
+        Returns
+        -------
+            (HTTP status, JSON body) tuple
+        '''
+        req = _Request(data, fields)
+        self.__queue.put(req)
+        if req.done.wait(self.timeout):
+            status, body = req.status, req.body
+        else:
+            # The result may still arrive, and is then left on req
+            status, body = 504, json.dumps({'error': 'timed out'})
+        self.metrics.add('total', _timer() - req.queued)
+        self.metrics.count('requests')
+        if status >= 400: self.metrics.count('errors')
+        return status, body
+
+
+    def stats(self):
+        '''
+        Returns the service statistics: latencies (s) of the queue, compute
+        and total stages with their percentiles, the request, error and
+        batch counters, and the current queue length
+        '''
+        stats = self.metrics.summary()
+        counters = stats['counters']
+        stats.update({'workers': self.workers, 'batchsize': self.batchsize,
+            'queued': self.__queue.qsize(),
+            'meanbatch': float(counters.get('batched', 0)) /
+                max(counters.get('batches', 0), 1)})
+        return stats
+
+
+    def __dispatch(self):
+        stopping = False
+        while not stopping:
+            req = self.__queue.get()
+            if req is None: break
+            # Wait for a free worker; requests arriving meanwhile join
+            # this batch
+            self.__slots.acquire()
+            batch = [req]
+            deadline = _timer() + self.batchwait
+            while len(batch) < self.batchsize:
+                try:
+                    req = self.__queue.get(True,
+                        max(deadline - _timer(), 0.))
+                except Queue.Empty:
+                    break
+                if req is None:
+                    stopping = True
+                    break
+                batch.append(req)
+            self.__submit(batch)
+
+
+    def __submit(self, batch):
+        start = _timer()
+        for req in batch: self.metrics.add('queue', start - req.queued)
+        self.metrics.count('batches')
+        self.metrics.count('batched', len(batch))
+        jobs = [(req.data, req.fields) for req in batch]
+        if self.__pool is None:
+            self.__finish(batch, _analyze_batch(jobs))
+        else:
+            self.__pool.apply_async(_analyze_batch, (jobs,),
+                callback=lambda out: self.__finish(batch, out))
+
+
+    def __finish(self, batch, out):
+        for req, (status, body, elapsed) in zip(batch, out):
+            self.metrics.add('compute', elapsed)
+            req.status = status
+            req.body = body
+            req.done.set()
+        self.__slots.release()
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-H', '--host', default='127.0.0.1',
+        help='address to listen on [default: %default]')
+    parser.add_option('-p', '--port', type='int', default=8642,
+        help='port to listen on [default: %default]')
+    parser.add_option('-w', '--workers', type='int', default=None,
+        help='worker processes [default: one per CPU]')
+    parser.add_option('-b', '--batchsize', type='int', default=16,
+        help='largest batch of requests [default: %default]')
+    parser.add_option('-t', '--batchwait', type='float', default=0.002,
+        help='seconds to wait for a batch to fill [default: %default]')
+    opts, args = parser.parse_args(argv)
+
+    service = Service(opts.host, opts.port, opts.workers, opts.batchsize,
+        opts.batchwait)
+    sys.stderr.write('Serving on %s\n' % service.url())
+    service.serve_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
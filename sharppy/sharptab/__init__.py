@@ -6,6 +6,9 @@ import thermo
 import winds
 import params
 import indices
+import sheet
+import instrument
+import sensitivity
 
 __all__ = ['constants', 'thermo', 'profile', 'vector', 'winds', 'interp',
-           'params', 'indices']
\ No newline at end of file
+           'params', 'indices', 'sheet', 'instrument', 'sensitivity']
\ No newline at end of file
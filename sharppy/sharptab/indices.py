@@ -39,7 +39,13 @@ def scp(prof, **kwargs):
     cape = mupcl.bplus
     elhght = mupcl.elhght
     if not QC(cape): return RMISSD
-    rstu, rstv = params.bunkers_storm_motion(prof, mupcl=mupcl)[:2]
+
+    # If storm motion provided, use it, otherwise compute Bunkers motion
+    if 'stu' in kwargs and 'stv' in kwargs:
+        rstu = kwargs.get('stu')
+        rstv = kwargs.get('stv')
+    else:
+        rstu, rstv = params.bunkers_storm_motion(prof, mupcl=mupcl)[:2]
     if cape < 100. or elhght < 0.:
         base = 0.
         ztop = 6000.
@@ -0,0 +1,221 @@
+''' Call Counters and Timers for the sharptab Routines '''
+import time
+import types
+import threading
+from sharppy.sharptab import interp, vector, thermo, winds, params, indices
+
+__all__ = ['Recorder', 'record', 'enable', 'disable', 'enabled']
+
+
+# Modules whose public functions are instrumented
+MODULES = [interp, vector, thermo, winds, params, indices]
+
+# Functions with an implementation that also returns an iteration count:
+# name -> (module, name of implementation returning (value, iterations))
+COUNTED = {
+    'thermo.satlift': (thermo, '_satlift'),
+}
+
+_timer = time.time
+_lock = threading.Lock()
+_local = threading.local()
+_originals = {}
+_users = 0
+
+
+class Recorder(object):
+    '''
+    Call statistics gathered while a record() scope is active.
+
+    For every instrumented function the number of calls, the cumulative
+    (inclusive) time and, where available, the number of iterations is
+    kept, together with a histogram of the iteration counts. The number of
+    calls made from each instrumented caller is also counted, e.g. how many
+    times parcelx calls interp_from_pres.
+    '''
+    def __init__(self, label=None):
+        self.label = label
+        self.calls = {}
+        self.time = {}
+        self.iterations = {}
+        self.histograms = {}
+        self.edges = {}
+        self.elapsed = 0.
+
+
+    def add(self, name, caller, elapsed, niter=None):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.time[name] = self.time.get(name, 0.) + elapsed
+        if niter is not None:
+            self.iterations[name] = self.iterations.get(name, 0) + niter
+            hist = self.histograms.setdefault(name, {})
+            hist[niter] = hist.get(niter, 0) + 1
+        if caller is not None:
+            edge = (caller, name)
+            self.edges[edge] = self.edges.get(edge, 0) + 1
+
+
+    def dump(self):
+        '''
+        Returns the statistics as a dictionary of plain types, suitable for
+        serializing as JSON. Times are in seconds.
+        '''
+        funcs = {}
+        for name in self.calls:
+            funcs[name] = {'calls': self.calls[name], 'time': self.time[name]}
+            if name in self.iterations:
+                funcs[name]['iterations'] = self.iterations[name]
+                funcs[name]['histogram'] = dict([(str(niter), count)
+                    for niter, count in self.histograms[name].items()])
+        callers = {}
+        for (caller, name), count in self.edges.items():
+            callers.setdefault(name, {})[caller] = count
+        return {'label': self.label, 'elapsed': self.elapsed,
+            'functions': funcs, 'callers': callers}
+
+
+    def report(self, limit=None):
+        '''
+        Returns a summary table of the functions called, most expensive
+        (inclusive time) first
+
+        Inputs
+        ------
+            limit       (int; optional)     Maximum number of functions
+
+        Returns
+        -------
+            Report (string)
+        '''
+        names = sorted(self.calls, key=lambda name: -self.time[name])
+        if limit: names = names[:limit]
+        lines = []
+        if self.label is not None: lines.append(str(self.label))
+        lines.append('elapsed %.3f ms' % (self.elapsed * 1000.))
+        lines.append('%-36s %10s %12s %12s %10s' % ('function', 'calls',
+            'total (ms)', 'per call (us)', 'iter/call'))
+        for name in names:
+            calls = self.calls[name]
+            if name in self.iterations:
+                niter = '%10.2f' % (self.iterations[name] / float(calls))
+            else:
+                niter = '%10s' % '-'
+            lines.append('%-36s %10d %12.3f %12.2f %s' % (name, calls,
+                self.time[name] * 1000., self.time[name] * 1e6 / calls, niter))
+        for name in sorted(self.histograms):
+            lines.append('')
+            lines.append('%s iterations' % name)
+            total = float(self.calls[name])
+            for niter, count in sorted(self.histograms[name].items()):
+                lines.append('%6d %10d %6.1f%%' % (niter, count,
+                    count / total * 100.))
+        return '\n'.join(lines)
+
+
+class record(object):
+    '''
+    Context manager recording calls made to the sharptab routines within
+    its scope. Instrumentation is switched on while at least one scope is
+    active in any thread. Scopes may be nested (e.g. one per profile inside
+    one per batch); every active scope in the current thread sees each call.
+
+    Usage
+    -----
+        with record('OUN') as rec:
+            sheet.compute(prof)
+        print rec.report()
+    '''
+    def __init__(self, label=None):
+        self.recorder = Recorder(label)
+
+
+    def __enter__(self):
+        enable()
+        _stack().append(self.recorder)
+        self.start = _timer()
+        return self.recorder
+
+
+    def __exit__(self, *args):
+        self.recorder.elapsed += _timer() - self.start
+        _stack().remove(self.recorder)
+        disable()
+
+
+def enabled():
+    ''' Whether the sharptab functions are currently instrumented '''
+    return _users > 0
+
+
+def enable():
+    '''
+    Replace the public functions of the sharptab modules with instrumented
+    versions. Calls nest: each call must be matched by a call to disable().
+    '''
+    global _users
+    with _lock:
+        _users += 1
+        if _users > 1: return
+        for module in MODULES:
+            prefix = module.__name__.rsplit('.', 1)[-1]
+            for attr, func in vars(module).items():
+                if attr.startswith('_') or \
+                   not isinstance(func, types.FunctionType) or \
+                   func.__module__ != module.__name__:
+                    continue
+                name = '%s.%s' % (prefix, attr)
+                _originals[(module, attr)] = func
+                setattr(module, attr, _wrap(name, func))
+
+
+def disable():
+    ''' Restore the original functions once no user needs instrumentation '''
+    global _users
+    with _lock:
+        if _users == 0: return
+        _users -= 1
+        if _users > 0: return
+        for (module, attr), func in _originals.items():
+            setattr(module, attr, func)
+        _originals.clear()
+
+
+def _stack():
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        _local.names = []
+        return _local.stack
+
+
+def _wrap(name, func):
+    if name in COUNTED:
+        module, attr = COUNTED[name]
+        impl = getattr(module, attr)
+    else:
+        impl = None
+
+    def wrapper(*args, **kwargs):
+        stack = _stack()
+        if not stack: return func(*args, **kwargs)
+        names = _local.names
+        if names: caller = names[-1]
+        else: caller = None
+        names.append(name)
+        niter = None
+        start = _timer()
+        try:
+            if impl is None:
+                return func(*args, **kwargs)
+            value, niter = impl(*args, **kwargs)
+            return value
+        finally:
+            elapsed = _timer() - start
+            names.pop()
+            for rec in stack: rec.add(name, caller, elapsed, niter)
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
@@ -1,13 +1,20 @@
 ''' Interpolation Routines '''
 import math
+import bisect
 from sharppy.sharptab import vector
 from sharppy.sharptab import thermo
 from sharppy.sharptab.constants import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 
 __all__ = ['i_pres', 'i_hght', 'i_temp', 'i_dwpt', 'i_vec', 'i_vtmp',
-           'interp_from_pres', 'interp_from_hght', 'agl', 'msl']
+           'interp_from_pres', 'interp_from_hght', 'interp_from_pres_array',
+           'interp_from_hght_array', 'agl', 'msl']
 
 
 def pres(h, prof):
@@ -148,21 +155,22 @@ def interp_from_hght(h, prof, ind):
         Interpolated variable
     '''
     if not QC(h): return RMISSD
-    tptr = -1
-    bptr = 0
-    for i in range(prof.gNumLevels):
-        if not QC(prof.gSndg[i][ind]): continue
-        if prof.gSndg[i][prof.zind] < h:
-            bptr = i
-        elif math.fabs(h - prof.gSndg[i][prof.zind]) < TOL:
-            return prof.gSndg[i][ind]
-        else:
-            tptr = i
-            nm1 = h - prof.gSndg[bptr][prof.zind]
-            nm2 = prof.gSndg[tptr][prof.zind] - prof.gSndg[bptr][prof.zind]
-            val = prof.gSndg[bptr][ind] + ((nm1 / nm2) * \
-                (prof.gSndg[tptr][ind] - prof.gSndg[bptr][ind]))
-            return val
+    levels, hghts = prof.hghtCoords(ind)
+
+    # First valid level at or above the given height
+    k = bisect.bisect_left(hghts, h)
+    if k < len(levels):
+        tptr = levels[k]
+        if math.fabs(h - hghts[k]) < TOL: return prof.gSndg[tptr][ind]
+        if k > 0: bptr = levels[k-1]
+        else: bptr = 0
+        # Python floats, so that a zero-thickness layer raises for NumPy
+        # profiles as it does for lists
+        nm1 = float(h - prof.gSndg[bptr][prof.zind])
+        nm2 = float(prof.gSndg[tptr][prof.zind] - prof.gSndg[bptr][prof.zind])
+        val = prof.gSndg[bptr][ind] + ((nm1 / nm2) * \
+            (prof.gSndg[tptr][ind] - prof.gSndg[bptr][ind]))
+        return val
 
 
 def interp_from_pres(p, prof, ind):
@@ -180,21 +188,85 @@ def interp_from_pres(p, prof, ind):
         Interpolated variable
     '''
     if not QC(p): return RMISSD
-    tptr = -1
-    bptr = 0
-    for i in range(prof.gNumLevels):
-        if not QC(prof.gSndg[i][ind]): continue
-        if prof.gSndg[i][prof.pind] > p:
-            bptr = i
-        elif math.fabs(p - prof.gSndg[i][prof.pind]) < TOL:
-            return prof.gSndg[i][ind]
-        else:
-            tptr = i
-            nm1 = prof.gSndg[tptr][ind] - prof.gSndg[bptr][ind]
-            nm2 = math.log(prof.gSndg[bptr][prof.pind] / \
-                           prof.gSndg[tptr][prof.pind])
-            nm3 = math.log(prof.gSndg[bptr][prof.pind] / p)
-            return prof.gSndg[bptr][ind] + ((nm3 / nm2) * nm1)
+    levels, npres = prof.presCoords(ind)
+
+    # First valid level at or above the given pressure
+    k = bisect.bisect_left(npres, -p)
+    if k < len(levels):
+        tptr = levels[k]
+        if math.fabs(p + npres[k]) < TOL: return prof.gSndg[tptr][ind]
+        if k > 0: bptr = levels[k-1]
+        else: bptr = 0
+        nm1 = prof.gSndg[tptr][ind] - prof.gSndg[bptr][ind]
+        nm2 = math.log(prof.gSndg[bptr][prof.pind] / \
+                       prof.gSndg[tptr][prof.pind])
+        nm3 = math.log(prof.gSndg[bptr][prof.pind] / p)
+        return prof.gSndg[bptr][ind] + ((nm3 / nm2) * nm1)
+
+
+def interp_from_hght_array(h, prof, ind):
+    '''
+    Interpolation routine for height coordinates at many heights at once
+    (in one pass with NumPy, if available)
+
+    Inputs
+    ------
+        h           (list)                  Heights (m) of the levels
+        prof        (profile object)        Profile object
+        ind         (integer)               Index of variable to interpolate
+
+    Returns
+    -------
+        List of interpolated values (RMISSD outside the profile)
+    '''
+    levels, hghts = prof.hghtCoords(ind)
+    if len(levels) < 2: return [RMISSD] * len(h)
+    if np is None:
+        vals = []
+        for x in h:
+            if QC(x) and hghts[0] <= x <= hghts[-1]:
+                vals.append(interp_from_hght(x, prof, ind))
+            else:
+                vals.append(RMISSD)
+        return vals
+    h = np.asarray(h, np.float64)
+    vals = np.interp(h, hghts, [prof.gSndg[i][ind] for i in levels])
+    vals[(h < hghts[0]) | (h > hghts[-1])] = RMISSD
+    return vals.tolist()
+
+
+def interp_from_pres_array(p, prof, ind):
+    '''
+    Interpolation routine for pressure coordinates at many pressures at
+    once (in one pass with NumPy, if available)
+
+    Inputs
+    ------
+        p           (list)                  Pressures (hPa) of the levels
+        prof        (profile object)        Profile object
+        ind         (integer)               Index of variable to interpolate
+
+    Returns
+    -------
+        List of interpolated values (RMISSD outside the profile)
+    '''
+    levels, npres = prof.presCoords(ind)
+    if len(levels) < 2: return [RMISSD] * len(p)
+    if np is None:
+        vals = []
+        for x in p:
+            if QC(x) and npres[0] <= -x <= npres[-1]:
+                vals.append(interp_from_pres(x, prof, ind))
+            else:
+                vals.append(RMISSD)
+        return vals
+    p = np.asarray(p, np.float64)
+    inside = (-p >= npres[0]) & (-p <= npres[-1])
+    # Linear in log pressure, as interp_from_pres
+    vals = np.interp(-np.log(np.where(inside, p, 1.)),
+        -np.log(np.negative(npres)), [prof.gSndg[i][ind] for i in levels])
+    vals[~inside] = RMISSD
+    return vals.tolist()
 
 
 def agl(h, prof):
@@ -1,9 +1,11 @@
 ''' Thermodynamic Parameter Routines '''
 import math
+import array
 from sharppy.sharptab import interp, vector, thermo, winds
 from sharppy.sharptab.constants import *
 
-__all__ = ['DefineParcel', 'Parcel', 'k_index', 't_totals', 'c_totals',
+__all__ = ['DefineParcel', 'Parcel', 'CompactParcel', 'ParcelArray',
+           'PARCEL_FIELDS', 'TRACE_FIELDS', 'k_index', 't_totals', 'c_totals',
            'v_totals', 'precip_water', 'parcel', 'temp_lvl', 'bulk_rich',
            'max_temp', 'mean_mixratio', 'mean_theta', 'unstable_level',
            'effective_inflow_layer', 'bunkers_storm_motion', 'convective_temp',
@@ -100,9 +102,9 @@ class DefineParcel(object):
         else: self.dwpt = interp.dwpt(self.pres, prof)
         return
 
-    def __effective(self, prof):
+    def __effective(self, prof, **kwargs):
         ''' Create the mean-effective layer parcel '''
-        pbot, ptop = effective_inflow_layer(100, -250, prof)
+        pbot, ptop = effective_inflow_layer(100, -250, prof, **kwargs)
         if pbot > 0:
             self.desc = '%.2f hPa Mean Effective Layer Centered at %.2f' % (
                 pbot-ptop, (pbot+ptop)/2.)
@@ -123,7 +125,34 @@ class DefineParcel(object):
         return
 
 
-class Parcel(object):
+# Result fields of a lifted parcel, in output order
+PARCEL_FIELDS = ('pres', 'temp', 'dwpt', 'blayer', 'tlayer', 'entrain',
+    'lclpres', 'lclhght', 'lfcpres', 'lfchght', 'elpres', 'elhght', 'mplpres',
+    'mplhght', 'bplus', 'bminus', 'bfzl', 'b3km', 'b6km', 'p0c', 'pm10c',
+    'pm20c', 'pm30c', 'hght0c', 'hghtm10c', 'hghtm20c', 'hghtm30c', 'wm10c',
+    'wm20c', 'wm30c', 'li5', 'li3', 'brnshear', 'brn', 'limax', 'limaxpres',
+    'cap', 'cappres')
+
+# Parcel trace arrays kept by parcelx(..., trace=True): pressure (hPa),
+# temperature (C) and virtual temperature (C) of the lifted parcel
+TRACE_FIELDS = ('ptrace', 'ttrace', 'tvtrace')
+
+
+class _ParcelFields(object):
+    # Row and dictionary views of the fields, shared by the parcel classes
+    # (no slots of its own, so CompactParcel keeps no instance dictionary)
+    __slots__ = ()
+
+    def as_row(self):
+        ''' Returns the parcel fields as a tuple ordered as PARCEL_FIELDS '''
+        return tuple([getattr(self, field) for field in PARCEL_FIELDS])
+
+    def as_dict(self):
+        ''' Returns the parcel fields as a dictionary '''
+        return dict(zip(PARCEL_FIELDS, self.as_row()))
+
+
+class Parcel(_ParcelFields):
     ''' Initialize variables for a parcel '''
     def __init__(self, lower, upper, pres, temp, dwpt, missing=RMISSD,
         **kwargs):
@@ -165,10 +194,107 @@ class Parcel(object):
         self.limaxpres = RMISSD
         self.cap = RMISSD
         self.cappres = RMISSD
+        self.ptrace = None
+        self.ttrace = None
+        self.tvtrace = None
         for kw in kwargs: setattr(self, kw, kwargs.get(kw))
         return
 
 
+class CompactParcel(_ParcelFields):
+    '''
+    A memory-efficient parcel with the same fields as Parcel. Attributes are
+    stored in slots rather than a per-instance dictionary, so no attributes
+    other than PARCEL_FIELDS, lplvals and TRACE_FIELDS may be set.
+    '''
+    __slots__ = PARCEL_FIELDS + ('lplvals',) + TRACE_FIELDS
+
+    def __init__(self, lower, upper, pres, temp, dwpt, missing=RMISSD,
+        **kwargs):
+        for field in PARCEL_FIELDS: setattr(self, field, missing)
+        self.pres = pres
+        self.temp = temp
+        self.dwpt = dwpt
+        self.blayer = lower
+        self.tlayer = upper
+        self.entrain = 0.
+        self.lplvals = None
+        for field in TRACE_FIELDS: setattr(self, field, None)
+        for kw in kwargs: setattr(self, kw, kwargs.get(kw))
+        return
+
+    def __getstate__(self):
+        return self.as_row() + (self.lplvals,) + \
+            tuple([getattr(self, field) for field in TRACE_FIELDS])
+
+    def __setstate__(self, state):
+        n = len(PARCEL_FIELDS)
+        for field, val in zip(PARCEL_FIELDS, state): setattr(self, field, val)
+        self.lplvals = state[n]
+        traces = state[n+1:] or (None,) * len(TRACE_FIELDS)
+        for field, val in zip(TRACE_FIELDS, traces): setattr(self, field, val)
+
+    @classmethod
+    def from_parcel(cls, pcl):
+        ''' Create a compact copy of any parcel object '''
+        new = cls.__new__(cls)
+        for field in PARCEL_FIELDS: setattr(new, field, getattr(pcl, field))
+        new.lplvals = getattr(pcl, 'lplvals', None)
+        for field in TRACE_FIELDS:
+            setattr(new, field, getattr(pcl, field, None))
+        return new
+
+
+class ParcelArray(object):
+    '''
+    A batch of parcels stored as one array of doubles per field (struct of
+    arrays). Columns are available as attributes (e.g. pcls.bplus), and
+    individual parcels can be read back as CompactParcel objects. Parcel
+    traces (TRACE_FIELDS) are not kept.
+
+    size : int
+        Number of (missing) parcels to allocate
+    '''
+    def __init__(self, size=0):
+        self.columns = dict([(field, array.array('d', [RMISSD]) * size)
+            for field in PARCEL_FIELDS])
+
+    def __len__(self):
+        return len(self.columns['pres'])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, i):
+        pcl = CompactParcel.__new__(CompactParcel)
+        pcl.__setstate__(self.row(i) + (None,))
+        return pcl
+
+    def __setitem__(self, i, pcl):
+        for field in PARCEL_FIELDS:
+            self.columns[field][i] = getattr(pcl, field)
+
+    def append(self, pcl):
+        ''' Add a parcel (or RMISSD for a failed lift) to the batch '''
+        for field in PARCEL_FIELDS:
+            self.columns[field].append(getattr(pcl, field, RMISSD))
+
+    def row(self, i):
+        ''' Returns parcel i as a tuple ordered as PARCEL_FIELDS '''
+        return tuple([self.columns[field][i] for field in PARCEL_FIELDS])
+
+    def rows(self):
+        ''' Iterate over the parcels as tuples ordered as PARCEL_FIELDS '''
+        return zip(*[self.columns[field] for field in PARCEL_FIELDS])
+
+    def as_dict(self):
+        ''' Returns the columns as a dictionary of field name to array '''
+        return dict(self.columns)
+
+
 def k_index(prof):
     '''
     Calculates the K-Index from a profile object
@@ -277,13 +403,12 @@ def precip_water(lower, upper, prof):
 
     # Loop through every level that has a dew point
     pwat = 0
-    for i in range(lptr, uptr+1):
-        if QC(prof.gSndg[i][prof.tdind]):
-            p2 = prof.gSndg[i][prof.pind]
-            w2 = thermo.mixratio(p2, prof.gSndg[i][prof.tdind])
-            pwat += ((w1 + w2) / 2.) * (p1 - p2)
-            p1 = p2
-            w1 = w2
+    for i in prof.validLevels(prof.tdind, lptr, uptr):
+        p2 = prof.gSndg[i][prof.pind]
+        w2 = thermo.mixratio(p2, prof.gSndg[i][prof.tdind])
+        pwat += ((w1 + w2) / 2.) * (p1 - p2)
+        p1 = p2
+        w1 = w2
 
     # Finish with interpolated top level
     d2 = interp.dwpt(upper, prof)
@@ -310,11 +435,20 @@ def parcelx(lower, upper, pres, temp, dwpt, prof, **kwargs):
         dwpt        (float)                 Dew Point of parcel to lift (C)
         prof        (profile object)        Profile Object
 
+        compact     (bool; optional)        Return a CompactParcel
+        trace       (bool; optional)        Keep the lifted parcel's trace
+                                            (see TRACE_FIELDS) as arrays on
+                                            the parcel, from the LPL through
+                                            the LCL and every level above
+
     Returns
     -------
         pcl         (parcel object)         Parcel Object
     '''
-    pcl = Parcel(-1, -1, pres, temp, dwpt)
+    if kwargs.get('compact', False):
+        pcl = CompactParcel(-1, -1, pres, temp, dwpt)
+    else:
+        pcl = Parcel(-1, -1, pres, temp, dwpt)
     if 'lplvals' in kwargs: pcl.lplvals = kwargs.get('lplvals')
     else:
         lplvals = DefineParcel(prof, 5, pres=pres, temp=temp, dwpt=dwpt)
@@ -357,6 +491,12 @@ def parcelx(lower, upper, pres, temp, dwpt, prof, **kwargs):
 
     # Lift parcel and return LCL pres (hPa) and LCL temp (c)
     pe2, tp2 = thermo.drylift(pres, temp, dwpt)
+    trace = kwargs.get('trace', False)
+    if trace:
+        pcl.ptrace = ptrace = array.array('d', [pres, pe2])
+        pcl.ttrace = ttrace = array.array('d', [temp, tp2])
+        pcl.tvtrace = tvtrace = array.array('d',
+            [thermo.virtemp(pres, temp, dwpt), thermo.virtemp(pe2, tp2, tp2)])
     blupper = pe2       # Define top of layer as LCL pres
     h2 = interp.hght(pe2, prof)
     te2 = interp.vtmp(pe2, prof)
@@ -451,10 +591,13 @@ def parcelx(lower, upper, pres, temp, dwpt, prof, **kwargs):
     h1 = interp.hght(pe1, prof)
     te1 = interp.vtmp(pe1, prof)
     tp1 = thermo.wetlift(pe2, tp2, pe1)
+    if trace and pe1 < pe2:
+        ptrace.append(pe1)
+        ttrace.append(tp1)
+        tvtrace.append(thermo.virtemp(pe1, tp1, tp1))
     lyre = 0
     lyrlast = 0
-    for i in range(lptr, prof.gNumLevels):
-        if not QC(prof.gSndg[i][prof.tind]): continue
+    for i in prof.validLevels(prof.tind, lptr):
         pe2 = prof.gSndg[i][prof.pind]
         h2 = prof.gSndg[i][prof.zind]
         te2 = interp.vtmp(pe2, prof)
@@ -488,6 +631,10 @@ def parcelx(lower, upper, pres, temp, dwpt, prof, **kwargs):
         h1 = h2
         te1 = te2
         tp1 = tp2
+        if trace:
+            ptrace.append(pe1)
+            ttrace.append(tp1)
+            tvtrace.append(thermo.virtemp(pe1, tp1, tp1))
 
         # Is this the top of the specified layer
         if i >= uptr and not QC(pcl.bplus):
@@ -684,7 +831,7 @@ def parcelx(lower, upper, pres, temp, dwpt, prof, **kwargs):
             pcl.elhght = interp.agl(interp.hght(pe3, prof), prof)
             pcl.mplpres = RMISSD
             pcl.limax = -li_max
-            pcl.limaxpress = li_maxpres
+            pcl.limaxpres = li_maxpres
 
         # MPL Possibility
         if tote < 0. and not QC(pcl.mplpres) and QC(pcl.elpres):
@@ -745,8 +892,8 @@ def temp_lvl(temp, prof):
     -------
         Level of the temperature (hPa)
     '''
-    for i in range(prof.gNumLevels):
-        if QC(prof.gSndg[i][prof.tind]) and prof.gSndg[i][prof.tind] <= temp:
+    for i in prof.validLevels(prof.tind):
+        if prof.gSndg[i][prof.tind] <= temp:
             if i == 0: return RMISSD
             if prof.gSndg[i][prof.tind] == temp:
                 return prof.gSndg[i][prof.pind]
@@ -879,17 +1026,16 @@ def mean_mixratio(prof, lower=-1, upper=-1):
     num = 1
 
     # Calculate every level that reports a dew point
-    for i in range(lptr, uptr+1):
-        if QC(prof.gSndg[i][prof.tdind]):
-            dp2 = prof.gSndg[i][prof.tdind]
-            p2 = prof.gSndg[i][prof.pind]
-            dpbar = (dp1 + dp2) / 2.
-            pbar = (p1 + p2) / 2.
-            totd += dpbar
-            totp += pbar
-            dp1 = dp2
-            p1 = p2
-            num += 1
+    for i in prof.validLevels(prof.tdind, lptr, uptr):
+        dp2 = prof.gSndg[i][prof.tdind]
+        p2 = prof.gSndg[i][prof.pind]
+        dpbar = (dp1 + dp2) / 2.
+        pbar = (p1 + p2) / 2.
+        totd += dpbar
+        totp += pbar
+        dp1 = dp2
+        p1 = p2
+        num += 1
 
     # Finish with top layer
     dp2 = interp.dwpt(upper, prof)
@@ -942,14 +1088,13 @@ def mean_theta(prof, lower=-1, upper=-1):
     num = 1
 
     # Calculate every level that reports a dew point
-    for i in range(lptr, uptr+1):
-        if QC(prof.gSndg[i][prof.tind]):
-            t2 = thermo.theta(prof.gSndg[i][prof.pind],
-                prof.gSndg[i][prof.tind], 1000.)
-            tbar = (t1 + t2) / 2.
-            tott += tbar
-            t1 = t2
-            num += 1
+    for i in prof.validLevels(prof.tind, lptr, uptr):
+        t2 = thermo.theta(prof.gSndg[i][prof.pind],
+            prof.gSndg[i][prof.tind], 1000.)
+        tbar = (t1 + t2) / 2.
+        tott += tbar
+        t1 = t2
+        num += 1
 
     # Finish with top layer
     t2 = thermo.theta(upper, interp.temp(upper, prof), 1000.)
@@ -1001,16 +1146,15 @@ def unstable_level(prof, lower, upper):
     pmax = p1
 
     # Calculate every level that reports a dew point
-    for i in range(lptr, uptr+1):
-        if QC(prof.gSndg[i][prof.tdind]):
-            p1 = prof.gSndg[i][prof.pind]
-            t1 = prof.gSndg[i][prof.tind]
-            td1 = prof.gSndg[i][prof.tdind]
-            p2, t2 = thermo.drylift(p1, t1, td1)
-            t1 = thermo.wetlift(p2, t2, 1000.)
-            if t1 > tmax:
-                tmax = t1
-                pmax = p1
+    for i in prof.validLevels(prof.tdind, lptr, uptr):
+        p1 = prof.gSndg[i][prof.pind]
+        t1 = prof.gSndg[i][prof.tind]
+        td1 = prof.gSndg[i][prof.tdind]
+        p2, t2 = thermo.drylift(p1, t1, td1)
+        t1 = thermo.wetlift(p2, t2, 1000.)
+        if t1 > tmax:
+            tmax = t1
+            pmax = p1
 
     # Finish with interpolated top layer
     p1 = upper
@@ -1041,6 +1185,7 @@ def effective_inflow_layer(ecape, ecinh, prof, **kwargs):
     '''
     if 'mupcl' in kwargs:
         mupcl = kwargs.get('mupcl')
+        mulplvals = mupcl.lplvals
     else:
         mulplvals = DefineParcel(prof, 3, pres=400)
         mupcl = parcelx(-1, -1, mulplvals.pres, mulplvals.temp,
@@ -1062,18 +1207,22 @@ def effective_inflow_layer(ecape, ecinh, prof, **kwargs):
 
     if mucape >= ecape and mucinh > ecinh:
         # Begin at surface and search upward for effective surface
-        for i in range(prof.sfc, prof.gNumLevels-1):
+        levels = prof.validLevels((prof.tind, prof.tdind), prof.sfc,
+            prof.gNumLevels-2)
+        for i in levels:
             pcl = parcelx(-1, -1, prof.gSndg[i][prof.pind],
-                prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind], prof)
+                prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind], prof,
+                compact=True)
             if pcl.bplus >= ecape and pcl.bminus >= ecinh:
                 pbot = prof.gSndg[i][prof.pind]
                 break
         if pbot == RMISSD: return pbot, ptop
         bptr = i
         # Keep searching upward for the effective top
-        for i in range(bptr+1, prof.gNumLevels-1):
+        for i in levels[levels.index(bptr)+1:]:
             pcl = parcelx(-1, -1, prof.gSndg[i][prof.pind],
-                prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind], prof)
+                prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind], prof,
+                compact=True)
             if pcl.bplus <= ecape or pcl.bminus <= ecinh:
                 j = 1
                 while not QC(prof.gSndg[i-j][prof.tind]) and \
@@ -1159,17 +1308,19 @@ def convective_temp(prof, mincinh=-1.):
 
     # Do a quick search to find wheather to continue. If
     # If you need to heat up more than 25C, don't compute.
-    pcl = parcelx(-1, -1, sfcpres, sfctemp+25., sfcdwpt, prof)
+    pcl = parcelx(-1, -1, sfcpres, sfctemp+25., sfcdwpt, prof,
+        compact=True)
     if pcl.bplus == 0. or pcl.bminus < mincinh: return RMISSD
 
     excess = sfcdwpt - sfctemp
     if excess > 0: sfctemp = sfctemp + excess + 4.
-    pcl = parcelx(-1, -1, sfcpres, sfctemp, sfcdwpt, prof)
+    pcl = parcelx(-1, -1, sfcpres, sfctemp, sfcdwpt, prof, compact=True)
     if pcl.bplus == 0.: pcl.bminus = RMISSD
     while pcl.bminus < mincinh:
         if pcl.bminus < -100.: sfctemp += 2.
         else: sfctemp += 0.5
-        pcl = parcelx(-1, -1, sfcpres, sfctemp, sfcdwpt, prof)
+        pcl = parcelx(-1, -1, sfcpres, sfctemp, sfcdwpt, prof,
+            compact=True)
         if pcl.bplus == 0.: pcl.bminus = RMISSD
 
     return sfctemp
@@ -1189,10 +1340,11 @@ def esfc(prof, val=50.):
     -------
         Level of the effective surface (float [hPa])
     '''
-    for i in range(prof.sfc, prof.gNumLevels):
+    for i in prof.validLevels((prof.tind, prof.tdind), prof.sfc):
         if prof.gSndg[prof.sfc][prof.pind] < 500.: break
         pcl = parcelx(-1, -1, prof.gSndg[i][prof.pind],
-            prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind], prof)
+            prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind], prof,
+            compact=True)
         if pcl.bplus >= val: return prof.gSndg[i][prof.pind]
     return RMISSD
 
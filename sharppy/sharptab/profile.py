@@ -1,33 +1,78 @@
 ''' Create a Profile Object '''
+import bisect
 from sharppy.sharptab import interp, vector
 from sharppy.sharptab.constants import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
+__all__ = ['Profile', 'SPCParser']
 
-class Profile(object):
 
-    def __init__(self, **kwargs):
-        if 'url' in kwargs:
-            url = kwargs.get('url')
-            print url
-            import urllib
+class SPCParser(object):
+    '''
+    Incremental parser for SPC-format sounding text. Data may be supplied
+    in arbitrary pieces (e.g. as they arrive from a socket); complete lines
+    are parsed as soon as they are available.
+    '''
+    def __init__(self):
+        self.gSndg = []
+        self.gStation = '????'
+        self.gDate = '-----'
+        self.__buf = ''
+        self.__section = None
+
+
+    def feed(self, data):
+        ''' Parse another piece of the sounding text '''
+        lines = (self.__buf + data).split('\n')
+        self.__buf = lines.pop()
+        for line in lines: self.__line(line)
+
+
+    def close(self):
+        ''' Parse any remaining partial line '''
+        if self.__buf: self.__line(self.__buf)
+        self.__buf = ''
+        return self
+
+
+    def __line(self, line):
+        line = line.rstrip('\r')
+        if line == '%TITLE%': self.__section = 'title'
+        elif line == '%RAW%': self.__section = 'raw'
+        elif line == '%END%': self.__section = None
+        elif self.__section == 'title':
+            self.gStation = line[0:6]
+            self.gDate = line[7:]
+            self.__section = None
+        elif self.__section == 'raw' and line.strip():
+            self.gSndg.append([float(val) for val in line.split(',')])
 
-            snfile = urllib.urlopen(url).read().decode('utf-8').split("\n")
-            for i in range(0, len(snfile)):
-                if (snfile[i] == "%RAW%"): bgn = i+1
-                if (snfile[i] == "%END%"): end = i-1
-                if (snfile[i] == "%TITLE%"): ttl = i+1
 
-            self.gSndg = []
-            for i in range(bgn, end+1):
-                vals = snfile[i].split(",")
-                for j in range(0, len(vals)):
-                    vals[j] = float(vals[j])
-                self.gSndg.append(vals)
 
-            self.gStation = snfile[ttl][0:6]
-            self.gDate = snfile[ttl][7:]
-            self.gNumLevels = end-bgn+1
+class Profile(object):
+
+    def __init__(self, **kwargs):
+        if 'url' in kwargs or 'text' in kwargs or 'parser' in kwargs:
+            parser = kwargs.get('parser')
+            if parser is None:
+                parser = SPCParser()
+                if 'url' in kwargs:
+                    url = kwargs.get('url')
+                    print url
+                    import urllib
+                    parser.feed(urllib.urlopen(url).read().decode('utf-8'))
+                else:
+                    parser.feed(kwargs.get('text'))
+                parser.close()
+
+            self.gSndg = parser.gSndg
+            self.gStation = parser.gStation
+            self.gDate = parser.gDate
+            self.gNumLevels = len(self.gSndg)
         else:
             pres = kwargs.get('pres')
             hght = kwargs.get('hght')
@@ -68,15 +113,222 @@ class Profile(object):
                 self.gSndg[i][self.vind] = MS2KTS(self.gSndg[i][self.vind])
 
         # Miscellaneous Sets
+        self.validate()
         self.sfc = self.getSfc()
         self.gModel = kwargs.get('model', 'OBS')
 
 
+    @classmethod
+    def fromArrays(cls, data=None, uv=False, **kwargs):
+        '''
+        Create a profile from NumPy arrays (or other objects supporting the
+        buffer protocol) without looping over the levels in Python. Unlike
+        the keyword constructor, gSndg is stored as a 2-D float64 array.
+
+        The data are used as-is (no copy) when they are supplied as a
+        C-contiguous float64 table with u/v winds in knots. Otherwise a
+        single copy is made, and wind conversions are done on whole
+        columns.
+
+        Inputs
+        ------
+            data        (array; optional)   Table of levels with the columns
+                                            pres, hght, temp, dwpt and
+                                            either wdir, wspd or u, v
+            uv          (bool; optional)    Wind columns of data are u/v
+
+        Other keywords are as for the Profile constructor: pres, hght,
+        temp, dwpt and either wdir/wspd or ucomp/vcomp (if data is not
+        given), mps, stn, date and model.
+
+        Returns
+        -------
+            Profile object
+        '''
+        if np is None: raise ImportError('Profile.fromArrays requires NumPy')
+        if data is None:
+            if 'wdir' in kwargs: names = ('wdir', 'wspd')
+            else: names = ('ucomp', 'vcomp')
+            uv = 'wdir' not in kwargs
+            data = np.column_stack([np.asarray(kwargs.get(name), np.float64)
+                for name in ('pres', 'hght', 'temp', 'dwpt') + names])
+        else:
+            if not isinstance(data, np.ndarray):
+                try:
+                    data = np.frombuffer(data, np.float64)
+                except (TypeError, ValueError, AttributeError):
+                    data = np.asarray(data, np.float64)
+            if data.ndim == 1: data = data.reshape(-1, 6)
+            mps = kwargs.get('mps', None)
+            if not uv or mps or data.dtype != np.float64 or \
+               not data.flags.c_contiguous:
+                data = np.array(data, np.float64, order='C')
+
+        prof = cls.__new__(cls)
+        prof.gSndg = data
+        prof.gStation = kwargs.get('stn', '????')
+        prof.gDate = kwargs.get('date', '-----')
+        prof.gNumLevels = len(data)
+        prof.pind, prof.zind, prof.tind, prof.tdind = 0, 1, 2, 3
+        prof.uind, prof.vind = 4, 5
+        winds = data[:, 4:6]
+        good = _qcmask(winds[:, 0]) & _qcmask(winds[:, 1])
+        if not uv:
+            prof.wdirind, prof.wspdind = 4, 5
+            rad = np.radians(winds[:, 0] % 360.)
+            spd = winds[:, 1].copy()
+            winds[:, 0] = np.where(good, -spd * np.sin(rad), RMISSD)
+            winds[:, 1] = np.where(good, -spd * np.cos(rad), RMISSD)
+        if kwargs.get('mps', None):
+            winds[good] = MS2KTS(winds[good])
+
+        prof.validate()
+        prof.sfc = prof.getSfc()
+        prof.gModel = kwargs.get('model', 'OBS')
+        return prof
+
+
+    def addColumn(self, vals):
+        '''
+        Append a variable to every level of the profile
+
+        Inputs
+        ------
+            vals        (list)              Value of the variable at each level
+
+        Returns
+        -------
+            Index of the new variable (int)
+        '''
+        if isinstance(self.gSndg, list):
+            for i in range(self.gNumLevels): self.gSndg[i].append(vals[i])
+            ind = len(self.gSndg[0]) - 1
+        else:
+            self.gSndg = np.column_stack((self.gSndg,
+                np.asarray(vals, np.float64)))
+            ind = self.gSndg.shape[1] - 1
+        self.validate()
+        return ind
+
+
+    def validate(self):
+        '''
+        Builds the tables of valid (non-missing) levels used by the sharptab
+        routines. This must be called again if gSndg is modified after the
+        profile has been created.
+        '''
+        self.gValid = {}
+        for ind in (self.pind, self.zind, self.tind, self.tdind,
+            (self.uind, self.vind)):
+            self.validLevels(ind)
+
+
+    def validLevels(self, ind, lptr=0, uptr=None):
+        '''
+        Returns the indices of levels at which a variable is not missing
+
+        Inputs
+        ------
+            ind         (int or tuple)      Index of variable; if a tuple of
+                                            indices, all must be valid
+            lptr        (int; optional)     Lowest level index to return
+            uptr        (int; optional)     Highest level index to return
+
+        Returns
+        -------
+            List of level indices (int)
+        '''
+        levels = self.gValid.get(ind)
+        if levels is None and not isinstance(self.gSndg, list):
+            if isinstance(ind, tuple): cols = list(ind)
+            else: cols = [ind]
+            mask = _qcmask(self.gSndg[:, cols]).all(axis=1)
+            levels = np.flatnonzero(mask).tolist()
+            self.gValid[ind] = levels
+        elif levels is None:
+            if isinstance(ind, tuple):
+                levels = [i for i in range(self.gNumLevels)
+                    if min([QC(self.gSndg[i][j]) for j in ind])]
+            else:
+                levels = [i for i in range(self.gNumLevels)
+                    if QC(self.gSndg[i][ind])]
+            self.gValid[ind] = levels
+        if lptr <= 0 and uptr is None: return levels
+        lo = bisect.bisect_left(levels, lptr)
+        if uptr is None: return levels[lo:]
+        return levels[lo:bisect.bisect_right(levels, uptr)]
+
+
+    def presCoords(self, ind):
+        '''
+        Returns the levels at which both pressure and a variable are valid,
+        with their negated pressures (ascending, for use with bisect)
+        '''
+        key = ('p', ind)
+        coords = self.gValid.get(key)
+        if coords is None:
+            levels = self.validLevels((self.pind, ind))
+            coords = (levels, [-float(self.gSndg[i][self.pind])
+                for i in levels])
+            self.gValid[key] = coords
+        return coords
+
+
+    def hghtCoords(self, ind):
+        '''
+        Returns the levels at which both height and a variable are valid,
+        with their heights (ascending, for use with bisect)
+        '''
+        key = ('z', ind)
+        coords = self.gValid.get(key)
+        if coords is None:
+            levels = self.validLevels((self.zind, ind))
+            coords = (levels, [float(self.gSndg[i][self.zind])
+                for i in levels])
+            self.gValid[key] = coords
+        return coords
+
+
+    def hghtMarkers(self, top, step=1000., agl=True):
+        '''
+        Returns the pressure and wind components interpolated to heights at
+        regular intervals (e.g. every km), as used for the height markers of
+        a hodograph. The table is computed once, in a single pass with NumPy
+        if available, and kept with the profile.
+
+        Inputs
+        ------
+            top         (float)             Highest marker height (m)
+            step        (float; optional)   Interval between markers (m)
+            agl         (bool; optional)    Heights above ground level
+                                            (otherwise above sea level)
+
+        Returns
+        -------
+            List of (height, pres, u, v) tuples, for the marker heights
+            step, 2*step, ... top within the profile
+        '''
+        key = ('markers', top, step, agl)
+        markers = self.gValid.get(key)
+        if markers is not None: return markers
+
+        base = 0.
+        if agl: base = float(self.gSndg[self.sfc][self.zind])
+        hghts = [step * k for k in range(1, int(top / step) + 1)]
+        pres = interp.interp_from_hght_array([h + base for h in hghts], self,
+            self.pind)
+        u = interp.interp_from_pres_array(pres, self, self.uind)
+        v = interp.interp_from_pres_array(pres, self, self.vind)
+        markers = [marker for marker in zip(hghts, pres, u, v)
+            if QC(marker[1]) and QC(marker[2]) and QC(marker[3])]
+        self.gValid[key] = markers
+        return markers
+
 
     def getSfc(self):
         if (self.gNumLevels < 3): return 0
-        for i in range(0, self.gNumLevels):
-            if (QC(self.gSndg[i][self.tind])): return i
+        levels = self.validLevels(self.tind)
+        if levels: return levels[0]
         return 0
 
 
@@ -85,3 +337,8 @@ class Profile(object):
             self.gSndg[i][self.uind], self.gSndg[i][self.vind] = \
                 vector.vec2comp(self.gSndg[i][self.wdirind],
                 self.gSndg[i][self.wspdind])
+
+
+def _qcmask(vals):
+    ''' Array version of QC; True where values are not missing '''
+    return (vals >= -998.0) & (vals <= 2.0e5)
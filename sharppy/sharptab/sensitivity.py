@@ -0,0 +1,602 @@
+''' Sensitivity of Parameters to Observation Errors '''
+import copy
+import math
+import random
+from sharppy.sharptab import interp, thermo, winds, params, sheet
+from sharppy.sharptab.constants import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ['Ensemble', 'Distribution', 'evaluate', 'FIELDS', 'PERCENTILES']
+
+
+# Fields of a sensitivity study, named as in the parameter sheet
+FIELDS = ['sbcape', 'sbcinh', 'sblcl', 'srh1km', 'srh3km']
+
+# Percentiles reported by Distribution.summary()
+PERCENTILES = [5, 10, 25, 50, 75, 90, 95]
+
+# Surface parcel attribute of each parcel field
+_PARCEL = {'sbcape': 'bplus', 'sbcinh': 'bminus', 'sblcl': 'lclhght'}
+
+# Top (m AGL) of the layer of each helicity field
+_SRH = {'srh1km': 1000., 'srh3km': 3000.}
+
+
+class Ensemble(object):
+    '''
+    Perturbed copies (members) of a profile, for estimating how sensitive
+    parameters are to errors in the observations. Each member has its own
+    surface temperature and dew point, and its own error in the low-level
+    winds: a vector added in full at the surface and tapering linearly to
+    zero at depth m AGL. The errors are drawn from normal distributions
+    with the given standard deviations; dew points are capped at the
+    perturbed temperature.
+
+    Members can be made into profiles one at a time (see profile), but
+    evaluate() computes all of them together: with NumPy, the surface
+    parcels of all members are lifted level by level as arrays, and the
+    helicities summed over arrays of members, instead of calling parcelx
+    and helicity for each member.
+
+    prof : profile object
+        Profile Object
+    n : int
+        Number of members
+    tsd : float
+        Standard deviation of the surface temperature (C)
+    tdsd : float
+        Standard deviation of the surface dew point (C)
+    wsd : float
+        Standard deviation of each component of the wind error (kts)
+    depth : float
+        Depth (m AGL) over which the wind error tapers to zero
+    seed : int
+        Seed of the random errors (the same seed gives the same members)
+
+    Usage
+    -----
+        ens = Ensemble(prof, n=500, tsd=1., tdsd=1.5, seed=0)
+        dist = ens.evaluate()
+        dist.percentile('sbcape', 90)
+    '''
+    def __init__(self, prof, n=100, tsd=1., tdsd=1., wsd=2., depth=1000.,
+        seed=None):
+        sfc = prof.gSndg[prof.sfc]
+        if not QC(sfc[prof.tind]) or not QC(sfc[prof.tdind]):
+            raise ValueError('the surface temperature and dew point are '
+                'required')
+        self.prof = prof
+        self.depth = depth
+
+        # Weight of the wind error at each level
+        self.taper = [0.] * prof.gNumLevels
+        zsfc = sfc[prof.zind]
+        for i in prof.validLevels((prof.zind, prof.uind, prof.vind)):
+            if depth <= 0: break
+            agl = prof.gSndg[i][prof.zind] - zsfc
+            self.taper[i] = max(0., min(1., 1. - agl / depth))
+
+        rng = random.Random(seed)
+        self.temp = []
+        self.dwpt = []
+        self.du = []
+        self.dv = []
+        for i in range(n):
+            temp = sfc[prof.tind] + rng.gauss(0., tsd)
+            self.temp.append(temp)
+            self.dwpt.append(min(sfc[prof.tdind] + rng.gauss(0., tdsd), temp))
+            self.du.append(rng.gauss(0., wsd))
+            self.dv.append(rng.gauss(0., wsd))
+
+
+    def __len__(self):
+        return len(self.temp)
+
+
+    def profile(self, i):
+        '''
+        Returns member i as a profile (a perturbed copy of the profile)
+        '''
+        prof = self.prof
+        member = copy.copy(prof)
+        if isinstance(prof.gSndg, list):
+            member.gSndg = [list(row) for row in prof.gSndg]
+        else:
+            member.gSndg = prof.gSndg.copy()
+        member.gSndg[prof.sfc][prof.tind] = self.temp[i]
+        member.gSndg[prof.sfc][prof.tdind] = self.dwpt[i]
+        for j, w in enumerate(self.taper):
+            if not w: continue
+            member.gSndg[j][prof.uind] += w * self.du[i]
+            member.gSndg[j][prof.vind] += w * self.dv[i]
+        member.validate()
+        return member
+
+
+    def evaluate(self, fields=None, stu=None, stv=None, vectorized=True):
+        '''
+        Computes fields for every member
+
+        Inputs
+        ------
+            fields      (list; optional)    Fields to compute [default:
+                                            FIELDS]
+            stu         (float; optional)   U-component of storm-motion
+            stv         (float; optional)   V-component of storm-motion
+            vectorized  (bool; optional)    Compute the members together
+                                            with NumPy, if it is available
+                                            (otherwise one at a time)
+
+        Helicities are relative to the same storm motion for all members:
+        the given one, or else the Bunkers right-mover motion of the
+        profile (rstu, rstv of the parameter sheet), so that their spread
+        reflects the errors in the winds themselves.
+
+        Returns
+        -------
+            Distribution of the fields
+        '''
+        fields = list(fields or FIELDS)
+        for field in fields:
+            if field not in _PARCEL and field not in _SRH:
+                raise ValueError('unknown field %r' % (field,))
+        if (stu is None or stv is None) and [field for field in fields
+            if field in _SRH]:
+            motion = sheet.compute(self.prof, ['rstu', 'rstv'])
+            stu, stv = motion['rstu'], motion['rstv']
+
+        base = _compute(self.prof, fields, stu, stv)
+        if vectorized and np is not None:
+            values = _Batch(self).compute(fields, stu, stv)
+        else:
+            values = dict([(field, []) for field in fields])
+            for i in range(len(self)):
+                for field, value in _compute(self.profile(i), fields, stu,
+                    stv).items():
+                    values[field].append(value)
+        return Distribution(fields, values, base)
+
+
+class Distribution(object):
+    '''
+    Values of fields over the members of an Ensemble, and of the
+    unperturbed profile. Missing values (e.g. of parcels that could not be
+    lifted) are left out of the statistics.
+
+    fields : list
+        Field names
+    values : dict
+        Field name to the values of the members
+    base : dict
+        Field name to the value of the unperturbed profile
+
+    Usage
+    -----
+        dist.percentile('sbcape', 10), dist.percentile('sbcape', 90)
+        dist.summary()['srh1km']['std']
+    '''
+    def __init__(self, fields, values, base=None):
+        self.fields = list(fields)
+        self.values = dict([(field, [float(value) for value in
+            values[field]]) for field in self.fields])
+        self.base = base or {}
+        self.__sorted = {}
+
+
+    def __len__(self):
+        if not self.fields: return 0
+        return len(self.values[self.fields[0]])
+
+
+    def valid(self, field):
+        ''' Returns the non-missing values of a field, sorted '''
+        vals = self.__sorted.get(field)
+        if vals is None:
+            vals = sorted([value for value in self.values[field]
+                if QC(value)])
+            self.__sorted[field] = vals
+        return vals
+
+
+    def percentile(self, field, q):
+        '''
+        Returns the q-th percentile (0-100) of a field, interpolating
+        linearly between members; None if all the values are missing
+        '''
+        vals = self.valid(field)
+        if not vals: return None
+        x = (len(vals) - 1) * min(max(q, 0.), 100.) / 100.
+        i = int(x)
+        if i + 1 >= len(vals): return vals[-1]
+        return vals[i] + (x - i) * (vals[i+1] - vals[i])
+
+
+    def mean(self, field):
+        vals = self.valid(field)
+        if not vals: return None
+        return math.fsum(vals) / len(vals)
+
+
+    def std(self, field):
+        vals = self.valid(field)
+        if not vals: return None
+        mean = self.mean(field)
+        return math.sqrt(math.fsum([(x - mean) ** 2 for x in vals]) /
+            len(vals))
+
+
+    def summary(self, percentiles=None):
+        '''
+        Returns the statistics of every field
+
+        Inputs
+        ------
+            percentiles (list; optional)    Percentiles to report [default:
+                                            PERCENTILES]
+
+        Returns
+        -------
+            Dictionary of field name to a dictionary of the 'base' value,
+            'mean', 'std', 'min', 'max', the number of 'missing' members
+            and the percentiles (keyed e.g. 'p90'); statistics are None if
+            all the values are missing
+        '''
+        if percentiles is None: percentiles = PERCENTILES
+        out = {}
+        for field in self.fields:
+            vals = self.valid(field)
+            stats = {'base': self.base.get(field, RMISSD),
+                'mean': self.mean(field), 'std': self.std(field),
+                'min': vals[0] if vals else None,
+                'max': vals[-1] if vals else None,
+                'missing': len(self.values[field]) - len(vals)}
+            for q in percentiles:
+                stats['p%g' % q] = self.percentile(field, q)
+            out[field] = stats
+        return out
+
+
+def evaluate(prof, n=100, fields=None, **kwargs):
+    '''
+    Computes the distributions of fields over an ensemble of perturbed
+    copies of a profile
+
+    Inputs
+    ------
+        prof        (profile object)        Profile Object
+        n           (int; optional)         Number of members
+        fields      (list; optional)        Fields [default: FIELDS]
+
+    Other keywords are passed to Ensemble (tsd, tdsd, wsd, depth, seed) or
+    to Ensemble.evaluate (stu, stv, vectorized)
+
+    Returns
+    -------
+        Distribution of the fields
+    '''
+    options = {}
+    for name in ('stu', 'stv', 'vectorized'):
+        if name in kwargs: options[name] = kwargs.pop(name)
+    return Ensemble(prof, n, **kwargs).evaluate(fields, **options)
+
+
+def _compute(prof, fields, stu, stv):
+    ''' Fields of one profile, with the routines of the parameter sheet '''
+    values = {}
+    pcl = None
+    for field in fields:
+        if field in _PARCEL:
+            if pcl is None:
+                lplvals = params.DefineParcel(prof, 1)
+                # parcelx fails on some perturbed soundings (e.g. when its
+                # search for the MPL leaves the profile); the parcel fields
+                # of such a member are missing
+                try:
+                    pcl = params.parcelx(-1, -1, lplvals.pres, lplvals.temp,
+                        lplvals.dwpt, prof, lplvals=lplvals, compact=True)
+                except (TypeError, ValueError, ZeroDivisionError):
+                    pcl = RMISSD
+            values[field] = getattr(pcl, _PARCEL[field], RMISSD)
+        else:
+            values[field] = winds.helicity(0, _SRH[field], prof, stu, stv)[0]
+    return values
+
+
+# Array versions of the thermo routines (without the checks for missing
+# values, which the batch does not need)
+
+def _theta(p, t, p2):
+    return (t + ZEROCNK) * (p2 / p)**ROCP - ZEROCNK
+
+
+def _lcltemp(t, td):
+    s = t - td
+    dlt = s * (1.2185 + 0.001278 * t + s * (-0.00219 + 1.173e-5 * s -
+        0.0000052 * t))
+    return t - dlt
+
+
+def _vappres(t):
+    pol = t * (1.1112018e-17 + (t * -3.0994571e-20))
+    pol = t * (2.1874425e-13 + (t * (-1.789232e-15 + pol)))
+    pol = t * (4.3884180e-09 + (t * (-2.988388e-11 + pol)))
+    pol = t * (7.8736169e-05 + (t * (-6.111796e-07 + pol)))
+    pol = 0.99999683 + (t * (-9.082695e-03 + pol))
+    return 6.1078 / pol**8
+
+
+def _mixratio(p, t):
+    x = 0.02 * (t - 12.5 + (7500. / p))
+    wfw = 1. + (0.0000045 * p) + (0.0014 * x * x)
+    fwesw = wfw * _vappres(t)
+    return 621.97 * (fwesw / (p - fwesw))
+
+
+def _temp_at_mixrat(w, p):
+    x = np.log10(w * p / (622. + w))
+    return (10.**((0.0498646455 * x) + 2.4082965) - 7.07475 +
+        (38.9114 * (10**(0.0915 * x) - 1.2035)**2)) - ZEROCNK
+
+
+def _virtemp(p, t, td):
+    w = 0.001 * _mixratio(p, td)
+    return ((t + ZEROCNK) * (1. + w / 0.62197) / (1. + w)) - ZEROCNK
+
+
+def _wobf(t):
+    x = t - 20.
+    cold = 1 + x * (-8.841660499999999e-3 + x * (1.4714143e-4
+        + x * (-9.671989000000001e-7 + x * (-3.2607217e-8
+        + x * (-3.8598073e-10)))))
+    warm = x * (4.9618922e-07 + x * (-6.1059365e-09 +
+        x * (3.9401551e-11 + x * (-1.2588129e-13 +
+        x * (1.6688280e-16)))))
+    warm = 1 + x * (3.6182989e-03 + x * (-1.3603273e-05 + warm))
+    return np.where(x <= 0, 15.13 / cold**4,
+        (29.93 / warm**4) + (0.96 * x) - 14.8)
+
+
+def _satlift(p, thm):
+    # Iterates every element as thermo.satlift does, leaving converged
+    # elements unchanged until all have converged
+    tol = thermo.SATLIFT_TOL
+    maxiter = max(thermo.SATLIFT_MAXITER, 1)
+    p, thm = np.broadcast_arrays(np.asarray(p, np.float64),
+        np.asarray(thm, np.float64))
+    pwrp = (p / 1000.)**ROCP
+    t1 = (thm + ZEROCNK) * pwrp - ZEROCNK
+    e1 = _wobf(t1) - _wobf(thm)
+    rate = np.ones(t1.shape)
+    t2 = t1 - e1
+    e2 = (t2 + ZEROCNK) / pwrp - ZEROCNK
+    e2 += _wobf(t2) - _wobf(e2) - thm
+    eor = e2
+    niter = 1
+    active = np.fabs(eor) - tol > 0
+    while niter < maxiter and active.any():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            nrate = np.where(active, (t2 - t1) / (e2 - e1), rate)
+        t1 = np.where(active, t2, t1)
+        e1 = np.where(active, e2, e1)
+        rate = nrate
+        nt2 = t1 - (e1 * rate)
+        ne2 = (nt2 + ZEROCNK) / pwrp - ZEROCNK
+        ne2 += _wobf(nt2) - _wobf(ne2) - thm
+        t2 = np.where(active, nt2, t2)
+        e2 = np.where(active, ne2, e2)
+        eor = np.where(active, e2 * rate, eor)
+        niter += 1
+        active &= np.fabs(eor) - tol > 0
+    return np.where(np.fabs(p - 1000.) - 0.001 <= 0, thm, t2 - eor)
+
+
+def _wetlift(p, t, p2):
+    thta = _theta(p, t, 1000.)
+    return _satlift(p2, thta - _wobf(thta) + _wobf(t))
+
+
+class _Column(object):
+    # A variable of the profile interpolated in log pressure as
+    # interp.interp_from_pres does, for every member at once. The members
+    # differ from the profile by delta (one value per member) times a
+    # fixed shape over the levels, so only the interpolation of the profile
+    # and of the shape are needed.
+    def __init__(self, prof, rows, ind, shape=None, delta=None):
+        levels, npres = prof.presCoords(ind)
+        self.levels = np.asarray(levels, np.intp)
+        self.npres = np.asarray(npres, np.float64)
+        self.pres = rows[:, prof.pind]
+        self.base = rows[:, ind]
+        self.shape = shape
+        self.delta = delta
+
+    def __locate(self, p):
+        k = np.searchsorted(self.npres, -p)
+        k = np.minimum(k, len(self.levels) - 1)
+        tptr = self.levels[k]
+        bptr = np.where(k > 0, self.levels[np.maximum(k - 1, 0)], 0)
+        exact = np.fabs(p + self.npres[k]) < TOL
+        bptr = np.where(exact, tptr, bptr)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.log(self.pres[bptr] / p) / \
+                np.log(self.pres[bptr] / self.pres[tptr])
+        return bptr, tptr, np.where(exact, 0., frac)
+
+    def __interp(self, col, bptr, tptr, frac):
+        return col[bptr] + frac * (col[tptr] - col[bptr])
+
+    def at(self, p):
+        ''' Values at a pressure, or at one pressure per member '''
+        p = np.asarray(p, np.float64)
+        loc = self.__locate(p)
+        vals = self.__interp(self.base, *loc)
+        if self.delta is None: return vals
+        return vals + self.delta * self.__interp(self.shape, *loc)
+
+    def table(self, p):
+        ''' Values of every member (rows) at a list of pressures '''
+        loc = self.__locate(np.asarray(p, np.float64))
+        vals = self.__interp(self.base, *loc)
+        if self.delta is None: return vals[np.newaxis, :]
+        return vals + np.outer(self.delta, self.__interp(self.shape, *loc))
+
+
+class _Batch(object):
+    # The members of an ensemble as arrays, with the surface parcel and
+    # helicity computations of parcelx and winds.helicity written for
+    # arrays of members
+    def __init__(self, ens):
+        prof = self.prof = ens.prof
+        self.n = len(ens)
+        sfc = prof.gSndg[prof.sfc]
+        unit = np.zeros(prof.gNumLevels)
+        unit[prof.sfc] = 1.
+        taper = np.asarray(ens.taper, np.float64)
+        rows = np.asarray(prof.gSndg, np.float64)
+        self.tsfc = np.asarray(ens.temp, np.float64)
+        self.tdsfc = np.asarray(ens.dwpt, np.float64)
+        self.hght = _Column(prof, rows, prof.zind)
+        self.temp = _Column(prof, rows, prof.tind, unit,
+            self.tsfc - sfc[prof.tind])
+        self.dwpt = _Column(prof, rows, prof.tdind, unit,
+            self.tdsfc - sfc[prof.tdind])
+        self.u = _Column(prof, rows, prof.uind, taper,
+            np.asarray(ens.du, np.float64))
+        self.v = _Column(prof, rows, prof.vind, taper,
+            np.asarray(ens.dv, np.float64))
+
+    def compute(self, fields, stu, stv):
+        values = {}
+        if [field for field in fields if field in _PARCEL]:
+            values.update(self.parcel())
+        for field in fields:
+            if field in _SRH:
+                values[field] = self.helicity(_SRH[field], stu, stv)
+        return dict([(field, values[field].tolist()) for field in fields])
+
+    def vtmp(self, p):
+        return _virtemp(p, self.temp.at(p), self.dwpt.at(p))
+
+    def missing(self):
+        return dict([(field, np.full(self.n, RMISSD)) for field in _PARCEL])
+
+    def parcel(self):
+        '''
+        Surface parcel fields of every member, following parcelx step by
+        step (including its choice of the layers counted in B-)
+        '''
+        prof = self.prof
+        gSndg = prof.gSndg
+        n = self.n
+        pres = gSndg[prof.sfc][prof.pind]
+        lower = pres
+        upper = gSndg[prof.gNumLevels-1][prof.pind]
+        if not QC(interp.vtmp(lower, prof)) or \
+           not QC(interp.vtmp(upper, prof)):
+            return self.missing()
+        temp = self.tsfc
+        dwpt = self.tdsfc
+
+        # LCL
+        tlcl = _lcltemp(temp, dwpt)
+        plcl = 1000. / (((_theta(pres, temp, 1000.) + ZEROCNK) /
+            (tlcl + ZEROCNK))**(1 / ROCP))
+        zsfc = gSndg[prof.sfc][prof.zind]
+        lclhght = self.hght.at(plcl) - zsfc
+
+        # CINH below the LCL, in 10 hPa steps
+        theta_parcel = _theta(plcl, tlcl, 1000.)
+        blmr = _mixratio(pres, dwpt)
+        totn = np.zeros(n)
+        a = int(lower)
+        steps = np.maximum((a - np.trunc(plcl).astype(int) + 9) // 10, 0)
+        for k in range(int(steps.max()) if n else 0):
+            pp1 = float(a - 10 * k)
+            pp2 = np.maximum(pp1 - 10., plcl)
+            dz = self.hght.at(pp2) - self.hght.at(pp1)
+            tv_env_bot = _virtemp(pp1, _theta(pp1, self.temp.at(pp1), 1000.),
+                self.dwpt.at(pp1))
+            tdef1 = (_virtemp(pp1, theta_parcel, _temp_at_mixrat(blmr, pp1)) -
+                tv_env_bot) / (tv_env_bot + ZEROCNK)
+            tv_env_top = _virtemp(pp2, _theta(pp2, self.temp.at(pp2), 1000.),
+                self.dwpt.at(pp2))
+            tdef2 = (_virtemp(pp2, theta_parcel, _temp_at_mixrat(blmr, pp2)) -
+                tv_env_top) / (tv_env_bot + ZEROCNK)
+            lyre = G * (tdef1 + tdef2) / 2. * dz
+            totn += np.where((k < steps) & (lyre < 0), lyre, 0.)
+
+        # Lowest level above the LCL (or the surface) of each member
+        lower = np.minimum(lower, plcl)
+        levpres = self.hght.pres
+        last = prof.gNumLevels - 1
+        nextdwpt = np.arange(prof.gNumLevels)
+        for i in range(last - 1, -1, -1):
+            if not QC(gSndg[i][prof.tdind]): nextdwpt[i] = nextdwpt[i+1]
+        lptr = nextdwpt[np.minimum(np.searchsorted(-levpres, -lower), last)]
+        lptr += (levpres[lptr] == lower) & (lptr != last)
+        uptr = np.where(lptr < last, last - 1, last)
+
+        # Moist ascent from the LCL through the levels
+        pe1 = lower
+        h1 = self.hght.at(pe1)
+        te1 = self.vtmp(pe1)
+        tp1 = _wetlift(plcl, tlcl, pe1)
+        lyre = np.zeros(n)
+        lyrlast = np.zeros(n)
+        totp = np.zeros(n)
+        cinh_old = np.zeros(n)
+        bplus = np.full(n, RMISSD)
+        done = np.zeros(n, bool)
+        htop = self.hght.at(upper)
+        tetop = self.vtmp(upper)
+        for i in prof.validLevels(prof.tind, int(lptr.min()) if n else 0):
+            act = i >= lptr
+            pe2 = levpres[i]
+            h2 = gSndg[i][prof.zind]
+            te2 = self.vtmp(pe2)
+            tp2 = _wetlift(pe1, tp1, pe2)
+            tdef1 = (_virtemp(pe1, tp1, tp1) - te1) / (te1 + ZEROCNK)
+            tdef2 = (_virtemp(pe2, tp2, tp2) - te2) / (te2 + ZEROCNK)
+            lyrlast = np.where(act, lyre, lyrlast)
+            lyre = np.where(act, G * (tdef1 + tdef2) / 2. * (h2 - h1), lyre)
+            totp += np.where(act & (lyre > 0), lyre, 0.)
+            if pe2 > 500.: totn += np.where(act & (lyre <= 0), lyre, 0.)
+            pe1 = np.where(act, pe2, pe1)
+            h1 = np.where(act, h2, h1)
+            te1 = np.where(act, te2, te1)
+            tp1 = np.where(act, tp2, tp1)
+
+            # Top of the layer: B+ less the last layer, plus the layer to
+            # the top of the profile
+            top = act & (i >= uptr) & ~done
+            if top.any():
+                tp3 = _wetlift(pe1, tp1, upper)
+                tdef3 = (_virtemp(pe1, tp1, tp1) - te1) / (te1 + ZEROCNK)
+                tdef2 = (_virtemp(upper, tp3, tp3) - tetop) / \
+                    (tetop + ZEROCNK)
+                lyrf = G * (tdef3 + tdef2) / 2. * (htop - h1)
+                total = np.where(lyre > 0, totp - lyre, totp) + \
+                    np.where(lyrf > 0, lyrf, 0.)
+                bplus = np.where(top, total, bplus)
+                done |= top
+
+            # LFC possibility: B- is the CINH below the last LFC
+            lfc = act & (lyre >= 0.) & (lyrlast <= 0.)
+            cinh_old = np.where(lfc, totn, cinh_old)
+
+        bminus = np.where(bplus == 0, 0., cinh_old)
+        return {'sbcape': bplus, 'sbcinh': bminus, 'sblcl': lclhght}
+
+    def helicity(self, top, stu, stv):
+        ''' Storm-relative helicity of every member, as winds.helicity '''
+        plower, pupper, levels = winds.helicity_levels(0, top, self.prof)
+        p = [plower] + [self.prof.gSndg[i][self.prof.pind]
+            for i in levels] + [pupper]
+        sru = KTS2MS(self.u.table(p) - stu)
+        srv = KTS2MS(self.v.table(p) - stv)
+        lyrh = sru[:, 1:] * srv[:, :-1] - sru[:, :-1] * srv[:, 1:]
+        return lyrh.sum(axis=1)
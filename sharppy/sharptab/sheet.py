@@ -0,0 +1,170 @@
+''' Parameter Sheet Routines '''
+from sharppy.sharptab import interp, vector, thermo, winds, params, indices
+from sharppy.sharptab.constants import *
+
+__all__ = ['PARCELS', 'FIELDS', 'SCALARS', 'NAMES', 'compute', 'scalars',
+           'definition']
+
+
+# Parcels lifted for a sheet: name -> (DefineParcel flag, keyword arguments)
+PARCELS = {
+    'sfcpcl': (1, {}),
+    'fcstpcl': (2, {'pres': 100}),
+    'mupcl': (3, {'pres': 400}),
+    'mlpcl': (4, {'pres': 100}),
+    'efpcl': (6, {}),
+}
+
+# Scalar parameters of a sheet, in output order
+SCALARS = ['sbcape', 'sbcinh', 'sblcl', 'mlcape', 'mlcinh', 'mllcl',
+    'mucape', 'mucinh', 'mulcl', 'mulpl', 'ebot', 'etop', 'rstu', 'rstv',
+    'shr1km', 'shr6km', 'srh1km', 'srh3km', 'esrh', 'scp', 'pwat', 'lr03km',
+    'lr700_500', 'lr850_500', 'kindex', 'ttotals']
+
+# Everything computed for a default sheet
+FIELDS = ['sfcpcl', 'mlpcl', 'mupcl', 'efpcl'] + SCALARS
+
+
+def _parcel(name):
+    flag, kwargs = PARCELS[name]
+    def rule(prof, get):
+        if flag == 6: lplvals = get('elayer')
+        else: lplvals = params.DefineParcel(prof, flag, **kwargs)
+        return params.parcelx(-1, -1, lplvals.pres, lplvals.temp,
+            lplvals.dwpt, prof, lplvals=lplvals)
+    return rule
+
+
+def _attr(pcl, name):
+    ''' Parcel attribute, or missing if the parcel could not be lifted '''
+    return getattr(pcl, name, RMISSD)
+
+
+def _shear(top):
+    def rule(prof, get):
+        pbot = prof.gSndg[prof.sfc][prof.pind]
+        ptop = interp.pres(interp.msl(top, prof), prof)
+        return vector.mag(*winds.wind_shear(pbot, ptop, prof))
+    return rule
+
+
+def _srh(top):
+    def rule(prof, get):
+        return winds.helicity(0, top, prof, get('rstu'), get('rstv'))[0]
+    return rule
+
+
+def _esrh(prof, get):
+    if not QC(get('ebot')) or not QC(get('etop')): return 0.
+    base = interp.agl(interp.hght(get('ebot'), prof), prof)
+    top = interp.agl(interp.hght(get('etop'), prof), prof)
+    return winds.helicity(base, top, prof, get('rstu'), get('rstv'))[0]
+
+
+def _bunkers(prof, get):
+    return params.bunkers_storm_motion(prof, pbot=get('ebot'),
+        mupcl=get('mupcl'))
+
+
+def _scp(prof, get):
+    return indices.scp(prof, mupcl=get('mupcl'), epcl=get('efpcl'),
+        stu=get('rstu'), stv=get('rstv'))
+
+
+_RULES = {
+    'sbcape': lambda prof, get: _attr(get('sfcpcl'), 'bplus'),
+    'sbcinh': lambda prof, get: _attr(get('sfcpcl'), 'bminus'),
+    'sblcl': lambda prof, get: _attr(get('sfcpcl'), 'lclhght'),
+    'mlcape': lambda prof, get: _attr(get('mlpcl'), 'bplus'),
+    'mlcinh': lambda prof, get: _attr(get('mlpcl'), 'bminus'),
+    'mllcl': lambda prof, get: _attr(get('mlpcl'), 'lclhght'),
+    'mucape': lambda prof, get: _attr(get('mupcl'), 'bplus'),
+    'mucinh': lambda prof, get: _attr(get('mupcl'), 'bminus'),
+    'mulcl': lambda prof, get: _attr(get('mupcl'), 'lclhght'),
+    'mulpl': lambda prof, get: _attr(get('mupcl'), 'pres'),
+    'elayer': lambda prof, get: params.DefineParcel(prof, 6,
+        mupcl=get('mupcl')),
+    'ebot': lambda prof, get: get('elayer').pbot,
+    'etop': lambda prof, get: get('elayer').ptop,
+    'bunkers': _bunkers,
+    'rstu': lambda prof, get: get('bunkers')[0],
+    'rstv': lambda prof, get: get('bunkers')[1],
+    'shr1km': _shear(1000.),
+    'shr6km': _shear(6000.),
+    'srh1km': _srh(1000.),
+    'srh3km': _srh(3000.),
+    'esrh': _esrh,
+    'scp': _scp,
+    'pwat': lambda prof, get: params.precip_water(-1, -1, prof),
+    'lr03km': lambda prof, get: params.lapse_rate(0., 3000., prof, pres=0),
+    'lr700_500': lambda prof, get: params.lapse_rate(700., 500., prof),
+    'lr850_500': lambda prof, get: params.lapse_rate(850., 500., prof),
+    'kindex': lambda prof, get: params.k_index(prof),
+    'ttotals': lambda prof, get: params.t_totals(prof),
+}
+for _name in PARCELS: _RULES[_name] = _parcel(_name)
+
+# Every name compute() accepts, including the intermediate results
+NAMES = sorted(_RULES)
+
+
+def compute(prof, fields=None):
+    '''
+    Computes a parameter sheet for a profile. Intermediate results (e.g.
+    the most unstable parcel) are computed once and shared between all of
+    the fields that depend upon them.
+
+    Inputs
+    ------
+        prof        (profile object)        Profile Object
+        fields      (list; optional)        Names of fields to compute
+                                            [default: FIELDS]
+
+    Returns
+    -------
+        Dictionary of field name to value (parcel object or float)
+    '''
+    if fields is None: fields = FIELDS
+    memo = {}
+    def get(name):
+        if name not in memo: memo[name] = _RULES[name](prof, get)
+        return memo[name]
+    return dict([(name, get(name)) for name in fields])
+
+
+def scalars(results):
+    '''
+    Returns the scalar (non-parcel) fields of a computed sheet, in output
+    order.
+
+    Inputs
+    ------
+        results     (dict)                  Output of compute()
+
+    Returns
+    -------
+        List of (name, value) pairs
+    '''
+    return [(name, results[name]) for name in SCALARS if name in results]
+
+
+def definition(fields=None):
+    '''
+    Returns a description of what a sheet with the given fields computes,
+    including the numerical settings that affect the results, suitable for
+    use as (part of) a cache key.
+
+    Inputs
+    ------
+        fields      (list; optional)        Names of fields to compute
+
+    Returns
+    -------
+        Tuple describing the sheet
+    '''
+    if fields is None: fields = FIELDS
+    pcls = sorted([(name, PARCELS[name][0], sorted(PARCELS[name][1].items()))
+        for name in PARCELS])
+    settings = (('SATLIFT_TOL', thermo.SATLIFT_TOL),
+        ('SATLIFT_MAXITER', thermo.SATLIFT_MAXITER))
+    return (tuple(fields), tuple(pcls), settings)
@@ -3,10 +3,16 @@ import math
 from sharppy.sharptab.constants import *
 
 
-__all__ = ['lifted', 'drylift', 'lcltemp', 'thalvl', 'theta', 'wetlift',
-           'wobf', 'satlift', 'temp_at_mixrat', 'mixratio', 'vappres',
-           'wetbulb', 'thetaw', 'thetae', 'virtemp', 'relh', 'ctof', 'ctok',
-           'ftoc', 'ftok', 'ktoc', 'ktof']
+__all__ = ['SATLIFT_TOL', 'SATLIFT_MAXITER', 'lifted', 'drylift', 'lcltemp',
+           'thalvl', 'theta', 'wetlift', 'wobf', 'satlift', 'temp_at_mixrat',
+           'mixratio', 'vappres', 'wetbulb', 'thetaw', 'thetae', 'virtemp',
+           'relh', 'ctof', 'ctok', 'ftoc', 'ftok', 'ktoc', 'ktof']
+
+
+# Convergence settings of satlift (and so of wetlift and the parcel
+# routines). A looser tolerance is faster but less accurate.
+SATLIFT_TOL = 0.1               # Convergence tolerance (C)
+SATLIFT_MAXITER = 50            # Maximum number of iterations
 
 
 def lifted(p, t, td, lev):
@@ -110,7 +116,7 @@ def theta(p, t, p2):
     return (t * (p2 / p)**ROCP) - ZEROCNK
 
 
-def wetlift(p, t, p2):
+def wetlift(p, t, p2, tol=None, maxiter=None):
     '''
     Lifts a parcel moist adiabatically to its new level.
 
@@ -119,6 +125,10 @@ def wetlift(p, t, p2):
         p       (float)         Pressure of initial parcel (hPa)
         t       (float)         Temperature of initial parcel (C)
         p2      (float)         Pressure of final level (hPa)
+        tol     (float)         Convergence tolerance of satlift (C)
+                                [default: SATLIFT_TOL]
+        maxiter (int)           Iteration limit of satlift
+                                [default: SATLIFT_MAXITER]
 
     Returns
     -------
@@ -127,7 +137,7 @@ def wetlift(p, t, p2):
     if not QC(p) or not QC(t) or not QC(p2): return RMISSD
     thta = theta(p, t, 1000.)
     thm = thta - wobf(thta) + wobf(t)
-    return satlift(p2, thm)
+    return satlift(p2, thm, tol, maxiter)
 
 
 def wobf(t):
@@ -158,24 +168,44 @@ def wobf(t):
         return (29.93 / (pol**4)) + (0.96 * x) - 14.8
 
 
-def satlift(p, thm):
+def satlift(p, thm, tol=None, maxiter=None):
     '''
     Returns the temperature (C) of a saturated parcel (thm) when lifted to a
     new pressure level (hPa)
 
+    The temperature is found iteratively, to within tol. A looser tolerance
+    takes fewer iterations (see benchmarks/bench_satlift.py for the trade
+    off); if maxiter iterations are reached the current estimate is
+    returned.
+
     Inputs
     ------
         p       (float)         Pressure to which parcel is raised (hPa)
         thm     (float)         Saturated Potential Temperature of parcel (C)
+        tol     (float)         Convergence tolerance (C)
+                                [default: SATLIFT_TOL]
+        maxiter (int)           Iteration limit [default: SATLIFT_MAXITER]
 
     Returns
     -------
         Temperature (C [float]) of saturated parcel at new level
     '''
-    if not QC(p) or not QC(thm): return RMISSD
-    if math.fabs(p - 1000.) - 0.001 <= 0: return thm
+    return _satlift(p, thm, tol, maxiter)[0]
+
+
+def _satlift(p, thm, tol=None, maxiter=None):
+    '''
+    Implementation of satlift; also returns the number of iterations taken
+    to converge (for instrumentation)
+    '''
+    if not QC(p) or not QC(thm): return RMISSD, 0
+    if math.fabs(p - 1000.) - 0.001 <= 0: return thm, 0
+    if tol is None: tol = SATLIFT_TOL
+    if maxiter is None: maxiter = SATLIFT_MAXITER
+    maxiter = max(maxiter, 1)
     eor = 999
-    while math.fabs(eor) - 0.1 > 0:
+    niter = 0
+    while math.fabs(eor) - tol > 0 and niter < maxiter:
         if eor == 999:                  # First Pass
             pwrp = (p / 1000.)**ROCP
             t1 = (thm + ZEROCNK) * pwrp - ZEROCNK
@@ -189,7 +219,8 @@ def satlift(p, thm):
         e2 = (t2 + ZEROCNK) / pwrp - ZEROCNK
         e2 += wobf(t2) - wobf(e2) - thm
         eor = e2 * rate
-    return t2 - eor
+        niter += 1
+    return t2 - eor, niter
 
 
 def temp_at_mixrat(w, p):
@@ -4,8 +4,8 @@ from sharppy.sharptab import interp, vector
 from sharppy.sharptab.constants import *
 
 __all__ = ['mean_wind', 'mean_wind_npw', 'sr_wind', 'sr_wind_npw',
-           'wind_shear', 'helicity', 'max_wind', 'corfidi_mcs_motion',
-           'non_parcel_bunkers_motion', 'mbe_vectors']
+           'wind_shear', 'helicity_levels', 'helicity', 'max_wind',
+           'corfidi_mcs_motion', 'non_parcel_bunkers_motion', 'mbe_vectors']
 
 
 def mean_wind(pbot, ptop, prof, psteps=20, stu=0, stv=0):
@@ -166,32 +166,27 @@ def wind_shear(pbot, ptop, prof):
     return shu, shv
 
 
-def helicity(lower, upper, prof, stu=0, stv=0):
+def helicity_levels(lower, upper, prof):
     '''
-    Calculates the relative helicity (m2/s2) of a layer from lower to upper.
-    If storm-motion vector is supplied, storm-relative helicity, both
-    positve and negative, is returned.
+    Returns the pressures of the bottom and top of a helicity layer and the
+    levels with winds within it, over which helicity() integrates
 
     Inputs
     ------
         lower       (float)             Bottom level of layer (m, AGL)
         upper       (float)             Top level of layer (m, AGL)
         prof        (profile object)    Profile Object
-        stu         (float; optional)   U-component of storm-motion
-        stv         (float; optional)   V-component of storm-motion
 
     Returns
     -------
-        phel+nhel   (float)             Combined Helicity (m2/s2)
-        phel        (float)             Positive Helicity (m2/s2)
-        nhel        (float)             Negative Helicity (m2/s2)
+        plower      (float)             Pressure of the bottom (hPa)
+        pupper      (float)             Pressure of the top (hPa)
+        levels      (list)              Indices of the levels in between
     '''
     lower = interp.msl(lower, prof)
     upper = interp.msl(upper, prof)
     plower = interp.pres(lower, prof)
     pupper = interp.pres(upper, prof)
-    phel = 0
-    nhel = 0
 
     # Find lower and upper ind bounds for looping
     i = 0
@@ -201,7 +196,33 @@ def helicity(lower, upper, prof, stu=0, stv=0):
     while interp.msl(prof.gSndg[i][prof.zind], prof) <= upper: i+=1
     uptr = i
     if interp.msl(prof.gSndg[i][prof.zind], prof) == upper: uptr-=1
+    return plower, pupper, prof.validLevels((prof.uind, prof.vind), lptr,
+        uptr)
+
+
+def helicity(lower, upper, prof, stu=0, stv=0):
+    '''
+    Calculates the relative helicity (m2/s2) of a layer from lower to upper.
+    If storm-motion vector is supplied, storm-relative helicity, both
+    positve and negative, is returned.
+
+    Inputs
+    ------
+        lower       (float)             Bottom level of layer (m, AGL)
+        upper       (float)             Top level of layer (m, AGL)
+        prof        (profile object)    Profile Object
+        stu         (float; optional)   U-component of storm-motion
+        stv         (float; optional)   V-component of storm-motion
 
+    Returns
+    -------
+        phel+nhel   (float)             Combined Helicity (m2/s2)
+        phel        (float)             Positive Helicity (m2/s2)
+        nhel        (float)             Negative Helicity (m2/s2)
+    '''
+    plower, pupper, levels = helicity_levels(lower, upper, prof)
+    phel = 0
+    nhel = 0
 
     # Integrate from interpolated bottom level to iptr level
     sru1, srv1 = interp.components(plower, prof)
@@ -209,16 +230,15 @@ def helicity(lower, upper, prof, stu=0, stv=0):
     srv1 = KTS2MS(srv1 - stv)
 
     # Loop through levels
-    for i in range(lptr, uptr+1):
-        if QC(prof.gSndg[i][prof.uind]) and QC(prof.gSndg[i][prof.vind]):
-            sru2, srv2 = interp.components(prof.gSndg[i][prof.pind], prof)
-            sru2 = KTS2MS(sru2 - stu)
-            srv2 = KTS2MS(srv2 - stv)
-            lyrh = (sru2 * srv1) - (sru1 * srv2)
-            if lyrh > 0: phel += lyrh
-            else: nhel += lyrh
-            sru1 = sru2
-            srv1 = srv2
+    for i in levels:
+        sru2, srv2 = interp.components(prof.gSndg[i][prof.pind], prof)
+        sru2 = KTS2MS(sru2 - stu)
+        srv2 = KTS2MS(srv2 - stv)
+        lyrh = (sru2 * srv1) - (sru1 * srv2)
+        if lyrh > 0: phel += lyrh
+        else: nhel += lyrh
+        sru1 = sru2
+        srv1 = srv2
 
     # Integrate from tptr level to interpolated top level
     sru2, srv2 = interp.components(pupper, prof)
@@ -265,16 +285,14 @@ def max_wind(lower, upper, prof):
     p = lower
 
     # Loop through all levels in layer
-    for i in range(lptr, uptr+1):
-        if QC(prof.gSndg[i][prof.pind]) and QC(prof.gSndg[i][prof.uind]) and \
-           QC(prof.gSndg[i][prof.vind]):
-            spd = vector.comp2vec(prof.gSndg[i][prof.uind],
-                prof.gSndg[i][prof.vind])[1]
-            if spd > maxspd:
-                maxspd = spd
-                maxu = prof.gSndg[i][prof.uind]
-                maxv = prof.gSndg[i][prof.vind]
-                p = prof.gSndg[i][prof.pind]
+    for i in prof.validLevels((prof.pind, prof.uind, prof.vind), lptr, uptr):
+        spd = vector.comp2vec(prof.gSndg[i][prof.uind],
+            prof.gSndg[i][prof.vind])[1]
+        if spd > maxspd:
+            maxspd = spd
+            maxu = prof.gSndg[i][prof.uind]
+            maxv = prof.gSndg[i][prof.vind]
+            p = prof.gSndg[i][prof.pind]
 
     # Finish with interpolated top level
     tmpu, tmpv = interp.components(upper, prof)
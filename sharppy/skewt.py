@@ -1,12 +1,24 @@
 import math
 import sharppy as sp
 import sharppy.sharptab as tab
+from sharppy.canvas import draw_lines, Layer
 from sharppy.sharptab.constants import *
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 __all__ = ['SkewT']
 
 
+# Pixel coordinates of the background lines, shared by every chart with the
+# same geometry: chart geometry key -> {(line type, value): coordinates}
+_GEOMETRY = {}
+_MAXGEOMETRY = 32
+
+
 class SkewT:
 
     def __init__(self, canvas, **kwargs):
@@ -77,18 +89,43 @@ class SkewT:
         self.maxTdgz = -12                  # Maximum temperature of DGZ
         self.tracewidth = 4                 # Tracewidth
 
+        # Draw each trace as one multi-point line (split only where its
+        # style changes) rather than one canvas line per segment
+        self.polylines = False
+
+        # Prefix of the canvas tags of the layers drawn by drawFrame
+        self.layertag = 'skewt'
+
         # Update All Keyword Arguments
         self.__dict__.update(kwargs)
+        self.setTransform()
+
 
+    def setTransform(self):
+        '''
+        Precomputes the constants of the pixel transforms. Called on
+        creation and whenever keyword arguments update the chart; call it
+        again after changing the chart geometry directly.
+        '''
         # Horizontal temperature spread (dT across the bottom of the chart)
         self.hspread = self.brtemp - self.bltemp
 
         # Vertical temperature spread (dT along the left edge of the chart)
         self.vspread = math.tan(math.radians(self.rot)) * self.hspread
 
+        # Log-pressure range and pixel size of the chart
+        self.lpmax = math.log(self.pmax)
+        self.lprange = self.lpmax - math.log(self.pmin)
+        self.pixhgt = self.bry - self.tly
+        self.pixwid = self.brx - self.tlx
+
 
     def drawSkewT(self):
-        """ Draw the background SkewT """
+        """
+        Draw the background SkewT. The coordinates of the background lines
+        are computed once for a given chart geometry and reused by every
+        chart drawn with the same geometry.
+        """
         btm = int(self.pmax) / 50 * 50
         for p in range(btm, int(self.pmin), -50): self.drawIsobar(p, 1)
         for tw in self.thtes: self.drawMoistAdiabat(tw)
@@ -128,6 +165,7 @@ class SkewT:
         twwidth = kwargs.get('twwidth', 1)
         plottxt = kwargs.get('plottxt', True)
         self.__dict__.update(kwargs)
+        self.setTransform()
         self.drawTrace(prof, -1, color=self.twcolor, width=twwidth,
             plottxt=plottxt)
         self.drawTrace(prof, prof.tdind, self.tdcolor, width=self.tracewidth,
@@ -142,28 +180,64 @@ class SkewT:
         if not color: color = self.barbcolor
         self.plevs = [prof.gSndg[prof.sfc][prof.pind]] + self.presrange
         self.__dict__.update(kwargs)
+        self.setTransform()
 
         if not self.plevs:
             self.plevs = [prof.gSndg[i][prof.sfc]
                 for i in range(prof.gNumLevels)]
 
-        for p in self.plevs:
-            if p < self.pmin or p > self.pmax or \
-                p > prof.gSndg[prof.sfc][prof.pind]: continue
-            u, v = tab.interp.components(p, prof)
-            y1 = self.pres2Pix(p)
-            x1 = self.brx + self.rpad/2
-            wdir, wspd = tab.vector.comp2vec(u, v)
-            sp.Barb(self.gCanvas, x1, y1, wdir, wspd, color=color,
-                **kwargs)
+        plevs = [p for p in self.plevs if not (p < self.pmin or
+            p > self.pmax or p > prof.gSndg[prof.sfc][prof.pind])]
+        us = tab.interp.interp_from_pres_array(plevs, prof, prof.uind)
+        vs = tab.interp.interp_from_pres_array(plevs, prof, prof.vind)
+        winds = [tab.vector.comp2vec(u, v) for u, v in zip(us, vs)]
+        xs = [self.brx + self.rpad/2] * len(plevs)
+        ys = [self.pres2Pix(p) for p in plevs]
+        sp.draw_barbs(self.gCanvas, xs, ys, [w[0] for w in winds],
+            [w[1] for w in winds], color=color, **kwargs)
+
+
+    def drawFrame(self, prof, pcl=None, barbs=True, **kwargs):
+        '''
+        Draws one frame of a loop of soundings. The background is drawn on
+        the first frame only; on each frame the items of the profile, barb
+        and parcel layers of the previous frame are deleted and drawn anew.
+
+        Inputs
+        ------
+            prof        (profile object)    Profile Object
+            pcl         (parcel; optional)  Parcel (or lplvals) to trace
+            barbs       (bool; optional)    Draw the wind barbs
+
+        Other keywords are passed to drawProfile
+        '''
+        canvas = self.gCanvas
+        tag = self.layertag + '.%s'
+        try:
+            if not canvas.find_withtag(tag % 'background'):
+                self.gCanvas = Layer(canvas, tag % 'background')
+                self.drawSkewT()
+            for name in ('profile', 'barbs', 'parcel'):
+                canvas.delete(tag % name)
+            self.gCanvas = Layer(canvas, tag % 'profile')
+            self.drawProfile(prof, **kwargs)
+            if barbs:
+                self.gCanvas = Layer(canvas, tag % 'barbs')
+                self.drawBarbs(prof)
+            if pcl is not None:
+                self.gCanvas = Layer(canvas, tag % 'parcel')
+                self.drawVirtualParcelTrace(pcl)
+                self.drawParcelTrace(pcl)
+        finally:
+            self.gCanvas = canvas
 
 
     def drawDGZ(self, prof, color=None, width=3):
         ''' Draw the Dendritic Snow Growth Zone '''
         if not color: color=self.dgzcolor
         if prof.gNumLevels < 3: return
-        for i in range(prof.gNumLevels-1):
-            if not QC(prof.gSndg[i][prof.tind]): continue
+        segs = []
+        for i in prof.validLevels(prof.tind, 0, prof.gNumLevels-2):
             if prof.gSndg[i][prof.tind] <= self.maxTdgz and \
                prof.gSndg[i][prof.tind] >= self.minTdgz and \
                prof.gSndg[i+1][prof.tind] <= self.maxTdgz and \
@@ -181,8 +255,9 @@ class SkewT:
                         x2 = self.temp2Pix(prof.gSndg[i+1][prof.tind],
                             prof.gSndg[i+1][prof.pind])
                         y2 = self.pres2Pix(prof.gSndg[i+1][prof.pind])
-                        self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-                            width=width)
+                        segs.append((x1, y1, x2, y2))
+        draw_lines(self.gCanvas, segs, self.polylines, fill=color,
+            width=width)
 
 
     def drawTrace(self, prof, ind, color, **kwargs):
@@ -204,98 +279,122 @@ class SkewT:
             self.gCanvas.create_text(x1, y1+yoff, fill=color, text=txt,
                 font=font)
 
-        for i in range(prof.gNumLevels):
-            if QC(prof.gSndg[i][ind]):
-                x1 = x2
-                y1 = y2
-                if prof.gSndg[i][0] > self.pmin:
-                    x2 = self.temp2Pix(prof.gSndg[i][ind],
-                        prof.gSndg[i][prof.pind])
-                    y2 = self.pres2Pix(prof.gSndg[i][prof.pind])
-                    if x1 <= 0: continue
-                    self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-                        width=width)
-                else:
-                    v = tab.interp.interp_from_pres(self.pmin, prof, ind)
-                    x2 = self.temp2Pix(v, self.pmin)
-                    y2 = self.pres2Pix(self.pmin)
-                    self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-                        width=width)
-                    break
+        # Levels below the top of the chart, then the top of the chart
+        levels = prof.validLevels(ind)
+        k = 0
+        while k < len(levels) and prof.gSndg[levels[k]][0] > self.pmin: k += 1
+        pts = self.trace2Pix([prof.gSndg[i][ind] for i in levels[:k]],
+            [prof.gSndg[i][prof.pind] for i in levels[:k]])
+        segs = []
+        for x1, y1 in pts:
+            if x2 > 0: segs.append((x2, y2, x1, y1))
+            x2 = x1; y2 = y1
+        if k < len(levels):
+            v = tab.interp.interp_from_pres(self.pmin, prof, ind)
+            segs.append((x2, y2, self.temp2Pix(v, self.pmin),
+                self.pres2Pix(self.pmin)))
+        draw_lines(self.gCanvas, segs, self.polylines, fill=color,
+            width=width)
 
 
     def drawParcelTrace(self, pcl, width=2, dash=(1,1), color=None):
-        ''' Draw the trace of supplied parcel '''
-        if not color: self.tpcolor
-        p = pcl.pres
-        t = pcl.temp
-        td = pcl.dwpt
-        x1 = self.temp2Pix(t, p)
-        y1 = self.pres2Pix(p)
-        p2, t2 = tab.thermo.drylift(p, t, td)
-        x2 = self.temp2Pix(t2, p2)
-        y2 = self.pres2Pix(p2)
-        self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-            width=width, dash=dash)
-
-        for i in range(int(p2 + self.dp), int(self.pmin-1), int(self.dp)):
-            x1 = x2
-            y1 = y2
-            t3 = tab.thermo.wetlift(p2, t2, float(i))
-            x2 = self.temp2Pix(t3, float(i))
-            y2 = self.pres2Pix(float(i))
-            if x2 < self.tlx: break
-            self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-                width=width, dash=dash)
+        '''
+        Draw the trace of supplied parcel. A parcel lifted with
+        params.parcelx(..., trace=True) is drawn from its stored trace;
+        otherwise the parcel is lifted every self.dp hPa.
+        '''
+        if not color: color = self.tpcolor
+        draw_lines(self.gCanvas, self.__parcelSegments(pcl, 'ttrace'),
+            self.polylines, fill=color, width=width, dash=dash)
 
 
     def drawVirtualParcelTrace(self, pcl, width=2, dash=(1,1), color=None):
-        ''' Draw the trace of supplied parcel '''
+        ''' Draw the virtual temperature trace of supplied parcel '''
         if not color: color = self.tvpcolor
+        draw_lines(self.gCanvas, self.__parcelSegments(pcl, 'tvtrace'),
+            self.polylines, fill=color, width=width, dash=dash)
+
+
+    def __parcelSegments(self, pcl, field):
+        '''
+        Line segments of a parcel trace (field is 'ttrace' or 'tvtrace'),
+        thinned to about one point every self.dp hPa above the LCL and
+        ending at the top of the chart or where the trace leaves the chart
+        '''
+        pres = getattr(pcl, 'ptrace', None)
+        temps = getattr(pcl, field, None)
+        if pres is None or temps is None:
+            pres, temps = self.__liftParcel(pcl, field == 'tvtrace')
+        step = abs(self.dp)
+        ps = list(pres[:1])
+        ts = list(temps[:1])
+        for i in range(1, len(pres)):
+            p = pres[i]
+            if p < self.pmin:
+                # Interpolate (in log pressure) to the top of the chart
+                frac = math.log(pres[i-1] / self.pmin) / \
+                    math.log(pres[i-1] / p)
+                ps.append(self.pmin)
+                ts.append(temps[i-1] + (temps[i] - temps[i-1]) * frac)
+                break
+            if i == 1 or ps[-1] - p >= step or i == len(pres) - 1:
+                ps.append(p)
+                ts.append(temps[i])
+        pts = self.trace2Pix(ts, ps)
+        segs = []
+        for i in range(1, len(pts)):
+            x1, y1 = pts[i-1]
+            x2, y2 = pts[i]
+            if i > 1 and x2 < self.tlx: break
+            segs.append((x1, y1, x2, y2))
+        return segs
+
+
+    def __liftParcel(self, pcl, virtual):
+        ''' Lift a parcel to the top of the chart every self.dp hPa '''
         p = pcl.pres
         t = pcl.temp
         td = pcl.dwpt
-        x1 = self.temp2Pix(tab.thermo.virtemp(p, t, td), p)
-        y1 = self.pres2Pix(p)
         p2, t2 = tab.thermo.drylift(p, t, td)
-        x2 = self.temp2Pix(tab.thermo.virtemp(p2, t2, t2), p2)
-        y2 = self.pres2Pix(p2)
-        self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-            width=width, dash=dash)
-
+        pres = [p, p2]
+        temps = [t, t2]
         for i in range(int(p2 + self.dp), int(self.pmin-1), int(self.dp)):
-            x1 = x2
-            y1 = y2
-            t3 = tab.thermo.wetlift(p2, t2, float(i))
-            x2 = self.temp2Pix(tab.thermo.virtemp(i, t3, t3), float(i))
-            y2 = self.pres2Pix(float(i))
-            if x2 < self.tlx: break
-            self.gCanvas.create_line(x1, y1, x2, y2, fill=color,
-                width=width, dash=dash)
+            pres.append(float(i))
+            temps.append(tab.thermo.wetlift(p2, t2, float(i)))
+        if virtual:
+            temps = [tab.thermo.virtemp(p, t, td)] + \
+                [tab.thermo.virtemp(pp, tt, tt)
+                for pp, tt in zip(pres[1:], temps[1:])]
+        return pres, temps
 
 
     def drawDryAdiabat(self, thta):
         ''' Draw dry adiabats on background SkewT '''
-        for p in self.presrange:
-            t = ((thta + ZEROCNK) / ((1000. / p)**ROCP)) - ZEROCNK
-            x = self.temp2Pix(t, p)
-            y = self.pres2Pix(p)
-            if p == self.pmax:
-                x2 = x
-                y2 = y
-            else:
-                x1 = x2
-                y1 = y2
-                x2 = x
-                y2 = y
-                self.gCanvas.create_line(x1, y1, x2, y2,
-                    fill=self.adiabatcolor, width=1)
+        pts = self.dryAdiabat(thta)
+        segs = [pts[i-1] + pts[i] for i in range(1, len(pts))]
+        draw_lines(self.gCanvas, segs, self.polylines, fill=self.adiabatcolor,
+            width=1)
+
+
+    def dryAdiabat(self, thta):
+        ''' Pixel coordinates of a dry adiabat, at each of presrange '''
+        geom = self.__geometry()
+        pts = geom.get(('dry', thta))
+        if pts is None:
+            pts = self.trace2Pix([((thta + ZEROCNK) / ((1000. / p)**ROCP)) -
+                ZEROCNK for p in self.presrange], self.presrange)
+            geom[('dry', thta)] = pts
+        return pts
 
 
     def drawIsotherm(self, t):
         ''' Draw isotherms on background SkewT '''
-        x1 = self.temp2Pix(t, self.pmax-5)
-        x2 = self.temp2Pix(t, self.pmin)
+        geom = self.__geometry()
+        xs = geom.get(('isotherm', t))
+        if xs is None:
+            xs = (self.temp2Pix(t, self.pmax-5), self.temp2Pix(t, self.pmin))
+            geom[('isotherm', t)] = xs
+        x1, x2 = xs
         if t >= self.bltemp and t <= self.brtemp:
             self.gCanvas.create_text(x1-2, self.bry+2, fill=self.ithermbold,
                 text=t, anchor="n", font=self.font1)
@@ -308,25 +407,29 @@ class SkewT:
 
     def drawMoistAdiabat(self, tw, width=1):
         ''' Draw moist adiabats on background SkewT '''
-        for p in self.presrange:
-            t = tab.thermo.wetlift(1000., tw, p)
-            x = self.temp2Pix(t, p)
-            y = self.pres2Pix(p)
-            if p == self.pmax:
-                x2 = x
-                y2 = y
-            else:
-                x1 = x2
-                y1 = y2
-                x2 = x
-                y2 = y
-                self.gCanvas.create_line(x1, y1, x2, y2,
-                    fill=self.madiabatcolor, width=width)
+        pts = self.moistAdiabat(tw)
+        segs = [pts[i-1] + pts[i] for i in range(1, len(pts))]
+        draw_lines(self.gCanvas, segs, self.polylines,
+            fill=self.madiabatcolor, width=width)
+
+
+    def moistAdiabat(self, tw):
+        ''' Pixel coordinates of a moist adiabat, at each of presrange '''
+        geom = self.__geometry()
+        pts = geom.get(('moist', tw))
+        if pts is None:
+            pts = self.trace2Pix([tab.thermo.wetlift(1000., tw, p)
+                for p in self.presrange], self.presrange)
+            geom[('moist', tw)] = pts
+        return pts
 
 
     def drawIsobar(self, p, pipflag, width=1):
         ''' Draw isobars on background SkewT '''
-        y1 = self.pres2Pix(p)
+        geom = self.__geometry()
+        y1 = geom.get(('isobar', p))
+        if y1 is None:
+            y1 = geom[('isobar', p)] = self.pres2Pix(p)
         if pipflag == 0:
             self.gCanvas.create_line(self.tlx, y1, self.brx, y1,
                 fill=self.icolor, width=width)
@@ -341,12 +444,15 @@ class SkewT:
 
     def drawMixRatioLine(self, w, font, width=1):
         ''' Function to draw mixing ratio lines '''
-        t = tab.thermo.temp_at_mixrat(w, self.wbot)
-        x1 = self.temp2Pix(t, self.wbot)
-        y1 = self.pres2Pix(self.wbot)
-        t = tab.thermo.temp_at_mixrat(w, self.wtop)
-        x2 = self.temp2Pix(t, self.wtop)
-        y2 = self.pres2Pix(self.wtop)
+        geom = self.__geometry()
+        pts = geom.get(('mixrat', w))
+        if pts is None:
+            t1 = tab.thermo.temp_at_mixrat(w, self.wbot)
+            t2 = tab.thermo.temp_at_mixrat(w, self.wtop)
+            pts = (self.temp2Pix(t1, self.wbot), self.pres2Pix(self.wbot),
+                self.temp2Pix(t2, self.wtop), self.pres2Pix(self.wtop))
+            geom[('mixrat', w)] = pts
+        x1, y1, x2, y2 = pts
         self.gCanvas.create_line(x1, y1, x2, y2, fill=self.mixratcolor,
             width=width)
 
@@ -360,30 +466,94 @@ class SkewT:
 
     def createWetBulb(self, prof):
         ''' Create the Wetbulb Temperature Array '''
-        for i in range(prof.gNumLevels):
-            prof.gSndg[i].append(tab.thermo.wetbulb(prof.gSndg[i][prof.pind],
-                prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind]))
+        prof.addColumn([tab.thermo.wetbulb(prof.gSndg[i][prof.pind],
+            prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind])
+            for i in range(prof.gNumLevels)])
         return prof
 
 
+    def __geometry(self):
+        ''' Background line coordinates for the current chart geometry '''
+        key = (self.tlx, self.tly, self.brx, self.bry, self.pmin, self.pmax,
+            self.bltemp, self.brtemp, self.rot, tuple(self.presrange),
+            self.wbot, self.wtop, tab.thermo.SATLIFT_TOL,
+            tab.thermo.SATLIFT_MAXITER)
+        geom = _GEOMETRY.get(key)
+        if geom is None:
+            if len(_GEOMETRY) >= _MAXGEOMETRY: _GEOMETRY.clear()
+            geom = _GEOMETRY.setdefault(key, {})
+        return geom
+
+
     def temp2Pix(self, t, p):
-        ''' Function to convert a temperature level to a pixel '''
+        '''
+        Function to convert a temperature level to a pixel; t and p may be
+        NumPy arrays
+        '''
         scl1 = self.brtemp - (((self.bry - self.pres2Pix(p)) /
-                        (self.bry - self.tly)) * self.vspread)
-        scl2 = self.brx - (((scl1 - t) / self.hspread) * (self.brx - self.tlx))
+                        self.pixhgt) * self.vspread)
+        scl2 = self.brx - (((scl1 - _values(t)) / self.hspread) *
+                        self.pixwid)
         return scl2
 
 
+    def trace2Pix(self, temps, pres):
+        '''
+        Converts sequences of temperatures and pressures to pixels at once
+        (as NumPy arrays, if available)
+
+        Inputs
+        ------
+            temps       (list)              Temperatures (C)
+            pres        (list)              Pressures (hPa)
+
+        Returns
+        -------
+            List of (x, y) pixel tuples
+        '''
+        if np is not None:
+            temps = np.asarray(temps, np.float64)
+            pres = np.asarray(pres, np.float64)
+            return zip(self.temp2Pix(temps, pres).tolist(),
+                self.pres2Pix(pres).tolist())
+        return [(self.temp2Pix(t, p), self.pres2Pix(p))
+            for t, p in zip(temps, pres)]
+
+
     def pres2Pix(self, p):
-        ''' Function to convert a pressure level to a pixel level '''
-        scl1 = math.log(self.pmax) - math.log(self.pmin)
-        scl2 = math.log(self.pmax) - math.log(p)
-        return (self.bry - (scl2/scl1) * (self.bry - self.tly))
+        '''
+        Function to convert a pressure level to a pixel level; p may be a
+        NumPy array
+        '''
+        scl2 = self.lpmax - _log(p)
+        return (self.bry - (scl2/self.lprange) * self.pixhgt)
 
 
     def pix2Pres(self, y):
-        ''' Function to convert a pixel to a pressure level'''
-        scl1 = math.log(self.pmax) - math.log(self.pmin)
-        scl2 = self.bry - float(y)
-        scl3 = self.bry - self.tly + 1
-        return (self.pmax / math.exp((scl2/scl3) * scl1));
+        '''
+        Function to convert a pixel to a pressure level; y may be a NumPy
+        array
+        '''
+        scl2 = self.bry - _values(y)
+        scl3 = self.pixhgt + 1
+        return (self.pmax / _exp((scl2/float(scl3)) * self.lprange))
+
+
+def _values(x):
+    ''' Sequences as NumPy arrays (if available); numbers as floats '''
+    if isinstance(x, (float, int, long)): return float(x)
+    if isinstance(x, (list, tuple)):
+        if np is None: raise TypeError('sequences require NumPy')
+        return np.asarray(x, np.float64)
+    if np is not None and isinstance(x, np.ndarray): return x
+    return float(x)
+
+
+def _log(x):
+    if isinstance(x, (float, int, long)): return math.log(x)
+    return np.log(_values(x))
+
+
+def _exp(x):
+    if isinstance(x, float): return math.exp(x)
+    return np.exp(x)
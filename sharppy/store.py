@@ -0,0 +1,274 @@
+''' SQLite Store of Computed Parameters '''
+import datetime
+import threading
+import sqlite3
+from sharppy.sharptab import sheet
+from sharppy.sharptab.constants import *
+
+
+__all__ = ['ParameterStore', 'valid_time', 'INDEXED']
+
+
+# Parameters with an index of their own, for range queries
+INDEXED = ['mucape', 'mlcape', 'sbcape', 'mlcinh', 'mllcl', 'shr6km',
+    'srh1km', 'esrh', 'scp', 'pwat']
+
+# Columns describing each sounding, ahead of the parameters
+META = [('station', 'TEXT'), ('valid', 'TEXT'), ('date', 'TEXT'),
+    ('file', 'TEXT')]
+
+OPERATORS = ('<', '<=', '>', '>=', '=', '!=')
+
+# Format of valid times in the store (sortable as text)
+TIMEFMT = '%Y-%m-%d %H:%M:%S'
+
+
+def valid_time(date):
+    '''
+    Converts an SPC-format date (YYMMDD/HHMM) to a datetime; years before
+    70 are taken to be in the 2000s
+
+    Inputs
+    ------
+        date        (string)                SPC-format date
+
+    Returns
+    -------
+        datetime, or None if the date cannot be read
+    '''
+    try:
+        day, hhmm = date.strip().split('/')
+        year = int(day[0:2])
+        year += 2000 if year < 70 else 1900
+        return datetime.datetime(year, int(day[2:4]), int(day[4:6]),
+            int(hhmm[0:2]), int(hhmm[2:4]))
+    except (ValueError, IndexError):
+        return None
+
+
+def _time(value):
+    if value is None or isinstance(value, basestring): return value
+    return value.strftime(TIMEFMT)
+
+
+class ParameterStore(object):
+    '''
+    Computed parameters of many soundings in an SQLite database, with one
+    row per sounding (station and valid time) and one column per scalar
+    sheet field. Missing values are stored as NULL.
+
+    Rows are buffered and inserted in bulk, batchsize rows per transaction;
+    a sounding written again replaces its earlier row. Soundings without a
+    station or a valid time cannot be told apart, so they are not stored
+    (they are counted in skipped). The store can be used as the sink of an
+    ingest.Ingester.
+
+    path : string
+        Database file (created if needed)
+    fields : list
+        Scalar sheet fields to store [default: sheet.SCALARS]; columns are
+        added to an existing database as needed
+    batchsize : int
+        Rows buffered before they are inserted
+
+    Usage
+    -----
+        store = ParameterStore('params.db')
+        store.add(prof)
+        store.flush()
+        rows = store.select([('mucape', '>', 2000.), ('shr6km', '>', 40.)],
+            start=datetime.datetime(2011, 5, 1))
+    '''
+    def __init__(self, path, fields=None, batchsize=500):
+        self.path = path
+        self.fields = list(fields or sheet.SCALARS)
+        self.batchsize = batchsize
+        self.columns = [name for name, type in META] + self.fields
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.__lock = threading.Lock()
+        self.__rows = []
+        self.skipped = 0
+        self.__create()
+        self.__insert = 'INSERT OR REPLACE INTO soundings (%s) VALUES (%s)' \
+            % (', '.join(self.columns), ', '.join(['?'] * len(self.columns)))
+
+
+    def __create(self):
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS soundings ('
+                'id INTEGER PRIMARY KEY, %s)' % ', '.join(['%s %s' % meta
+                for meta in META]))
+            have = set([row[1] for row in
+                self.db.execute('PRAGMA table_info(soundings)')])
+            for name in self.fields:
+                if name not in have:
+                    self.db.execute('ALTER TABLE soundings ADD COLUMN %s REAL'
+                        % name)
+            self.db.execute('CREATE UNIQUE INDEX IF NOT EXISTS '
+                'soundings_station_valid ON soundings (station, valid)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS soundings_valid ON '
+                'soundings (valid)')
+            for name in INDEXED:
+                if name not in self.fields: continue
+                self.db.execute('CREATE INDEX IF NOT EXISTS soundings_%s ON '
+                    'soundings (%s)' % (name, name))
+
+
+    def write(self, record):
+        '''
+        Add a sounding to the store
+
+        Inputs
+        ------
+            record      (dict)              Field name to value, and the
+                                            'station' and either 'valid'
+                                            (datetime) or 'date' (SPC-format
+                                            date); optionally 'file'
+
+        Returns
+        -------
+            False if the sounding has no station or valid time and was
+            skipped
+        '''
+        valid = record.get('valid')
+        if valid is None: valid = valid_time(record.get('date') or '')
+        if valid is None or not record.get('station'):
+            with self.__lock: self.skipped += 1
+            return False
+        row = [record.get('station'), _time(valid), record.get('date'),
+            record.get('file')]
+        for name in self.fields:
+            value = record.get(name, RMISSD)
+            row.append(value if QC(value) else None)
+        with self.__lock:
+            self.__rows.append(row)
+            full = len(self.__rows) >= self.batchsize
+        if full: self.flush()
+        return True
+
+
+    def add(self, prof, results=None, **kwargs):
+        '''
+        Add a profile to the store, computing its parameter sheet unless
+        it is given
+
+        Inputs
+        ------
+            prof        (profile object)    Profile Object
+            results     (dict; optional)    Output of sheet.compute()
+
+        Other keywords (e.g. file) are stored with the sounding
+        '''
+        if results is None: results = sheet.compute(prof, self.fields)
+        record = dict(results)
+        record.update({'station': prof.gStation.strip(),
+            'date': prof.gDate.strip()})
+        record.update(kwargs)
+        return self.write(record)
+
+
+    def flush(self):
+        ''' Insert the buffered rows in one transaction '''
+        with self.__lock:
+            rows = self.__rows
+            self.__rows = []
+            if not rows: return
+            with self.db:
+                self.db.executemany(self.__insert, rows)
+
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+    def select(self, conditions=(), start=None, end=None, stations=None,
+        columns=None, order='valid', limit=None):
+        '''
+        Returns the soundings matching all of the given conditions
+
+        Inputs
+        ------
+            conditions  (list; optional)    (field, operator, value) tuples,
+                                            e.g. ('mucape', '>', 2000.);
+                                            operators are <, <=, >, >=, =
+                                            and !=
+            start       (datetime; optional) Earliest valid time
+            end         (datetime; optional) Latest valid time
+            stations    (list; optional)    Station identifiers
+            columns     (list; optional)    Columns to return [default: all]
+            order       (string; optional)  Column to sort by (prefix with
+                                            '-' for descending order)
+            limit       (int; optional)     Largest number of soundings
+
+        Returns
+        -------
+            List of dictionaries of column name to value
+        '''
+        if columns is None: columns = self.columns
+        for name in columns: self.__column(name)
+        where, args = self.__where(conditions, start, end, stations)
+        sql = 'SELECT %s FROM soundings%s' % (', '.join(columns), where)
+        if order:
+            desc = order.startswith('-')
+            sql += ' ORDER BY %s%s' % (self.__column(order.lstrip('-')),
+                ' DESC' if desc else '')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        self.flush()
+        with self.__lock:
+            rows = self.db.execute(sql, args).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+
+    def count(self, conditions=(), start=None, end=None, stations=None):
+        ''' Returns the number of soundings matching (see select) '''
+        where, args = self.__where(conditions, start, end, stations)
+        self.flush()
+        with self.__lock:
+            return self.db.execute('SELECT COUNT(*) FROM soundings' + where,
+                args).fetchone()[0]
+
+
+    def stations(self):
+        ''' Returns the station identifiers in the store '''
+        self.flush()
+        with self.__lock:
+            return [row[0] for row in self.db.execute(
+                'SELECT DISTINCT station FROM soundings ORDER BY station')]
+
+
+    def __len__(self):
+        return self.count()
+
+
+    def __column(self, name):
+        if name not in self.columns:
+            raise ValueError('unknown column %r' % (name,))
+        return name
+
+
+    def __where(self, conditions, start, end, stations):
+        clauses = []
+        args = []
+        for name, op, value in conditions:
+            if op == '==': op = '='
+            if op not in OPERATORS:
+                raise ValueError('unknown operator %r' % (op,))
+            clauses.append('%s %s ?' % (self.__column(name), op))
+            args.append(value)
+        if start is not None:
+            clauses.append('valid >= ?')
+            args.append(_time(start))
+        if end is not None:
+            clauses.append('valid <= ?')
+            args.append(_time(end))
+        if stations:
+            clauses.append('station IN (%s)' % ', '.join(['?'] *
+                len(stations)))
+            args.extend(stations)
+        if not clauses: return '', args
+        return ' WHERE ' + ' AND '.join(clauses), args
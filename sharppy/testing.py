@@ -0,0 +1,469 @@
+''' Utilities for Exercising SHARPpy Offline '''
+import os
+import glob
+import math
+import time
+import random
+import hashlib
+import threading
+import email.utils
+import BaseHTTPServer
+import SocketServer
+from sharppy.sharptab import profile, thermo, vector, params
+from sharppy.sharptab.constants import *
+
+
+__all__ = ['SAMPLE_SPC', 'spc_text', 'synthetic', 'corpus', 'parcel_fields',
+           'PARCEL_TOLERANCES', 'compare', 'AccuracyReport', 'SoundingServer']
+
+
+SAMPLE_SPC = '''%TITLE%
+ OUN   110524/0000
+
+   LEVEL       HGHT       TEMP       DWPT       WDIR       WSPD
+-------------------------------------------------------------------
+%RAW%
+  964.00,    357.00,     31.40,     20.40,    165.00,     27.00
+  950.00,    480.00,     29.60,     20.00,    170.00,     38.00
+  925.00,    707.00,     27.00,     19.60,    175.00,     47.00
+  900.00,    940.00,     24.40,     19.20,    185.00,     48.00
+  850.00,   1423.00,     20.60,     16.60,    200.00,     42.00
+  800.00,   1929.00,     17.40,     11.40,    210.00,     37.00
+  750.00,   2462.00,     13.60,      6.60,    220.00,     38.00
+  700.00,   3025.00,      9.20,      1.20,    230.00,     41.00
+  650.00,   3621.00,      4.60,     -3.40,    235.00,     45.00
+  600.00,   4255.00,     -0.30,     -9.30,    240.00,     50.00
+  550.00,   4931.00,     -5.30,    -16.30,    240.00,     54.00
+  500.00,   5660.00,    -10.70,    -24.70,    245.00,     58.00
+  450.00,   6447.00,    -16.90,    -32.90,    245.00,     63.00
+  400.00,   7307.00,    -23.70,    -39.70,    250.00,     69.00
+  350.00,   8255.00,    -31.50,    -44.50,    250.00,     76.00
+  300.00,   9320.00,    -40.50,    -49.50,    250.00,     84.00
+  250.00,  10540.00,    -50.30,    -57.30,    250.00,     95.00
+  200.00,  11970.00,    -56.90,    -66.90,    250.00,     90.00
+  150.00,  13760.00,    -60.10,    -74.10,    255.00,     65.00
+  100.00,  16290.00,    -64.50,    -82.50,    260.00,     35.00
+%END%
+'''
+
+
+def spc_text(prof):
+    '''
+    Format a profile object as SPC-format sounding text
+
+    Inputs
+    ------
+        prof        (profile object)        Profile Object
+
+    Returns
+    -------
+        Sounding text (string)
+    '''
+    lines = ['%TITLE%', ' %-6s%s' % (prof.gStation.strip(), prof.gDate), '',
+        '   LEVEL       HGHT       TEMP       DWPT       WDIR       WSPD',
+        '-' * 67, '%RAW%']
+    for i in range(prof.gNumLevels):
+        wdir, wspd = vector.comp2vec(prof.gSndg[i][prof.uind],
+            prof.gSndg[i][prof.vind])
+        vals = (prof.gSndg[i][prof.pind], prof.gSndg[i][prof.zind],
+            prof.gSndg[i][prof.tind], prof.gSndg[i][prof.tdind], wdir, wspd)
+        lines.append(', '.join(['%9.2f' % val for val in vals]))
+    lines.append('%END%')
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic(levels=60, moist=True, capped=False, missing=0., seed=0,
+    **kwargs):
+    '''
+    Create a deterministic synthetic sounding. The same arguments always
+    produce the same profile, so that synthetic soundings can be used to
+    compare timings and results between versions of the code.
+
+    The temperature profile follows a 6.5 C/km lapse rate to an isothermal
+    tropopause at 12 km. Moist soundings have a humid boundary layer; dry
+    ones a deep dewpoint depression. Capped soundings have a 4 C warm
+    nose above the boundary layer. Winds veer and strengthen with height.
+
+    Inputs
+    ------
+        levels      (int; optional)         Number of levels
+        moist       (bool; optional)        Humid boundary layer
+        capped      (bool; optional)        Elevated warm layer (cap)
+        missing     (float; optional)       Fraction of levels above the
+                                            surface with a missing variable
+        seed        (int; optional)         Seed for noise and missing data
+
+    Other keywords: sfcp (surface pressure, hPa), sfct (surface temperature,
+    C), stn and date.
+
+    Returns
+    -------
+        Profile object
+    '''
+    rand = random.Random(seed)
+    sfcp = kwargs.get('sfcp', 1000.)
+    sfct = kwargs.get('sfct', 30.)
+    if moist: sfctd = kwargs.get('sfctd', 22.)
+    else: sfctd = kwargs.get('sfctd', 5.)
+    ptop = 100.
+    pres = []; hght = []; temp = []; dwpt = []; wdir = []; wspd = []
+    z = 350.
+    for i in range(levels):
+        p = sfcp * (ptop / sfcp)**(i / (levels - 1.))
+        agl = z - 350.
+        tmp = sfct - 0.0065 * min(agl, 11650.)
+        if i > 0:
+            # Hypsometric thickness of the layer below (using the
+            # temperature at its base)
+            z += RD * thermo.ctok(tmp) / G * math.log(pres[-1] / p)
+            agl = z - 350.
+            tmp = sfct - 0.0065 * min(agl, 11650.)
+        if capped and 1000. < agl < 2500.:
+            tmp += 4. * math.sin(math.pi * (agl - 1000.) / 1500.)
+        if i > 0: tmp += rand.uniform(-0.2, 0.2)
+        if moist and agl < 1500.: dd = (sfct - sfctd) + 0.002 * agl
+        elif moist: dd = 11. + 0.004 * (agl - 1500.)
+        else: dd = (sfct - sfctd) + 0.005 * agl
+        td = tmp - min(dd, 40.) - rand.uniform(0., 0.5)
+        pres.append(p); hght.append(z); temp.append(tmp); dwpt.append(td)
+        wdir.append((160. + 110. * min(agl, 10000.) / 10000.) % 360.)
+        wspd.append(10. + 60. * min(agl, 12000.) / 12000. +
+            rand.uniform(-2., 2.))
+
+    for i in range(1, levels - 1):
+        if rand.random() >= missing: continue
+        var = rand.choice((temp, dwpt, wdir))
+        var[i] = RMISSD
+        if var is wdir: wspd[i] = RMISSD
+
+    return profile.Profile(pres=pres, hght=hght, temp=temp, dwpt=dwpt,
+        wdir=wdir, wspd=wspd, stn=kwargs.get('stn', 'SYN'),
+        date=kwargs.get('date', '000000/0000'), model='SYNTHETIC')
+
+
+def corpus(count=48, archive=None, seed=0):
+    '''
+    A collection of soundings for comparing implementations: synthetic
+    soundings of every kind (see synthetic) over a range of sizes and
+    surface conditions, the sample sounding, and optionally every
+    SPC-format sounding in an archive directory.
+
+    Inputs
+    ------
+        count       (int; optional)         Number of synthetic soundings
+        archive     (string; optional)      Directory of SPC-format files
+        seed        (int; optional)         Seed for the synthetic soundings
+
+    Returns
+    -------
+        List of (name, profile object) pairs
+    '''
+    rand = random.Random(seed)
+    profs = [('sample', profile.Profile(text=SAMPLE_SPC))]
+    for i in range(count):
+        levels = rand.choice((20, 40, 60, 100, 200, 500))
+        kwargs = {'moist': rand.random() < 0.75,
+            'capped': rand.random() < 0.4,
+            'missing': rand.choice((0., 0., 0.05, 0.2)),
+            'sfcp': rand.uniform(850., 1020.),
+            'sfct': rand.uniform(5., 38.),
+            'seed': seed * 100003 + i}
+        if kwargs['moist']:
+            kwargs['sfctd'] = kwargs['sfct'] - rand.uniform(1., 12.)
+        prof = synthetic(levels, **kwargs)
+        profs.append(('synthetic-%d-%d' % (i, levels), prof))
+    if archive:
+        for fname in sorted(glob.glob(os.path.join(archive, '*'))):
+            if os.path.isdir(fname): continue
+            f = open(fname)
+            try:
+                text = f.read().decode('utf-8', 'replace')
+            finally:
+                f.close()
+            profs.append((os.path.basename(fname), profile.Profile(text=text)))
+    return profs
+
+
+# Declared tolerances (absolute differences) of the parcel fields when
+# comparing a faster implementation to the reference one; fields not listed
+# use PARCEL_TOLERANCES[None]
+PARCEL_TOLERANCES = {
+    None: 0.01,
+    'bplus': 5., 'bminus': 2., 'bfzl': 5., 'b3km': 2., 'b6km': 5.,
+    'lclpres': 0.5, 'lfcpres': 2., 'elpres': 2., 'mplpres': 2.,
+    'lclhght': 10., 'lfchght': 20., 'elhght': 20., 'mplhght': 20.,
+    'li5': 0.1, 'li3': 0.1, 'limax': 0.1, 'limaxpres': 5.,
+    'cap': 0.1, 'cappres': 5., 'brn': 0.5, 'brnshear': 0.5,
+    'p0c': 2., 'pm10c': 2., 'pm20c': 2., 'pm30c': 2.,
+    'hght0c': 20., 'hghtm10c': 20., 'hghtm20c': 20., 'hghtm30c': 20.,
+    'wm10c': 0.1, 'wm20c': 0.1, 'wm30c': 0.1,
+}
+
+
+def parcel_fields(flag, **kwargs):
+    '''
+    Returns a function lifting a parcel (see params.DefineParcel) in a
+    profile with params.parcelx, for use with compare()
+
+    Inputs
+    ------
+        flag        (int)                   Parcel selection
+        kwargs                              Passed to DefineParcel
+
+    Returns
+    -------
+        Function taking a profile and returning a dictionary of the fields
+        of the lifted parcel
+    '''
+    def lift(prof):
+        lplvals = params.DefineParcel(prof, flag, **kwargs)
+        return params.parcelx(-1, -1, lplvals.pres, lplvals.temp,
+            lplvals.dwpt, prof, lplvals=lplvals).as_dict()
+    return lift
+
+
+class AccuracyReport(object):
+    '''
+    Differences between a reference and a candidate implementation,
+    accumulated per field by compare().
+    '''
+    def __init__(self, tolerances=None):
+        self.tolerances = tolerances or PARCEL_TOLERANCES
+        self.count = {}
+        self.compared = {}              # Pairs with both values valid
+        self.maxdiff = {}
+        self.sumdiff = {}
+        self.worst = {}
+        self.missing = {}
+        self.errors = []
+
+
+    def tolerance(self, field):
+        return self.tolerances.get(field, self.tolerances.get(None, 0.))
+
+
+    def add(self, name, reference, candidate):
+        ''' Accumulate the differences of two dictionaries of fields '''
+        for field, ref in reference.items():
+            val = candidate.get(field, RMISSD)
+            self.count[field] = self.count.get(field, 0) + 1
+            self.maxdiff.setdefault(field, 0.)
+            self.sumdiff.setdefault(field, 0.)
+            if not QC(ref) or not QC(val) or ref != ref or val != val:
+                # Both must be missing (or NaN)
+                if (QC(ref) and ref == ref) != (QC(val) and val == val):
+                    self.missing[field] = self.missing.get(field, 0) + 1
+                    self.worst.setdefault(field, (None, name))
+                continue
+            diff = abs(val - ref)
+            self.compared[field] = self.compared.get(field, 0) + 1
+            self.sumdiff[field] += diff
+            if diff > self.maxdiff[field] or field not in self.worst:
+                self.maxdiff[field] = diff
+                self.worst[field] = (diff, name)
+
+
+    def meandiff(self, field):
+        ''' Mean difference over the pairs of valid values '''
+        return self.sumdiff[field] / max(self.compared.get(field, 0), 1)
+
+
+    def failures(self):
+        '''
+        Names of the fields exceeding their tolerance, followed by those of
+        the soundings on which the candidate raised an exception
+        '''
+        return sorted([field for field in self.count
+            if self.maxdiff[field] > self.tolerance(field) or
+            self.missing.get(field)]) + \
+            sorted(set([name for name, err in self.errors]))
+
+
+    def ok(self):
+        return not self.failures()
+
+
+    def dump(self):
+        ''' The statistics as a dictionary of plain types (e.g. for JSON) '''
+        fields = {}
+        for field in self.count:
+            fields[field] = {'count': self.count[field],
+                'max': self.maxdiff[field],
+                'compared': self.compared.get(field, 0),
+                'mean': self.meandiff(field),
+                'missing': self.missing.get(field, 0),
+                'tolerance': self.tolerance(field),
+                'worst': self.worst.get(field, (None, None))[1],
+                'ok': field not in self.failures()}
+        return {'fields': fields, 'errors': self.errors, 'ok': self.ok()}
+
+
+    def report(self):
+        ''' Summary table of the differences per field '''
+        failures = self.failures()
+        lines = ['%-12s %12s %12s %10s %8s  %s' % ('field', 'max diff',
+            'mean diff', 'tolerance', 'missing', 'worst case')]
+        for field in sorted(self.count):
+            flag = ''
+            if field in failures: flag = '  FAIL'
+            lines.append('%-12s %12.5g %12.5g %10g %8d  %s%s' % (field,
+                self.maxdiff[field], self.meandiff(field),
+                self.tolerance(field), self.missing.get(field, 0),
+                self.worst.get(field, (None, '-'))[1], flag))
+        for name, err in self.errors:
+            lines.append('%s: %s' % (name, err))
+        return '\n'.join(lines)
+
+
+def compare(reference, candidate, profs=None, tolerances=None):
+    '''
+    Run a reference and a candidate implementation over a corpus of
+    soundings and accumulate the differences between their results. Both
+    are functions taking a profile and returning a dictionary of field
+    values (e.g. from parcel_fields). An exception raised by the candidate
+    but not by the reference is recorded as an error.
+
+    Inputs
+    ------
+        reference   (function)              Reference implementation
+        candidate   (function)              Candidate implementation
+        profs       (list; optional)        (name, profile) pairs
+                                            [default: corpus()]
+        tolerances  (dict; optional)        Tolerance of each field
+                                            [default: PARCEL_TOLERANCES]
+
+    Returns
+    -------
+        AccuracyReport object
+    '''
+    if profs is None: profs = corpus()
+    report = AccuracyReport(tolerances)
+    for name, prof in profs:
+        try:
+            ref = reference(prof)
+        except Exception:
+            continue
+        try:
+            val = candidate(prof)
+        except Exception, e:
+            report.errors.append((name, '%s: %s' % (type(e).__name__, e)))
+            continue
+        report.add(name, ref, val)
+    return report
+
+
+class _SoundingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server.owner
+        if server.delay: time.sleep(server.delay)
+        with server.lock:
+            server.requests += 1
+            failures = server.failures.get(self.path, 0)
+            if failures: server.failures[self.path] = failures - 1
+            entry = server.soundings.get(self.path)
+        if failures:
+            return self.__reply(503, '')
+        if entry is None:
+            return self.__reply(404, '')
+        body, etag, modified, mtime = entry
+        match = self.headers.getheader('if-none-match')
+        since = self.headers.getheader('if-modified-since')
+        if match is not None: unchanged = match == etag
+        else: unchanged = since and \
+            email.utils.mktime_tz(email.utils.parsedate_tz(since)) >= mtime
+        if unchanged:
+            with server.lock: server.notmodified += 1
+            return self.__reply(304, '', etag, modified)
+        return self.__reply(200, body, etag, modified)
+
+    def __reply(self, status, body, etag=None, modified=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        if etag: self.send_header('ETag', etag)
+        if modified: self.send_header('Last-Modified', modified)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            # Trickle the body out so that clients see it arrive in pieces
+            for i in range(0, len(body), 1024):
+                self.wfile.write(body[i:i+1024])
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SoundingServer(object):
+    '''
+    A local stand-in for a sounding web server, for exercising the network
+    code without leaving the machine. Soundings are served with ETag and
+    Last-Modified validators, and conditional requests are honored.
+
+    soundings : dict
+        Mapping of url path (e.g. '/OUN.txt') to sounding text
+    delay : float
+        Artificial latency (s) added to every request
+    failures : dict
+        Mapping of url path to a number of 503 responses to send before
+        the sounding is served
+
+    Usage
+    -----
+        with SoundingServer({'/OUN.txt': SAMPLE_SPC}) as server:
+            prof = Profile(url=server.url('/OUN.txt'))
+    '''
+    def __init__(self, soundings=None, host='127.0.0.1', port=0, delay=0.,
+        failures=None):
+        self.lock = threading.Lock()
+        self.soundings = {}
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.requests = 0
+        self.notmodified = 0
+        for path, text in (soundings or {}).items(): self.put(path, text)
+        self.httpd = _ThreadedServer((host, port), _SoundingHandler)
+        self.httpd.owner = self
+        self.host, self.port = self.httpd.server_address[:2]
+        self.thread = None
+
+
+    def put(self, path, text, mtime=None):
+        ''' Add or replace the sounding served at path '''
+        if mtime is None: mtime = int(time.time())
+        if isinstance(text, unicode): text = text.encode('utf-8')
+        etag = '"%s"' % hashlib.md5(text).hexdigest()
+        modified = email.utils.formatdate(mtime, usegmt=True)
+        with self.lock:
+            self.soundings[path] = (text, etag, modified, mtime)
+
+
+    def url(self, path):
+        return 'http://%s:%d%s' % (self.host, self.port, path)
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread: self.thread.join()
+        self.thread = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()